@@ -6,19 +6,46 @@ Links audio to verses/books in your PostgreSQL Bible database
 """
 
 import os
-import json
+import sys
+import argparse
 import re
-import subprocess
+import time
 from pathlib import Path
 from typing import List, Dict, Optional, Tuple
-import psycopg2
+from concurrent.futures import Future
 import hashlib
-from datetime import datetime
+
+# Share the bible_mp3 package from the MP3 manager
+sys.path.insert(0, str(Path(__file__).parent / 'mp3-manager' / 'src'))
+
+from bible_mp3.books import resolve_book_name, resolve_directory
+from bible_mp3.database import insert_book_span
+from bible_mp3.journal import BatchJournal, stage_reached
+from bible_mp3.manifest import FileStat, IngestManifest
+from bible_mp3.metrics import METRICS
+from bible_mp3.profiling import RunProfiler
+from bible_mp3.pool import ConnectionPool
+from bible_mp3.reference import ReferenceCache
+from bible_mp3.schema import migrate
+from bible_mp3.scanner import scan_tree, top_level_dir
+from bible_mp3.transport import R2Transport, create_transport
+from bible_mp3.transfer import MB, TransferSettings
+from bible_mp3.writer import BatchedResourceWriter, resource_row
 
 # Your paths
 WORD_OF_PROMISE_PATH = r"C:\Users\Yellowkid\Proton Drive\eowokc28\Shared with me\Word of Promise"
 GRACE_TO_YOU_PATH = r"D:\GraceToYouSermons\Downloads"
 
+R2_BUCKET = 'bible-audio-storage'
+
+# Local record of uploaded files, so re-runs skip anything unchanged
+MANIFEST_PATH = Path(__file__).parent / '.bible_audio_manifest.sqlite'
+JOURNAL_PATH = Path(__file__).parent / '.bible_audio_journal.sqlite'
+METRICS_PATH = Path('bible_mp3_metrics.json')
+
+# Resource rows committed per transaction
+RESOURCE_BATCH_SIZE = 50
+
 PG_CONFIG = {
     'host': '192.168.1.177',
     'port': 2665,
@@ -27,37 +54,38 @@ PG_CONFIG = {
     'password': 'mariushostingroot'
 }
 
-# Book number to name mapping for Grace to You structure
-BOOK_MAPPING = {
-    '01': 'Genesis', '02': 'Exodus', '03': 'Leviticus', '04': 'Numbers', '05': 'Deuteronomy',
-    '06': 'Joshua', '07': 'Judges', '08': 'Ruth', '09': '1 Samuel', '10': '2 Samuel',
-    '11': '1 Kings', '12': '2 Kings', '13': '1 Chronicles', '14': '2 Chronicles', '15': 'Ezra',
-    '16': 'Nehemiah', '17': 'Esther', '18': 'Job', '19': 'Psalms', '20': 'Proverbs',
-    '21': 'Ecclesiastes', '22': 'Song of Solomon', '23': 'Isaiah', '24': 'Jeremiah', '25': 'Lamentations',
-    '26': 'Ezekiel', '27': 'Daniel', '28': 'Hosea', '29': 'Joel', '30': 'Amos',
-    '31': 'Obadiah', '32': 'Jonah', '33': 'Micah', '34': 'Nahum', '35': 'Habakkuk',
-    '36': 'Zephaniah', '37': 'Haggai', '38': 'Zechariah', '39': 'Malachi', '40': 'Matthew',
-    '41': 'Mark', '42': 'Luke', '43': 'John', '44': 'Acts', '45': 'Romans',
-    '46': '1 Corinthians', '47': '2 Corinthians', '48': 'Galatians', '49': 'Ephesians', '50': 'Philippians',
-    '51': 'Colossians', '52': '1 Thessalonians', '53': '2 Thessalonians', '54': '1 Timothy', '55': '2 Timothy',
-    '56': 'Titus', '57': 'Philemon', '58': 'Hebrews', '59': 'James', '60': '1 Peter',
-    '61': '2 Peter', '62': '1 John', '63': '2 John', '64': '3 John', '65': 'Jude', '66': 'Revelation'
-}
-
 class BibleAudioBatchUploader:
     """Handles batch upload of your Bible audio collections"""
     
-    def __init__(self):
-        self.pg_conn = None
+    def __init__(self, transport: Optional[R2Transport] = None,
+                 manifest: Optional[IngestManifest] = None,
+                 journal: Optional[BatchJournal] = None,
+                 metrics_path: Path = METRICS_PATH,
+                 profiler: Optional[RunProfiler] = None):
+        # S3 client when R2 credentials are set, otherwise wrangler (see R2_TRANSPORT)
+        self.transport = transport or create_transport(R2_BUCKET)
+        print(f"Using {self.transport.name} transport for R2 uploads")
+        self.manifest = manifest or IngestManifest(MANIFEST_PATH)
+        self.journal = journal or BatchJournal(JOURNAL_PATH)
+        self.metrics_path = Path(metrics_path)
+        self.profiler = profiler
+        self.pool = None
+        self.resource_writer = None
+        self.reference = None
         self.connect_postgres()
-        self.book_ids = {}
         self.load_book_mappings()
     
     def connect_postgres(self) -> bool:
         """Connect to PostgreSQL database"""
         try:
-            self.pg_conn = psycopg2.connect(**PG_CONFIG)
-            self.pg_conn.autocommit = False
+            # Resource batches, linking, reference data and migrations share pooled connections
+            self.pool = ConnectionPool(maxconn=2, **PG_CONFIG)
+            for migration in migrate(self.pool):
+                print(f"Applied schema migration {migration.version}: {migration.name}")
+            self.resource_writer = BatchedResourceWriter(
+                self.pool, batch_size=RESOURCE_BATCH_SIZE, flush_ms=None
+            )
+            self.reference = ReferenceCache(self.pool)
             print("Connected to PostgreSQL")
             return True
         except Exception as e:
@@ -65,42 +93,21 @@ class BibleAudioBatchUploader:
             return False
     
     def load_book_mappings(self):
-        """Load book name to ID mappings from database"""
-        if not self.pg_conn:
+        """Load books and verse ids from the database once, up front"""
+        if not self.reference:
             return
         
         try:
-            with self.pg_conn.cursor() as cur:
-                cur.execute("SELECT id, name, abbreviation FROM books")
-                for book_id, name, abbrev in cur.fetchall():
-                    self.book_ids[name.lower()] = book_id
-                    if abbrev:
-                        self.book_ids[abbrev.lower()] = book_id
-                print(f"Loaded {len(self.book_ids)} book mappings")
+            print(f"Loaded {len(self.reference.books())} book mappings")
         except Exception as e:
             print(f"Error loading book mappings: {e}")
     
     def get_book_id(self, book_name: str) -> Optional[int]:
-        """Get book ID from name, handling variations"""
-        book_name = book_name.lower().strip()
-        
-        # Direct match
-        if book_name in self.book_ids:
-            return self.book_ids[book_name]
-        
-        # Try variations
-        variations = [
-            book_name.replace(' ', ''),  # "1samuel"
-            book_name.replace('1 ', 'first '),  # "first samuel"  
-            book_name.replace('2 ', 'second '),  # "second samuel"
-            book_name.replace('3 ', 'third '),  # "third john"
-        ]
-        
-        for variation in variations:
-            if variation in self.book_ids:
-                return self.book_ids[variation]
-        
-        return None
+        """Get book ID from name, handling abbreviations and ordinal spellings"""
+        if not self.reference:
+            return None
+        # Names, abbreviations, then the shared resolver ("1st Sam", "I Samuel", "1Samuel")
+        return self.reference.book_id(book_name)
     
     def scan_word_of_promise_files(self) -> List[Dict]:
         """Scan Word of Promise directory for audio files"""
@@ -113,38 +120,24 @@ class BibleAudioBatchUploader:
         
         print(f"Scanning Word of Promise: {wop_path}")
         
-        for audio_file in wop_path.rglob("*.mp3"):
-            # Try to extract book name from filename
-            filename = audio_file.stem
-            
-            # Common patterns in Bible audio filenames
-            book_patterns = [
-                r'^(\d*\s*[A-Za-z]+)',  # "1 Samuel" or "Genesis"
-                r'(\d+[A-Za-z]+)',      # "1Samuel" 
-                r'([A-Za-z]+)'          # Just the book name
-            ]
-            
-            book_name = None
-            for pattern in book_patterns:
-                match = re.search(pattern, filename)
-                if match:
-                    potential_book = match.group(1).strip()
-                    book_id = self.get_book_id(potential_book)
-                    if book_id:
-                        book_name = potential_book
-                        break
+        for record in scan_tree(wop_path):
+            # Book named anywhere in the filename ("01 Genesis 001", "1Samuel_03")
+            filename = Path(record['name']).stem
+            book_name = resolve_book_name(filename)
             
             files.append({
-                'path': str(audio_file),
+                'path': record['path'],
                 'filename': filename,
                 'book_name': book_name,
                 'book_id': self.get_book_id(book_name) if book_name else None,
-                'size': audio_file.stat().st_size,
+                'size': record['size'],
+                'mtime_ns': record['mtime_ns'],
                 'type': 'bible_reading',
                 'source': 'Word of Promise',
                 'speaker': 'Multiple'  # Word of Promise uses multiple actors
             })
         
+        files.sort(key=lambda f: f['path'])
         print(f"Found {len(files)} Word of Promise files")
         return files
     
@@ -160,43 +153,55 @@ class BibleAudioBatchUploader:
         print(f"Scanning Grace to You: {gty_path}")
         
         # Each directory is like "01_Genesis", "45_Romans", etc.
-        for book_dir in gty_path.iterdir():
-            if not book_dir.is_dir():
-                continue
-            
-            # Extract book number and name from directory
-            dir_match = re.match(r'^(\d+)_(.+)$', book_dir.name)
-            if not dir_match:
-                print(f"Skipping non-matching directory: {book_dir.name}")
+        book_dirs = {}
+        per_book = {}
+        for record in scan_tree(gty_path):
+            dir_name = top_level_dir(record, gty_path)
+            if dir_name is None:
                 continue
             
-            book_num, book_name = dir_match.groups()
-            book_name = book_name.replace('_', ' ')
+            if dir_name not in book_dirs:
+                book_dirs[dir_name] = None
+                
+                # Extract book number and name from directory
+                book = resolve_directory(dir_name)
+                if not book:
+                    print(f"Skipping non-matching directory: {dir_name}")
+                    continue
+                
+                book_name, book_order = book
+                book_num = f"{book_order:02d}"
+                
+                # Get book ID
+                book_id = self.get_book_id(book_name)
+                if not book_id:
+                    print(f"No book ID found for: {book_name}")
+                    continue
+                
+                book_dirs[dir_name] = (book_num, book_name, book_id)
             
-            # Get book ID
-            book_id = self.get_book_id(book_name)
-            if not book_id:
-                print(f"No book ID found for: {book_name}")
+            if book_dirs[dir_name] is None:
                 continue
             
-            # Scan for audio files in this book directory
-            book_files = []
-            for audio_file in book_dir.rglob("*.mp3"):
-                book_files.append({
-                    'path': str(audio_file),
-                    'filename': audio_file.stem,
-                    'book_name': book_name,
-                    'book_id': book_id,
-                    'size': audio_file.stat().st_size,
-                    'type': 'sermon',
-                    'source': 'Grace to You',
-                    'speaker': 'John MacArthur',
-                    'book_number': book_num
-                })
-            
-            files.extend(book_files)
-            print(f"Found {len(book_files)} files in {book_name}")
+            book_num, book_name, book_id = book_dirs[dir_name]
+            per_book[book_name] = per_book.get(book_name, 0) + 1
+            files.append({
+                'path': record['path'],
+                'filename': Path(record['name']).stem,
+                'book_name': book_name,
+                'book_id': book_id,
+                'size': record['size'],
+                'mtime_ns': record['mtime_ns'],
+                'type': 'sermon',
+                'source': 'Grace to You',
+                'speaker': 'John MacArthur',
+                'book_number': book_num
+            })
         
+        for book_name, count in per_book.items():
+            print(f"Found {count} files in {book_name}")
+        
+        files.sort(key=lambda f: f['path'])
         print(f"Total Grace to You files: {len(files)}")
         return files
     
@@ -212,240 +217,288 @@ class BibleAudioBatchUploader:
             speaker = file_info.get('speaker', 'Unknown').lower().replace(' ', '_')
             return f"sermons/{speaker}/{safe_book}/{safe_filename}.mp3"
     
-    def upload_to_r2(self, file_path: str, r2_key: str, metadata: Dict = None) -> bool:
-        """Upload file to R2 using wrangler CLI"""
-        try:
-            cmd = [
-                'npx', 'wrangler', 'r2', 'object', 'put',
-                f"bible-audio-storage/{r2_key}",
-                '--file', file_path,
-                '--content-type', 'audio/mpeg'
-            ]
-            
-            # Add metadata
-            if metadata:
-                for key, value in metadata.items():
-                    cmd.extend(['--metadata', f"{key}:{str(value)}"])
-            
-            print(f"Uploading: {r2_key}")
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
-            
-            if result.returncode == 0:
-                print(f"✓ Uploaded: {r2_key}")
-                return True
-            else:
-                print(f"✗ Upload failed: {result.stderr}")
-                return False
-                
-        except subprocess.TimeoutExpired:
-            print(f"✗ Upload timeout: {r2_key}")
-            return False
-        except Exception as e:
-            print(f"✗ Upload error: {e}")
-            return False
-    
-    def create_resource_record(self, file_info: Dict, r2_key: str) -> Optional[str]:
-        """Create resource record in PostgreSQL"""
-        if not self.pg_conn:
+    def upload_to_r2(self, file_path: str, r2_key: str, metadata: Dict = None) -> Optional[Dict]:
+        """Upload file to R2 through the configured transport"""
+        print(f"Uploading: {r2_key}")
+        result = self.transport.put(file_path, r2_key, metadata)
+        
+        if result['success']:
+            status = self.transport.status()
+            print(f"✓ Uploaded: {r2_key}" + (f" [{status}]" if status else ""))
+            return result
+        else:
+            print(f"✗ Upload failed: {result['error']}")
             return None
+    
+    def resource_record_row(self, file_info: Dict, r2_key: str, etag: Optional[str] = None) -> Tuple:
+        """Build the resources row for an uploaded file"""
+        # Generate resource ID
+        resource_id = f"AUDIO-{hashlib.md5(r2_key.encode()).hexdigest()[:12].upper()}"
+        
+        # Build metadata
+        metadata = {
+            'r2_key': r2_key,
+            'source': file_info['source'],
+            'audio_type': file_info['type'],
+            'original_path': file_info['path'],
+            'file_size': file_info['size']
+        }
         
-        try:
-            # Generate resource ID
-            resource_id = f"AUDIO-{hashlib.md5(r2_key.encode()).hexdigest()[:12].upper()}"
-            
-            # Build metadata
-            metadata = {
-                'r2_key': r2_key,
-                'source': file_info['source'],
-                'audio_type': file_info['type'],
-                'original_path': file_info['path'],
-                'file_size': file_info['size']
-            }
-            
-            if file_info.get('speaker'):
-                metadata['speaker'] = file_info['speaker']
-            if file_info.get('book_number'):
-                metadata['book_number'] = file_info['book_number']
-            
-            # Streaming URL (update with your actual worker URL)
-            stream_url = f"https://bible-audio-streaming.your-subdomain.workers.dev/audio/{r2_key}"
-            
-            with self.pg_conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO resources (id, type, title, url, provider, 
-                                         file_size, mime_type, meta, created_at)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (id) DO UPDATE SET
-                        title = EXCLUDED.title,
-                        url = EXCLUDED.url,
-                        meta = EXCLUDED.meta
-                    RETURNING id
-                """, (
-                    resource_id, 'audio', 
-                    f"{file_info['book_name']} - {file_info['filename']}",
-                    stream_url, 'Cloudflare R2',
-                    file_info['size'], 'audio/mpeg',
-                    json.dumps(metadata), datetime.now()
-                ))
-                
-                result = cur.fetchone()
-                if result:
-                    self.pg_conn.commit()
-                    return result[0]
-                    
-        except Exception as e:
-            print(f"Database error: {e}")
-            if self.pg_conn:
-                self.pg_conn.rollback()
+        if file_info.get('speaker'):
+            metadata['speaker'] = file_info['speaker']
+        if file_info.get('book_number'):
+            metadata['book_number'] = file_info['book_number']
+        if etag:
+            metadata['etag'] = etag
+        
+        # Streaming URL (update with your actual worker URL)
+        stream_url = f"https://bible-audio-streaming.your-subdomain.workers.dev/audio/{r2_key}"
+        
+        return resource_row(
+            resource_id,
+            f"{file_info['book_name']} - {file_info['filename']}",
+            stream_url,
+            provider='Cloudflare R2',
+            file_size=file_info['size'],
+            mime_type='audio/mpeg',
+            meta=metadata
+        )
+    
+    def create_resource_record(self, file_info: Dict, r2_key: str, etag: Optional[str] = None) -> Optional[Future]:
+        """Queue a resource record for PostgreSQL
         
-        return None
+        Returns a Future for the resource id, resolved when its batch of
+        RESOURCE_BATCH_SIZE rows is committed (or flushed), or None if not connected.
+        """
+        if not self.resource_writer:
+            return None
+        
+        return self.resource_writer.submit(self.resource_record_row(file_info, r2_key, etag))
     
     def link_to_book_verses(self, resource_id: str, book_id: int, 
                            audio_type: str) -> int:
-        """Link audio resource to all verses in a book"""
-        if not self.pg_conn:
+        """Link audio resource to all verses in a book with one span row"""
+        if not self.pool:
             return 0
         
         try:
-            with self.pg_conn.cursor() as cur:
-                # Get all verses for this book
-                cur.execute("""
-                    SELECT id FROM verses WHERE book_id = %s
-                """, (book_id,))
-                
-                verse_ids = [row[0] for row in cur.fetchall()]
-                
-                if not verse_ids:
-                    return 0
-                
-                links_created = 0
-                for verse_id in verse_ids:
-                    link_id = f"VRL-{hashlib.md5(f'{verse_id}-{resource_id}'.encode()).hexdigest()[:12]}"
-                    
-                    relevance = 0.9 if audio_type == 'bible_reading' else 0.7
-                    label = f"{audio_type.replace('_', ' ').title()} audio"
-                    
-                    cur.execute("""
-                        INSERT INTO verse_resource_link 
-                        (id, verse_id, resource_id, label, relevance, meta)
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                        ON CONFLICT DO NOTHING
-                    """, (
-                        link_id, verse_id, resource_id, label, relevance,
-                        json.dumps({'batch_linked': True, 'audio_type': audio_type})
-                    ))
-                    
-                    if cur.rowcount > 0:
-                        links_created += 1
-                
-                self.pg_conn.commit()
-                return links_created
+            book = self.reference.book_by_id(book_id)
+            if not book:
+                return 0
+            
+            with METRICS.timer('link_seconds'), self.pool.cursor() as cur:
+                linked = insert_book_span(
+                    cur, resource_id, book_id=book_id, book_order=book['book_order'],
+                    relevance=0.9 if audio_type == 'bible_reading' else 0.7,
+                    audio_type=audio_type,
+                    meta={'batch_linked': True, 'audio_type': audio_type}
+                )
+            METRICS.count('links' if linked else 'link_errors')
+            return int(linked)
                 
         except Exception as e:
+            METRICS.count('link_errors')
             print(f"Error linking to verses: {e}")
-            if self.pg_conn:
-                self.pg_conn.rollback()
             return 0
     
-    def process_file_batch(self, files: List[Dict], max_files: int = None) -> Dict:
-        """Process a batch of files"""
+    def process_file_batch(self, files: List[Dict], max_files: int = None,
+                           run_id: Optional[int] = None) -> Dict:
+        """Process a batch of files
+        
+        Each file's stage is written to the journal as it completes. Given the
+        run_id of an interrupted run, files resume from their last completed
+        stage and `files` is ignored. Resource rows are committed
+        RESOURCE_BATCH_SIZE at a time, and files are linked once their row is in.
+        """
+        if run_id is None:
+            if max_files:
+                files = files[:max_files]
+                print(f"Processing first {max_files} files only")
+            run_id = self.journal.start_run('batch', {'max_files': max_files})
+            self.journal.add_items(run_id, files)
+            self.journal.mark_scan_complete(run_id)
+        
+        jobs = self.journal.pending(run_id)
         stats = {
-            'total': len(files),
+            'total': len(jobs),
             'uploaded': 0,
             'db_created': 0,
             'linked': 0,
+            'skipped': 0,
             'errors': 0
         }
         
-        if max_files:
-            files = files[:max_files]
-            print(f"Processing first {max_files} files only")
+        # Uploaded files waiting for their resource batch to commit
+        awaiting = []
         
-        for i, file_info in enumerate(files, 1):
-            print(f"\n[{i}/{len(files)}] Processing: {file_info['filename']}")
+        for i, job in enumerate(jobs, 1):
+            file_info = job['info']
+            print(f"\n[{i}/{len(jobs)}] Processing: {file_info['filename']}"
+                  + (f" (resuming after {job['stage']})" if job['stage'] != 'scanned' else ""))
             
             try:
                 # Generate R2 key
                 r2_key = self.create_r2_key(file_info)
                 
-                # Upload to R2
-                metadata = {
-                    'speaker': file_info.get('speaker', ''),
-                    'source': file_info['source'],
-                    'book': file_info.get('book_name', ''),
-                    'type': file_info['type']
-                }
+                # Skip files unchanged since a previous run finished them
+                file_stat = FileStat(file_info['size'], file_info['mtime_ns'])
+                if self.manifest.is_complete(file_info['path'], r2_key, file_stat):
+                    print("  - Unchanged since last run, skipping")
+                    stats['skipped'] += 1
+                    self.journal.advance(run_id, job['path'], 'linked')
+                    continue
                 
-                if self.upload_to_r2(file_info['path'], r2_key, metadata):
-                    stats['uploaded'] += 1
+                # Upload to R2
+                if not stage_reached(job, 'uploaded'):
+                    metadata = {
+                        'speaker': file_info.get('speaker', ''),
+                        'source': file_info['source'],
+                        'book': file_info.get('book_name', ''),
+                        'type': file_info['type']
+                    }
                     
-                    # Create database record
-                    resource_id = self.create_resource_record(file_info, r2_key)
-                    if resource_id:
-                        stats['db_created'] += 1
-                        
-                        # Link to book verses if book ID available
-                        if file_info.get('book_id'):
-                            links = self.link_to_book_verses(
-                                resource_id, file_info['book_id'], file_info['type']
-                            )
-                            stats['linked'] += links
-                            print(f"  Linked to {links} verses")
-                        
-                        print(f"  ✓ Resource: {resource_id}")
-                    else:
-                        print(f"  ✗ Failed to create database record")
-                        stats['errors'] += 1
-                else:
-                    print(f"  ✗ Upload failed")
-                    stats['errors'] += 1
+                    started = time.perf_counter()
+                    upload = self.upload_to_r2(file_info['path'], r2_key, metadata)
+                    job.setdefault('timings', {})['upload'] = time.perf_counter() - started
+                    if not upload:
+                        self._fail_job(job, "Upload failed", stats, run_id)
+                        continue
+                    if 'read_seconds' in upload:
+                        job['timings'].update({'upload.read': upload['read_seconds'],
+                                               'upload.hash': upload['hash_seconds']})
+                    stats['uploaded'] += 1
+                    job['etag'] = upload['etag']
+                    self.journal.advance(run_id, job['path'], 'uploaded', r2_key=r2_key, etag=upload['etag'])
+                    hashed = {'sha256': upload['sha256']} if upload.get('sha256') else {}
+                    self.manifest.record(file_info['path'], file_stat, r2_key=r2_key, etag=upload['etag'], **hashed)
+                
+                if stage_reached(job, 'db_recorded'):
+                    self._link_job(job, file_stat, job['resource_id'], stats, run_id)
+                    continue
+                
+                # Create database record, committed with the rest of its batch
+                future = self.create_resource_record(file_info, r2_key, job.get('etag'))
+                if future is None:
+                    self._fail_job(job, "Failed to create database record: not connected", stats, run_id)
+                    continue
+                awaiting.append((job, file_stat, future))
+                if len(awaiting) >= RESOURCE_BATCH_SIZE:
+                    self._finish_recorded(awaiting, stats, run_id)
+                    awaiting = []
                     
             except Exception as e:
-                print(f"  ✗ Error processing file: {e}")
-                stats['errors'] += 1
+                self._fail_job(job, f"Error processing file: {e}", stats, run_id)
+        
+        self._finish_recorded(awaiting, stats, run_id)
+        
+        if not stats['errors']:
+            self.journal.finish_run(run_id)
         
         return stats
     
+    def _finish_recorded(self, awaiting: List[Tuple[Dict, FileStat, Future]], stats: Dict, run_id: int):
+        """Journal and link uploaded files once their resource rows are committed"""
+        if not awaiting:
+            return
+        started = time.perf_counter()
+        self.resource_writer.flush()
+        # Every file in the batch waited for the whole commit
+        committed = time.perf_counter() - started
+        print(f"\n  Committed resource batch of {len(awaiting)} files")
+        for job, file_stat, future in awaiting:
+            job.setdefault('timings', {})['record'] = committed
+            try:
+                resource_id = future.result()
+            except Exception as e:
+                self._fail_job(job, f"Failed to create database record: {e}", stats, run_id)
+                continue
+            stats['db_created'] += 1
+            self.journal.advance(run_id, job['path'], 'db_recorded', resource_id=resource_id)
+            self.manifest.record(job['info']['path'], file_stat, resource_id=resource_id)
+            self._link_job(job, file_stat, resource_id, stats, run_id)
+    
+    def _link_job(self, job: Dict, file_stat: FileStat, resource_id: str, stats: Dict, run_id: int):
+        """Link a recorded file to its book verses if its book is known"""
+        file_info = job['info']
+        try:
+            if file_info.get('book_id'):
+                started = time.perf_counter()
+                links = self.link_to_book_verses(
+                    resource_id, file_info['book_id'], file_info['type']
+                )
+                job.setdefault('timings', {})['link'] = time.perf_counter() - started
+                if not links:
+                    self._fail_job(job, "Failed to link to book verses", stats, run_id)
+                    return
+                stats['linked'] += links
+            
+            self.journal.advance(run_id, job['path'], 'linked')
+            self.manifest.record(file_info['path'], file_stat, linked=True)
+            if self.profiler:
+                self.profiler.record_file(file_info['path'], job.get('timings', {}))
+            print(f"  ✓ {file_info['filename']}: resource {resource_id}"
+                  + (f", linked to {file_info['book_name']}" if file_info.get('book_id') else ""))
+        except Exception as e:
+            self._fail_job(job, f"Error processing file: {e}", stats, run_id)
+    
+    def _fail_job(self, job: Dict, message: str, stats: Dict, run_id: int):
+        print(f"  ✗ {job['info']['filename']}: {message}")
+        stats['errors'] += 1
+        self.journal.fail(run_id, job['path'], message)
+        if self.profiler:
+            self.profiler.record_file(job['path'], job.get('timings', {}), error=message)
+    
     def run_batch_upload(self, include_word_of_promise: bool = True, 
                         include_grace_to_you: bool = True, 
-                        max_files_per_type: int = None):
+                        max_files_per_type: int = None,
+                        resume: bool = False):
         """Run the complete batch upload process"""
         
         print("="*60)
         print("BIBLE AUDIO BATCH UPLOADER")
         print("="*60)
         
-        all_files = []
-        
-        # Scan Word of Promise
-        if include_word_of_promise:
-            wop_files = self.scan_word_of_promise_files()
-            all_files.extend(wop_files)
-        
-        # Scan Grace to You
-        if include_grace_to_you:
-            gty_files = self.scan_grace_to_you_files()
-            all_files.extend(gty_files)
-        
-        if not all_files:
-            print("No audio files found to process")
-            return
-        
-        # Show summary
-        total_size = sum(f['size'] for f in all_files) / (1024**3)  # GB
-        print(f"\nFound {len(all_files)} audio files ({total_size:.1f} GB total)")
-        
-        # Group by type for summary
-        by_type = {}
-        for f in all_files:
-            t = f['type']
-            if t not in by_type:
-                by_type[t] = []
-            by_type[t].append(f)
-        
-        for audio_type, files in by_type.items():
-            size_gb = sum(f['size'] for f in files) / (1024**3)
-            print(f"  {audio_type}: {len(files)} files ({size_gb:.1f} GB)")
+        run_id = self.journal.last_unfinished_run('batch') if resume else None
+        if run_id:
+            summary = self.journal.summary(run_id)
+            print(f"\nResuming run {run_id}: {len(self.journal.pending(run_id))} files left")
+            print(f"  Progress so far: {summary}")
+            all_files = []
+        else:
+            if resume:
+                print("\nNo interrupted run found, starting a new one")
+            
+            all_files = []
+            
+            # Scan Word of Promise
+            if include_word_of_promise:
+                wop_files = self.scan_word_of_promise_files()
+                all_files.extend(wop_files)
+            
+            # Scan Grace to You
+            if include_grace_to_you:
+                gty_files = self.scan_grace_to_you_files()
+                all_files.extend(gty_files)
+            
+            if not all_files:
+                print("No audio files found to process")
+                return
+            
+            # Show summary
+            total_size = sum(f['size'] for f in all_files) / (1024**3)  # GB
+            print(f"\nFound {len(all_files)} audio files ({total_size:.1f} GB total)")
+            
+            # Group by type for summary
+            by_type = {}
+            for f in all_files:
+                t = f['type']
+                if t not in by_type:
+                    by_type[t] = []
+                by_type[t].append(f)
+            
+            for audio_type, files in by_type.items():
+                size_gb = sum(f['size'] for f in files) / (1024**3)
+                print(f"  {audio_type}: {len(files)} files ({size_gb:.1f} GB)")
         
         # Confirm before proceeding
         response = input(f"\nProceed with upload? (y/N): ")
@@ -455,7 +508,11 @@ class BibleAudioBatchUploader:
         
         # Process files
         print(f"\nStarting batch upload...")
-        stats = self.process_file_batch(all_files, max_files_per_type)
+        if self.profiler:
+            self.profiler.start()
+        stats = self.process_file_batch(all_files, max_files_per_type, run_id=run_id)
+        if self.profiler:
+            print(f"Profile written to {self.profiler.stop(dict(stats))}")
         
         # Final summary
         print(f"\n" + "="*60)
@@ -464,24 +521,64 @@ class BibleAudioBatchUploader:
         print(f"Total files processed: {stats['total']}")
         print(f"Successfully uploaded: {stats['uploaded']}")
         print(f"Database records created: {stats['db_created']}")
-        print(f"Verse links created: {stats['linked']}")
+        print(f"Book links created: {stats['linked']}")
+        print(f"Skipped (unchanged): {stats['skipped']}")
         print(f"Errors: {stats['errors']}")
         
         if stats['uploaded'] > 0:
             print(f"\nAudio files are now available via your Worker URL")
             print(f"Database contains metadata and verse linkings")
+        
+        if stats['errors']:
+            print("\nRun again with --resume to retry only the files that did not finish")
+        
+        METRICS.write_json(self.metrics_path, stats)
+        print(f"Stage timings written to {self.metrics_path}")
+        
+        self.transport.close()
+        if self.resource_writer:
+            self.resource_writer.close()
+            self.pool.close()
+        self.manifest.close()
+        self.journal.close()
 
 
 def main():
     """Main execution"""
-    uploader = BibleAudioBatchUploader()
+    parser = argparse.ArgumentParser(description='Batch upload Bible audio to Cloudflare R2')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue the last interrupted run, retrying only unfinished files')
+    parser.add_argument('--max-upload-mbps', type=float, default=None,
+                        help='Cap upload bandwidth at this many MB per second')
+    parser.add_argument('--metrics-json', default=str(METRICS_PATH),
+                        help='Where to write per-stage timings and throughput at the end of the run')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='Serve Prometheus metrics on this port at /metrics during the run')
+    parser.add_argument('--profile', nargs='?', metavar='DIR',
+                        const=f"profiles/{time.strftime('%Y%m%d-%H%M%S')}",
+                        help='Write cProfile stats per stage, top allocation sites and the slowest files to DIR')
+    parser.add_argument('--profile-slowest', type=int, default=20,
+                        help="Files kept in the profile's slowest-files list")
+    args = parser.parse_args()
+    
+    if args.metrics_port:
+        METRICS.serve(args.metrics_port)
+    
+    transport = None
+    if args.max_upload_mbps:
+        transport = create_transport(R2_BUCKET, settings=TransferSettings(
+            max_bytes_per_second=args.max_upload_mbps * MB
+        ))
+    profiler = RunProfiler(Path(args.profile), slowest=args.profile_slowest) if args.profile else None
+    uploader = BibleAudioBatchUploader(transport=transport, metrics_path=Path(args.metrics_json), profiler=profiler)
     
     # Test run with limited files first
     print("Starting with a small test batch...")
     uploader.run_batch_upload(
         include_word_of_promise=True,
         include_grace_to_you=True, 
-        max_files_per_type=5  # Start with just 5 files for testing
+        max_files_per_type=5,  # Start with just 5 files for testing
+        resume=args.resume
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Book resolver micro-benchmark
+Checks known-tricky names, then times resolve_many over synthetic filenames
+"""
+
+import sys
+import time
+import random
+from pathlib import Path
+import argparse
+
+# Add the package to the path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from bible_mp3.books import BOOKS, RESOLVER, resolve_directory
+
+# (text, expected canonical name)
+CASES = [
+    ("Phil 2", "Philippians"),
+    ("Philemon 1", "Philemon"),
+    ("Phm_01", "Philemon"),
+    ("Philippians 4 13", "Philippians"),
+    ("01 Genesis 001", "Genesis"),
+    ("1Samuel_03", "1 Samuel"),
+    ("First Samuel 17", "1 Samuel"),
+    ("I Sam 3", "1 Samuel"),
+    ("II Kings 5", "2 Kings"),
+    ("2nd Chronicles 7", "2 Chronicles"),
+    ("3 John 1", "3 John"),
+    ("John 3 16", "John"),
+    ("Song of Songs 2", "Song of Solomon"),
+    ("Song of Solomon 1", "Song of Solomon"),
+    ("Ps 23", "Psalms"),
+    ("Revelations 21", "Revelation"),
+    ("I am the vine", None),
+    ("Sermon 1234", None),
+]
+
+DIRECTORIES = [
+    ("01_Genesis", ("Genesis", 1)),
+    ("50_Philippians", ("Philippians", 50)),
+    ("57_Philemon", ("Philemon", 57)),
+    ("62_1_John", ("1 John", 62)),
+    ("45_Something", ("Romans", 45)),
+    ("Downloads", None),
+]
+
+
+def synthetic_filenames(count: int, seed: int = 1):
+    """(expected book, filename) pairs in the shapes the audio collections use"""
+    rng = random.Random(seed)
+    shapes = [
+        "{order:02d} {name} {chapter:03d}",
+        "{name}_{chapter:02d}",
+        "{compact}{chapter}",
+        "{abbrev} {chapter} - Sermon {sermon}",
+        "GTY {sermon} {abbrev} {chapter}",
+    ]
+    for _ in range(count):
+        book = rng.choice(BOOKS)
+        abbrev = rng.choice(book.abbreviations)
+        number = book.name.split(' ')[0]
+        if number.isdigit():
+            abbrev = f"{number} {abbrev}"
+        yield book.name, rng.choice(shapes).format(
+            order=book.order,
+            name=book.name,
+            compact=book.name.replace(' ', ''),
+            abbrev=abbrev,
+            chapter=rng.randint(1, 50),
+            sermon=rng.randint(1, 3000)
+        )
+
+
+def check_cases() -> int:
+    failures = 0
+    for text, expected in CASES:
+        got = RESOLVER.resolve(text)
+        if got != expected:
+            print(f"FAIL {text!r}: expected {expected!r}, got {got!r}")
+            failures += 1
+    for dir_name, expected in DIRECTORIES:
+        got = resolve_directory(dir_name)
+        if got != expected:
+            print(f"FAIL directory {dir_name!r}: expected {expected!r}, got {got!r}")
+            failures += 1
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the book name resolver')
+    parser.add_argument('--count', type=int, default=100_000,
+                       help='Synthetic filenames to resolve')
+    parser.add_argument('--repeat', type=int, default=5,
+                       help='Timed runs; the best is reported')
+    parser.add_argument('--budget-ms', type=float,
+                       help='Fail if the best run takes longer than this')
+
+    args = parser.parse_args()
+
+    failures = check_cases()
+    print(f"Correctness: {len(CASES) + len(DIRECTORIES) - failures}/{len(CASES) + len(DIRECTORIES)} cases")
+
+    expected, filenames = zip(*synthetic_filenames(args.count))
+    best = float('inf')
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        results = RESOLVER.resolve_many(filenames)
+        best = min(best, time.perf_counter() - started)
+
+    wrong = sum(got != want for got, want in zip(results, expected))
+    print(f"Resolved {len(filenames):,} filenames in {best * 1000:.1f} ms "
+          f"({len(filenames) / best:,.0f}/s, {wrong} wrong)")
+
+    if failures or wrong:
+        return 1
+    if args.budget_ms is not None and best * 1000 > args.budget_ms:
+        print(f"Over budget: {best * 1000:.1f} ms > {args.budget_ms} ms")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Import time benchmark
+Times `import bible_mp3` in fresh interpreters and fails when it exceeds the startup budget
+"""
+
+import os
+import sys
+import json
+import re
+import statistics
+import subprocess
+from pathlib import Path
+import argparse
+
+SRC = Path(__file__).parent.parent / 'src'
+
+# Dependencies the light helpers must not drag in; AudioUploader and BibleDatabase load them on first use
+HEAVY = ['boto3', 'botocore', 'psycopg2', 'mutagen']
+
+# Runs in the child: time the import and report what it loaded, -X importtime writes the breakdown to stderr
+CHILD = '''
+import json, sys, time
+before = set(sys.modules)
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{'ms': elapsed * 1000, 'loaded': sorted(set(sys.modules) - before)}}))
+'''
+
+IMPORTTIME = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def measure(module: str) -> dict:
+    """Import module once in a fresh interpreter"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(SRC), os.getenv('PYTHONPATH')])))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD.format(module=module)],
+                            capture_output=True, text=True, env=env)
+    if result.returncode:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr.strip().splitlines()[-1]}")
+    run = json.loads(result.stdout.strip().splitlines()[-1])
+    loaded = set(run['loaded'])
+    run['self_us'] = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME.match(line)
+        if match and match.group(4) in loaded:
+            run['self_us'][match.group(4)] = int(match.group(1))
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the import time of the bible_mp3 package against a budget')
+    parser.add_argument('modules', nargs='*', default=['bible_mp3'],
+                       help='Modules to import (default: bible_mp3)')
+    parser.add_argument('--repeat', type=int, default=7,
+                       help='Fresh interpreters per module; the median is compared with the budget')
+    parser.add_argument('--budget-ms', type=float, default=50.0,
+                       help='Largest acceptable median import time')
+    parser.add_argument('--forbid', nargs='*', default=HEAVY,
+                       help='Modules the import must not load (pass --forbid alone to allow all)')
+    parser.add_argument('--top', type=int, default=10,
+                       help='Slowest imported modules to list, by self time')
+    parser.add_argument('--output', help='Write the results as JSON')
+
+    args = parser.parse_args()
+
+    report, failed = {}, False
+    for module in args.modules:
+        try:
+            measure(module)  # warm-up: writes bytecode caches so every timed run starts alike
+            runs = [measure(module) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            print(e)
+            return 1
+
+        times = [run['ms'] for run in runs]
+        median = statistics.median(times)
+        loaded = set(runs[-1]['loaded'])
+        forbidden = sorted(name for name in args.forbid if name in loaded)
+        over = median > args.budget_ms
+        failed = failed or over or bool(forbidden)
+
+        print(f"import {module}: median {median:.1f} ms, min {min(times):.1f} ms over {len(times)} runs, "
+              f"{len(loaded)} modules loaded (budget {args.budget_ms:g} ms){' OVER BUDGET' if over else ''}")
+        if forbidden:
+            print(f"  loads heavy dependencies: {', '.join(forbidden)}")
+        slowest = sorted(runs[-1]['self_us'].items(), key=lambda item: -item[1])[:args.top]
+        for name, self_us in slowest:
+            print(f"  {self_us / 1000:8.2f} ms  {name}")
+        report[module] = {'median_ms': round(median, 2), 'min_ms': round(min(times), 2),
+                          'runs_ms': [round(ms, 2) for ms in times], 'modules_loaded': len(loaded),
+                          'forbidden_loaded': forbidden, 'over_budget': over,
+                          'slowest_self_ms': {name: round(us / 1000, 2) for name, us in slowest}}
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'budget_ms': args.budget_ms, 'python': sys.version.split()[0], 'modules': report}, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+MP3 frame scanner benchmark
+Times the mmap scanner in bible_mp3.utils against mutagen on a directory of MP3s
+"""
+
+import sys
+import time
+from pathlib import Path
+import argparse
+
+# Add the package to the path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from bible_mp3.utils import scan_mp3_file
+
+
+def mutagen_info(file_path: Path):
+    from mutagen.mp3 import MP3
+    info = MP3(str(file_path)).info
+    return {'duration': info.length, 'bitrate': info.bitrate}
+
+
+def time_all(func, files):
+    results, started = [], time.perf_counter()
+    for file_path in files:
+        try:
+            results.append(func(file_path))
+        except Exception:
+            results.append(None)
+    return results, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the MP3 frame scanner against mutagen')
+    parser.add_argument('corpus', help='Directory of MP3 files (searched recursively)')
+    parser.add_argument('--limit', type=int, default=500,
+                       help='Files to scan')
+    parser.add_argument('--repeat', type=int, default=3,
+                       help='Timed runs; the best is reported')
+    parser.add_argument('--exact', action='store_true',
+                       help='Count every frame of files without a VBR header (mutagen estimates those)')
+    parser.add_argument('--tolerance', type=float, default=0.01,
+                       help='Largest relative duration difference from mutagen still counted as agreeing')
+
+    args = parser.parse_args()
+
+    files = sorted(Path(args.corpus).rglob('*.mp3'))[:args.limit]
+    if not files:
+        print(f"No MP3 files under {args.corpus}")
+        return 1
+
+    try:
+        import mutagen  # noqa: F401
+    except ImportError:
+        print("mutagen is not installed; nothing to compare against")
+        return 1
+
+    best = {}
+    scanner = lambda file_path: scan_mp3_file(file_path, exact=args.exact)
+    for name, func in (('scanner', scanner), ('mutagen', mutagen_info)):
+        for _ in range(args.repeat):
+            results, elapsed = time_all(func, files)
+            if elapsed < best.get(name, (None, float('inf')))[1]:
+                best[name] = (results, elapsed)
+
+    scanned, scan_time = best['scanner']
+    reference, mutagen_time = best['mutagen']
+    methods = {}
+    disagree = unreadable = 0
+    for file_path, ours, theirs in zip(files, scanned, reference):
+        if ours is None or theirs is None:
+            unreadable += (ours is None) != (theirs is None)
+            continue
+        methods[ours['method']] = methods.get(ours['method'], 0) + 1
+        if theirs['duration'] and abs(ours['duration'] - theirs['duration']) / theirs['duration'] > args.tolerance:
+            disagree += 1
+            print(f"  {file_path.name}: scanner {ours['duration']:.2f}s ({ours['method']}), "
+                  f"mutagen {theirs['duration']:.2f}s")
+
+    print(f"Scanned {len(files)} files: scanner {scan_time * 1000:.1f} ms, mutagen {mutagen_time * 1000:.1f} ms "
+          f"({mutagen_time / scan_time:.1f}x)")
+    print(f"Duration source: {methods}; {disagree} disagree beyond {args.tolerance:.0%}, "
+          f"{unreadable} readable by only one")
+
+    return 1 if disagree or unreadable or scan_time > mutagen_time else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
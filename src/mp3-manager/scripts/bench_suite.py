@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Ingest benchmark suite
+Times scanning, book resolution, metadata, hashing, database writes and end-to-end ingest; results are saved as JSON
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import platform
+import subprocess
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import logging
+from dotenv import load_dotenv
+
+# Add the package to the path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from bible_mp3 import __version__
+from bible_mp3.books import BOOKS, resolve_book_name, resolve_directory
+from bible_mp3.corpus import COLLECTIONS, generate_corpus
+from bible_mp3.metadata import MetadataExtractor, extract_metadata
+from bible_mp3.reader import SinglePassReader
+from bible_mp3.scanner import scan_tree, top_level_dir
+from bible_mp3.transfer import MB
+
+# Resource ids written by the database benchmarks, removed before and after
+BENCH_PREFIX = 'bench-'
+BENCHMARKS = ['scan', 'books', 'metadata', 'metadata_pool', 'hashing', 'upserts', 'linking', 'end_to_end']
+
+
+class Skip(Exception):
+    """A benchmark whose service is not configured"""
+
+
+def timed(run, repeat: int = 1) -> dict:
+    """Best of repeat calls of run() -> (items, bytes), as a result entry"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        items, nbytes = run()
+        elapsed = time.perf_counter() - started
+        if best is None or elapsed < best[0]:
+            best = (elapsed, items, nbytes)
+    elapsed, items, nbytes = best
+    result = {'items': items, 'seconds': round(elapsed, 4),
+              'per_second': round(items / elapsed, 1) if elapsed else None}
+    if nbytes:
+        result['mb_per_second'] = round(nbytes / MB / elapsed, 1) if elapsed else None
+    return result
+
+
+class Context:
+    """Corpus files and lazily opened services shared by the benchmarks"""
+
+    def __init__(self, args):
+        self.args = args
+        self.root = Path(args.corpus)
+        self.repeat = args.repeat
+        self.files = sorted(scan_tree(self.root), key=lambda record: record['path'])
+        self.resource_ids = []
+        self._pool = None
+
+    def collection_root(self, collection: str) -> Path:
+        return self.root / COLLECTIONS[collection]['dir']
+
+    def pool(self):
+        if self._pool is None:
+            if not self.args.postgres_url:
+                raise Skip("POSTGRES_URL not set")
+            from bible_mp3.pool import ConnectionPool
+            from bible_mp3.schema import migrate
+            self._pool = ConnectionPool(self.args.postgres_url, maxconn=self.args.workers + 2)
+            migrate(self._pool)
+            remove_bench_rows(self._pool)
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            remove_bench_rows(self._pool, self.resource_ids)
+            self._pool.close()
+
+
+def remove_bench_rows(pool, extra_ids=()):
+    """Delete resources written by earlier benchmark runs (span links cascade)"""
+    with pool.cursor() as cursor:
+        cursor.execute("DELETE FROM verse_resource_link WHERE resource_id LIKE %s OR resource_id = ANY(%s)",
+                       (BENCH_PREFIX + '%', list(extra_ids)))
+        cursor.execute("DELETE FROM resources WHERE id LIKE %s OR id = ANY(%s)",
+                       (BENCH_PREFIX + '%', list(extra_ids)))
+
+
+def bench_scan(ctx: Context) -> dict:
+    return timed(lambda: (sum(1 for _ in scan_tree(ctx.root)), 0), ctx.repeat)
+
+
+def bench_books(ctx: Context) -> dict:
+    """Directory names for Grace to You, file names for Word of Promise, as the uploaders resolve them"""
+    gty_root = ctx.collection_root('grace-to-you')
+    names = []
+    for record in ctx.files:
+        if record['path'].startswith(str(gty_root)):
+            names.append((resolve_directory, top_level_dir(record, gty_root) or ''))
+        else:
+            names.append((resolve_book_name, Path(record['name']).stem))
+    if not names:
+        raise Skip("empty corpus")
+    # Enough rounds to time reliably
+    rounds = max(1, 20000 // len(names))
+    unresolved = sum(1 for resolve, text in names if not resolve(text))
+
+    def run():
+        for _ in range(rounds):
+            for resolve, text in names:
+                resolve(text)
+        return rounds * len(names), 0
+
+    result = timed(run, ctx.repeat)
+    result['unresolved'] = unresolved
+    return result
+
+
+def bench_metadata(ctx: Context) -> dict:
+    failed = []
+
+    def run():
+        failed[:] = [record['path'] for record in ctx.files if extract_metadata(record['path'])['error']]
+        return len(ctx.files), 0
+
+    result = timed(run, ctx.repeat)
+    result['errors'] = len(failed)
+    return result
+
+
+def bench_metadata_pool(ctx: Context) -> dict:
+    extractor = MetadataExtractor()
+    try:
+        # The first pass starts the worker processes
+        return timed(lambda: (sum(1 for _ in extractor.extract_many(r['path'] for r in ctx.files)), 0),
+                     ctx.repeat + 1)
+    finally:
+        extractor.shutdown()
+
+
+def bench_hashing(ctx: Context) -> dict:
+    def run():
+        total = 0
+        for record in ctx.files:
+            reader = SinglePassReader(Path(record['path']), ctx.args.part_size_mb * MB)
+            for _ in reader.parts():
+                pass
+            total += reader.bytes_read
+        return len(ctx.files), total
+
+    return timed(run, ctx.repeat)
+
+
+def bench_upserts(ctx: Context) -> dict:
+    pool = ctx.pool()
+    from bible_mp3.writer import BatchedResourceWriter, resource_row
+
+    rows = []
+    for record in ctx.files:
+        digest = hashlib.md5(record['path'].encode()).hexdigest()[:16]
+        rows.append(resource_row(f"{BENCH_PREFIX}{digest}", record['name'], f"bench://{record['name']}",
+                                 local_path=record['path'], provider='benchmark', file_size=record['size'],
+                                 mime_type='audio/mpeg', meta={'benchmark': True}))
+    writer = BatchedResourceWriter(pool)
+    try:
+        def run():
+            ctx.resource_ids = [future.result() for future in [writer.submit(row) for row in rows]]
+            return len(rows), 0
+
+        return timed(run)
+    finally:
+        writer.close()
+
+
+def bench_linking(ctx: Context) -> dict:
+    """One span per resource, each in its own transaction, as the uploader links"""
+    if not ctx.resource_ids:
+        raise Skip("needs the upserts benchmark")
+    pool = ctx.pool()
+    from bible_mp3.database import insert_book_span
+    from bible_mp3.reference import ReferenceCache
+
+    reference = ReferenceCache(pool)
+    books = [book for book in (reference.book(b.name) for b in BOOKS) if book]
+    if not books:
+        raise Skip("books table is empty")
+
+    def run():
+        for index, resource_id in enumerate(ctx.resource_ids):
+            book = books[index % len(books)]
+            with pool.cursor() as cursor:
+                insert_book_span(cursor, resource_id, book_id=book['id'], book_order=book['book_order'],
+                                 label="Audio commentary", relevance=0.85)
+        return len(ctx.resource_ids), 0
+
+    return timed(run)
+
+
+def bench_end_to_end(ctx: Context) -> dict:
+    """Grace to You corpus through AudioUploader into a local S3 stand-in and Postgres"""
+    endpoint_url = os.getenv('S3_ENDPOINT_URL')
+    if not endpoint_url:
+        raise Skip("S3_ENDPOINT_URL not set")
+    gty_root = ctx.collection_root('grace-to-you')
+    if not gty_root.exists():
+        raise Skip("corpus has no grace-to-you collection")
+    pool = ctx.pool()
+    from bible_mp3 import AudioUploader
+    from bible_mp3.transfer import TransferSettings
+
+    uploader = AudioUploader(
+        account_id='local',
+        access_key=os.getenv('CLOUDFLARE_R2_ACCESS_KEY', 'bench'),
+        secret_key=os.getenv('CLOUDFLARE_R2_SECRET_KEY', 'bench'),
+        bucket_name=ctx.args.bucket,
+        pool=pool,
+        endpoint_url=endpoint_url,
+        transfer_settings=TransferSettings(max_workers=ctx.args.workers, part_size=ctx.args.part_size_mb * MB)
+    )
+    try:
+        try:
+            uploader.r2_client.create_bucket(Bucket=ctx.args.bucket)
+        except Exception:
+            pass  # already there
+        outcome = {}
+
+        def run():
+            outcome.update(uploader.process_grace_to_you_directory(gty_root, test_mode=False,
+                                                                   pipeline=ctx.args.pipeline))
+            ctx.resource_ids.extend(item['resource_id'] for item in outcome['processed'])
+            return len(outcome['processed']), outcome['transfer_stats']['mb_sent'] * MB
+
+        result = timed(run)
+        result['errors'] = len(outcome['errors'])
+        result['pipeline'] = ctx.args.pipeline
+        return result
+    finally:
+        uploader.writer.close()
+        uploader.transfer.shutdown()
+        uploader.metadata_extractor.shutdown()
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).parent).stdout.strip()
+    except OSError:
+        return ''
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> int:
+    """Print per-benchmark rate changes; returns how many fell by more than threshold"""
+    regressions = 0
+    print(f"\nAgainst {baseline.get('version')} ({baseline.get('git') or 'unknown revision'}):")
+    for name, result in report['results'].items():
+        before = baseline.get('results', {}).get(name, {})
+        if not result.get('per_second') or not before.get('per_second'):
+            continue
+        change = result['per_second'] / before['per_second'] - 1
+        flag = ''
+        if change < -threshold:
+            regressions += 1
+            flag = '  REGRESSION'
+        print(f"  {name:15} {before['per_second']:>10} -> {result['per_second']:>10} /s ({change:+.1%}){flag}")
+    return regressions
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Benchmark the ingest path on a synthetic corpus')
+    parser.add_argument('--corpus', default='bench_corpus',
+                       help='Corpus directory; generated if it does not exist')
+    parser.add_argument('--books', type=int, default=len(BOOKS),
+                       help='Books in a generated corpus')
+    parser.add_argument('--files-per-book', type=int, default=3,
+                       help='Files per book in a generated corpus')
+    parser.add_argument('--only', default=','.join(BENCHMARKS),
+                       help=f"Comma-separated benchmarks to run ({', '.join(BENCHMARKS)})")
+    parser.add_argument('--repeat', type=int, default=3,
+                       help='Timed runs of the read-only benchmarks; the best is kept')
+    parser.add_argument('--workers', type=int, default=8,
+                       help='Upload workers for the end-to-end benchmark')
+    parser.add_argument('--part-size-mb', type=int, default=16,
+                       help='Part size for hashing and uploads')
+    parser.add_argument('--pipeline', action='store_true',
+                       help='Run the end-to-end benchmark through the staged pipeline')
+    parser.add_argument('--bucket', default='bible-audio-bench',
+                       help='Bucket in the local S3 stand-in')
+    parser.add_argument('--postgres-url', default=os.getenv('POSTGRES_URL'),
+                       help='Local PostgreSQL for the database benchmarks (default: POSTGRES_URL)')
+    parser.add_argument('--output', default=None,
+                       help='Result file (default: bench_results/<version>-<timestamp>.json)')
+    parser.add_argument('--compare', default=None,
+                       help='Earlier result file; exit 1 if any rate fell by more than --threshold')
+    parser.add_argument('--threshold', type=float, default=0.15,
+                       help='Largest tolerated slowdown against --compare')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR, format='%(levelname)s %(name)s: %(message)s')
+
+    corpus = Path(args.corpus)
+    if not corpus.exists():
+        print(f"Generating corpus in {corpus}")
+        generate_corpus(corpus, books=[book.name for book in BOOKS[:args.books]],
+                        files_per_book=args.files_per_book)
+
+    ctx = Context(args)
+    report = {
+        'version': __version__,
+        'git': git_revision(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'corpus': {'path': str(corpus), 'files': len(ctx.files),
+                   'mb': round(sum(record['size'] for record in ctx.files) / MB, 1)},
+        'results': {}
+    }
+    print(f"Corpus: {report['corpus']['files']} files, {report['corpus']['mb']} MB")
+
+    try:
+        for name in [n.strip() for n in args.only.split(',') if n.strip()]:
+            if name not in BENCHMARKS:
+                print(f"Unknown benchmark: {name}")
+                return 1
+            try:
+                result = globals()[f'bench_{name}'](ctx)
+            except Skip as e:
+                result = {'skipped': str(e)}
+            report['results'][name] = result
+            summary = f"skipped ({result['skipped']})" if 'skipped' in result else \
+                f"{result['items']} in {result['seconds']:.3f}s, {result['per_second']}/s" + \
+                (f", {result['mb_per_second']} MB/s" if result.get('mb_per_second') else '')
+            print(f"  {name:15} {summary}")
+    finally:
+        ctx.close()
+
+    output = Path(args.output) if args.output else \
+        Path('bench_results') / f"{__version__}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        if compare(report, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Synthetic corpus generator
+Writes valid MP3 files laid out like the Grace to You and Word of Promise collections
+"""
+
+import sys
+import json
+from pathlib import Path
+import argparse
+import logging
+
+# Add the package to the path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from bible_mp3.books import BOOKS
+from bible_mp3.corpus import COLLECTIONS, generate_corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic MP3 corpus for benchmarks and load tests')
+    parser.add_argument('root', help='Directory to write the corpus into')
+    parser.add_argument('--collection', choices=list(COLLECTIONS) + ['both'], default='both',
+                       help='Which collection layout to generate')
+    parser.add_argument('--books', type=int, default=len(BOOKS),
+                       help='Number of books, in canonical order')
+    parser.add_argument('--files-per-book', type=int, default=3,
+                       help='Files per book')
+    parser.add_argument('--minutes', type=float, nargs=2, default=(1.0, 5.0), metavar=('MIN', 'MAX'),
+                       help='Range of file durations in minutes')
+    parser.add_argument('--vbr-share', type=float, default=0.25,
+                       help='Fraction of files written as VBR with a Xing header')
+    parser.add_argument('--seed', type=int, default=1,
+                       help='Seed; the same arguments always produce the same files')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    collections = list(COLLECTIONS) if args.collection == 'both' else [args.collection]
+    summary = generate_corpus(
+        Path(args.root),
+        collections=collections,
+        books=[book.name for book in BOOKS[:args.books]],
+        files_per_book=args.files_per_book,
+        minutes=tuple(args.minutes),
+        vbr_share=args.vbr_share,
+        seed=args.seed
+    )
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Local audio server
+Serves MP3s from disk the way the streaming Worker serves them from R2, for load tests
+"""
+
+import re
+import sys
+import json
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import unquote, urlparse
+import argparse
+
+RANGE = re.compile(r'bytes=(\d+)-(\d*)')
+CHUNK = 64 * 1024
+
+
+class AudioHandler(BaseHTTPRequestHandler):
+    """GET/HEAD /audio/<key> with Range support, and /health, as in worker/index.js"""
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are separate writes; without this keep-alive requests wait on delayed ACKs
+    disable_nagle_algorithm = True
+    root: Path = Path('.')
+    latency = 0.0
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _headers(self, status: int, headers: dict):
+        self.send_response(status)
+        headers = {'Access-Control-Allow-Origin': '*', **headers}
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+    def _text(self, status: int, text: str, headers: dict = None):
+        body = text.encode()
+        self._headers(status, {'Content-Type': 'text/plain', 'Content-Length': str(len(body)), **(headers or {})})
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        path = unquote(urlparse(self.path).path)
+        if path == '/health':
+            body = json.dumps({'status': 'ok', 'timestamp': datetime.now(timezone.utc).isoformat()})
+            return self._text(200, body, {'Content-Type': 'application/json'})
+        if not path.startswith('/audio/'):
+            return self._text(200, 'Bible Audio Streaming Service')
+
+        key = path[len('/audio/'):]
+        file_path = (self.root / key).resolve()
+        if not key or self.root not in file_path.parents or not file_path.is_file():
+            return self._text(404 if key else 400, 'Audio file not found' if key else 'Audio file not specified')
+        if self.latency:
+            time.sleep(self.latency)
+
+        size = file_path.stat().st_size
+        headers = {'Content-Type': 'audio/mpeg', 'Accept-Ranges': 'bytes', 'Cache-Control': 'public, max-age=3600'}
+        range_header = self.headers.get('Range')
+        start, end, status = 0, size - 1, 200
+        if range_header:
+            match = RANGE.match(range_header)
+            if not match:
+                return self._text(400, 'Invalid range header')
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else size - 1
+            if start >= size or end >= size or start > end:
+                return self._text(416, 'Range not satisfiable', {'Content-Range': f'bytes */{size}'})
+            status = 206
+            headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        headers['Content-Length'] = str(end - start + 1)
+        self._headers(status, headers)
+        if self.command == 'HEAD':
+            return
+
+        with open(file_path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining:
+                data = f.read(min(CHUNK, remaining))
+                if not data:
+                    break
+                self.wfile.write(data)
+                remaining -= len(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve audio files with Range support, like the streaming Worker')
+    parser.add_argument('root', help='Directory served under /audio/')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8787)
+    parser.add_argument('--latency-ms', type=float, default=0.0,
+                       help='Delay added before each audio response, to mimic a remote origin')
+    parser.add_argument('--verbose', '-v', action='store_true',
+                       help='Log every request')
+
+    args = parser.parse_args()
+    root = Path(args.root).resolve()
+    if not root.is_dir():
+        print(f"Not a directory: {root}")
+        return 1
+
+    AudioHandler.root = root
+    AudioHandler.latency = args.latency_ms / 1000
+    server = ThreadingHTTPServer((args.host, args.port), AudioHandler)
+    server.daemon_threads = True
+    server.verbose = args.verbose
+    print(f"Serving {root} at http://{args.host}:{args.port}/audio/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Manage the database schema
+Shows and applies versioned migrations, and checks the built-in queries for sequential scans
+"""
+
+import os
+import sys
+from pathlib import Path
+import argparse
+import logging
+from dotenv import load_dotenv
+
+# Add the package to the path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from bible_mp3 import BibleDatabase
+from bible_mp3.schema import MIGRATIONS, applied_versions
+
+
+def show_status(db: BibleDatabase):
+    with db.pool.cursor() as cursor:
+        applied = applied_versions(cursor)
+    for migration in MIGRATIONS:
+        state = 'applied' if migration.version in applied else 'pending'
+        print(f"  {migration.version:3d}  {state:8s}  {migration.name}")
+
+
+def check_plans(db: BibleDatabase, min_rows: int) -> bool:
+    flagged = False
+    for entry in db.check_query_plans(min_rows=min_rows):
+        if not entry['seq_scans']:
+            print(f"  ok    {entry['query']} (cost {entry['total_cost']:.0f})")
+            continue
+        flagged = True
+        for scan in entry['seq_scans']:
+            where = f" filter {scan['filter']}" if scan['filter'] else ""
+            print(f"  SEQ   {entry['query']}: {scan['table']} (~{scan['table_rows']} rows){where}")
+    return not flagged
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply schema migrations and check query plans')
+    parser.add_argument('command', choices=['status', 'migrate', 'check'],
+                       help='status: list migrations; migrate: apply pending ones; '
+                            'check: EXPLAIN built-in queries and flag sequential scans')
+    parser.add_argument('--to', type=int,
+                       help='Migrate only up to this version')
+    parser.add_argument('--min-rows', type=int, default=1000,
+                       help='Ignore sequential scans of tables with fewer estimated rows')
+    
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    
+    load_dotenv()
+    postgres_url = os.getenv('POSTGRES_URL')
+    if not postgres_url:
+        print("ERROR: POSTGRES_URL environment variable not set")
+        return 1
+    
+    db = BibleDatabase(postgres_url)
+    
+    if args.command == 'status':
+        show_status(db)
+        return 0
+    
+    if args.command == 'migrate':
+        if not db.ensure_schema(args.to):
+            return 1
+        show_status(db)
+        return 0
+    
+    # Plans are only as good as the planner's statistics
+    with db.pool.cursor() as cursor:
+        cursor.execute("ANALYZE books, chapters, verses, resources, verse_resource_link, resource_span_link")
+    return 0 if check_plans(db, args.min_rows) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
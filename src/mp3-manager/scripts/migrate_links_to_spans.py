@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Collapse per-verse resource links into span links
+Rewrites verse_resource_link fan-out rows as resource_span_link ranges
+"""
+
+import os
+import sys
+from pathlib import Path
+import argparse
+import logging
+from dotenv import load_dotenv
+import json
+
+# Add the package to the path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from bible_mp3 import BibleDatabase
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Collapse verse_resource_link rows into span links')
+    parser.add_argument('--resource-type', default='audio',
+                       help='Only migrate links to resources of this type')
+    parser.add_argument('--batch-size', type=int, default=100,
+                       help='Resources migrated per transaction')
+    parser.add_argument('--keep-fanout', action='store_true',
+                       help='Keep the original per-verse rows after creating spans')
+    
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    
+    load_dotenv()
+    postgres_url = os.getenv('POSTGRES_URL')
+    if not postgres_url:
+        print("ERROR: POSTGRES_URL environment variable not set")
+        return 1
+    
+    db = BibleDatabase(postgres_url)
+    if not db.ensure_schema():
+        return 1
+    
+    print(f"Before: {json.dumps(db.get_database_stats(), indent=2)}")
+    stats = db.collapse_verse_links_to_spans(
+        resource_type=args.resource_type,
+        batch_size=args.batch_size,
+        delete_fanout=not args.keep_fanout
+    )
+    print(f"Migrated {stats['resources']} resources: "
+          f"{stats['spans_created']} spans created, {stats['fanout_deleted']} verse links removed")
+    print(f"After: {json.dumps(db.get_database_stats(), indent=2)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
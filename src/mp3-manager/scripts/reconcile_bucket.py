@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Reconcile the audio bucket with the database
+Reports objects missing from R2, orphan objects and size/ETag mismatches, and optionally repairs them
+"""
+
+import os
+import sys
+from pathlib import Path
+import argparse
+import logging
+from dotenv import load_dotenv
+import json
+
+# Add the package to the path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from bible_mp3 import BibleDatabase
+from bible_mp3.manifest import DEFAULT_MANIFEST_PATH, IngestManifest
+from bible_mp3.reconcile import KINDS, BucketReconciler
+from bible_mp3.transfer import TransferEngine, TransferSettings
+from bible_mp3.transport import make_s3_client, r2_endpoint
+from bible_mp3.utils import is_mp3_header
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the resources table with the R2 bucket and repair differences')
+    parser.add_argument('--bucket-name', default='bible-audio-storage',
+                       help='R2 bucket name')
+    parser.add_argument('--prefix', default='',
+                       help='Only reconcile keys under this prefix (e.g. audio/grace-to-you/)')
+    parser.add_argument('--type', default='audio',
+                       help='Resource type whose rows name bucket objects')
+    parser.add_argument('--manifest', default=str(DEFAULT_MANIFEST_PATH),
+                       help='Ingest manifest consulted for ETags and local paths the rows lack')
+    parser.add_argument('--reupload', action='store_true',
+                       help='Upload missing and mismatched objects again from their local files')
+    parser.add_argument('--delete-orphans', action='store_true',
+                       help='Delete objects no resource refers to; do not run while an upload is in progress')
+    parser.add_argument('--dry-run', action='store_true',
+                       help='With --reupload/--delete-orphans, report what would change without changing it')
+    parser.add_argument('--examples', type=int, default=10,
+                       help='Discrepancies of each kind to print')
+    parser.add_argument('--output', help='Write the full report, every discrepancy included, as JSON')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    load_dotenv()
+    required = ['CLOUDFLARE_ACCOUNT_ID', 'CLOUDFLARE_R2_ACCESS_KEY', 'CLOUDFLARE_R2_SECRET_KEY', 'POSTGRES_URL']
+    missing = [name for name in required if not os.getenv(name)]
+    if missing:
+        print(f"ERROR: environment variables not set: {', '.join(missing)}")
+        return 1
+
+    settings = TransferSettings()
+    client = make_s3_client(r2_endpoint(os.getenv('CLOUDFLARE_ACCOUNT_ID')), os.getenv('CLOUDFLARE_R2_ACCESS_KEY'),
+                            os.getenv('CLOUDFLARE_R2_SECRET_KEY'), settings.max_pool_connections)
+    manifest = IngestManifest(Path(args.manifest)) if Path(args.manifest).exists() else None
+    db = BibleDatabase(os.getenv('POSTGRES_URL'))
+    reconciler = BucketReconciler(client, args.bucket_name, manifest)
+
+    found = {kind: [] for kind in KINDS}
+    try:
+        for discrepancy in reconciler.compare(db.iter_resource_objects(args.prefix, args.type), args.prefix):
+            found[discrepancy.kind].append(discrepancy)
+
+        report = reconciler.report()
+        fixed = 0
+        if args.delete_orphans:
+            report['orphan_deletion'] = reconciler.delete_orphans((d.key for d in found['orphan']), args.dry_run)
+            fixed += report['orphan_deletion']['deleted']
+        if args.reupload:
+            engine = TransferEngine(client, args.bucket_name, settings, validate=is_mp3_header)
+            try:
+                report['reupload'] = reconciler.reupload(
+                    (d for kind in KINDS if kind != 'orphan' for d in found[kind]), engine, args.dry_run
+                )
+            finally:
+                engine.shutdown()
+            fixed += report['reupload']['uploaded']
+        report['delete_calls'] = reconciler.stats['delete_calls']
+    finally:
+        db.close()
+        if manifest:
+            manifest.close()
+
+    print(f"Reconciled s3://{args.bucket_name}/{args.prefix} in {report['list_calls']} list calls: "
+          f"{report['objects']} objects, {report['rows']} resource rows, {report['matched']} matched")
+    if report['etag_unchecked']:
+        print(f"  {report['etag_unchecked']} matched by size only (no ETag recorded)")
+    for kind in KINDS:
+        if not found[kind]:
+            continue
+        print(f"\n{kind}: {len(found[kind])}")
+        for discrepancy in found[kind][:args.examples]:
+            detail = {name: value for name, value in discrepancy._asdict().items()
+                      if value is not None and name not in ('kind', 'key')}
+            print(f"  {discrepancy.key} {json.dumps(detail)}")
+    for fix in ('orphan_deletion', 'reupload'):
+        if fix in report:
+            print(f"\n{fix}{' (dry run)' if args.dry_run else ''}: {json.dumps(report[fix], indent=2)}")
+
+    errors = len(report.get('orphan_deletion', {}).get('errors', [])) + len(report.get('reupload', {}).get('errors', []))
+    unresolved = report['discrepancies'] if args.dry_run else report['discrepancies'] - fixed
+    if args.output:
+        report['found'] = {kind: [d._asdict() for d in found[kind]] for kind in KINDS}
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+    return 1 if unresolved or errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
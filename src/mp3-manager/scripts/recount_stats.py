@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Recount catalog statistics
+Replaces the trigger-maintained counters with exact counts from the tables
+"""
+
+import os
+import sys
+from pathlib import Path
+import argparse
+import logging
+from dotenv import load_dotenv
+import json
+
+# Add the package to the path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from bible_mp3 import BibleDatabase
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Repair catalog statistics with an exact recount')
+    parser.add_argument('--check', action='store_true',
+                       help='Only compare the counters with exact counts, without changing them')
+    
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    
+    load_dotenv()
+    postgres_url = os.getenv('POSTGRES_URL')
+    if not postgres_url:
+        print("ERROR: POSTGRES_URL environment variable not set")
+        return 1
+    
+    db = BibleDatabase(postgres_url)
+    before = db.get_database_stats()
+    
+    if args.check:
+        from bible_mp3.stats import exact_counts
+        with db.pool.cursor() as cursor:
+            exact = exact_counts(cursor)
+    else:
+        exact = db.recount_database_stats()
+        if not exact:
+            return 1
+    
+    drift = {name: before.get(name, 0) - value for name, value in exact.items() if before.get(name, 0) != value}
+    print(f"Exact counts: {json.dumps(exact, indent=2)}")
+    if drift:
+        print(f"Counter drift ({'left as is' if args.check else 'repaired'}): {json.dumps(drift, indent=2)}")
+    else:
+        print("Counters match the exact counts")
+    return 1 if args.check and drift else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
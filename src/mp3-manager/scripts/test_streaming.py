@@ -1,10 +1,11 @@
 #!/usr/bin/env python3
 """
 Test streaming functionality
-Verifies that uploaded MP3s can be streamed via Cloudflare Worker
+Verifies that uploaded MP3s can be streamed via Cloudflare Worker, and load-tests the streaming path
 """
 
 import sys
+import argparse
 import requests
 from pathlib import Path
 import json
@@ -15,6 +16,7 @@ import os
 sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
 
 from bible_mp3 import BibleDatabase
+from bible_mp3.loadtest import StreamLoadTest
 
 
 def test_streaming_urls():
@@ -42,7 +44,7 @@ def test_streaming_urls():
     
     # Test a few audio resources
     try:
-        with db.db_conn.cursor() as cursor:
+        with db.pool.cursor() as cursor:
             cursor.execute("""
                 SELECT id, title, url, meta 
                 FROM resources 
@@ -107,9 +109,98 @@ def test_worker_health():
         return False
 
 
+def stream_urls(args):
+    """URLs to load-test: every MP3 under --corpus at --base-url, or resource URLs from the database"""
+    if args.corpus:
+        root = Path(args.corpus)
+        base = args.base_url.rstrip('/')
+        return [f"{base}/audio/{path.relative_to(root).as_posix()}" for path in sorted(root.rglob('*.mp3'))]
+    
+    postgres_url = os.getenv('POSTGRES_URL')
+    if not postgres_url:
+        print("ERROR: give --corpus or set POSTGRES_URL")
+        return []
+    db = BibleDatabase(postgres_url)
+    with db.pool.cursor() as cursor:
+        cursor.execute("SELECT url FROM resources WHERE type = 'audio' LIMIT %s", (args.resources,))
+        return [row['url'] for row in cursor.fetchall()]
+
+
+def run_load_test(args):
+    """Simulated listeners streaming concurrently; prints and optionally saves the report"""
+    urls = stream_urls(args)
+    if not urls:
+        print("No streams to test")
+        return False
+    
+    print(f"Load test: {args.listeners} listeners on {len(urls)} streams for {args.duration:.0f}s "
+          f"({args.bitrate_kbps} kbps, {args.speed:g}x playback)")
+    print("="*50)
+    report = StreamLoadTest(
+        urls,
+        listeners=args.listeners,
+        duration=args.duration,
+        bitrate_kbps=args.bitrate_kbps,
+        buffer_seconds=args.buffer_seconds,
+        listen_seconds=args.listen_seconds,
+        seek_probability=args.seek_probability,
+        speed=args.speed,
+        timeout=args.timeout,
+        seed=args.seed
+    ).run()
+    
+    print(f"Requests: {report['requests']} ({report['requests_per_second']}/s), "
+          f"{report['mb_per_second']} MB/s over {report['streams']} streams")
+    print(f"Time to first byte (ms): {report['ttfb_ms']}")
+    print(f"Request latency (ms):    {report['latency_ms']}")
+    print(f"Seeks: {report['seeks']}, rebuffers: {report['rebuffers']}")
+    print(f"Error rate: {report['error_rate']:.2%} {report['errors'] or ''}")
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"Report written to {args.output}")
+    
+    return report['error_rate'] <= args.max_error_rate
+
+
 if __name__ == '__main__':
     load_dotenv()
     
+    parser = argparse.ArgumentParser(description='Check or load-test audio streaming')
+    parser.add_argument('--load', action='store_true',
+                        help='Run concurrent simulated listeners instead of the HEAD checks')
+    parser.add_argument('--corpus', default=None,
+                        help='Stream every MP3 under this directory (as served by local_audio_server.py)')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8787',
+                        help='Streaming server for --corpus')
+    parser.add_argument('--resources', type=int, default=100,
+                        help='Resource URLs taken from the database when there is no --corpus')
+    parser.add_argument('--listeners', type=int, default=50,
+                        help='Concurrent simulated listeners')
+    parser.add_argument('--duration', type=float, default=60,
+                        help='Seconds to run')
+    parser.add_argument('--bitrate-kbps', type=int, default=64,
+                        help='Playback rate listeners read at')
+    parser.add_argument('--buffer-seconds', type=float, default=10,
+                        help='Audio fetched per Range request')
+    parser.add_argument('--listen-seconds', type=float, default=120,
+                        help='Playback time spent on a stream before switching')
+    parser.add_argument('--seek-probability', type=float, default=0.1,
+                        help='Chance of seeking before each Range request')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='Playback speed multiplier, to compress a test')
+    parser.add_argument('--timeout', type=float, default=10,
+                        help='Per-request timeout in seconds')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Seed for reproducible listener behaviour')
+    parser.add_argument('--max-error-rate', type=float, default=0.01,
+                        help='Exit 1 if more requests than this fail')
+    parser.add_argument('--output', default=None,
+                        help='Write the load-test report as JSON')
+    args = parser.parse_args()
+    
+    if args.load:
+        sys.exit(0 if run_load_test(args) else 1)
+    
     success = True
     
     # Test streaming URLs
@@ -6,6 +6,7 @@ Batch processes your Grace to You sermons and Word of Promise audio
 
 import os
 import sys
+import time
 from pathlib import Path
 import argparse
 import logging
@@ -17,6 +18,12 @@ from tqdm import tqdm
 sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
 
 from bible_mp3 import AudioUploader, BibleDatabase
+from bible_mp3.journal import DEFAULT_JOURNAL_PATH, BatchJournal
+from bible_mp3.manifest import DEFAULT_MANIFEST_PATH, IngestManifest
+from bible_mp3.metrics import METRICS
+from bible_mp3.profiling import RunProfiler
+from bible_mp3.pool import ConnectionPool
+from bible_mp3.transfer import MB, TransferSettings
 
 
 def setup_logging(verbose: bool = False):
@@ -78,6 +85,37 @@ def main():
                        help='Which collection to process')
     parser.add_argument('--bucket-name', default='bible-audio-storage',
                        help='R2 bucket name')
+    parser.add_argument('--workers', type=int, default=8,
+                       help='Files uploaded concurrently')
+    parser.add_argument('--part-size-mb', type=int, default=16,
+                       help='Multipart part size in MB (minimum 5)')
+    parser.add_argument('--part-concurrency', type=int, default=4,
+                       help='Parts uploaded concurrently per file')
+    parser.add_argument('--max-inflight-mb', type=int, default=512,
+                       help='Cap on upload data held in memory across all workers')
+    parser.add_argument('--max-upload-mbps', type=float, default=None,
+                       help='Cap total upload bandwidth at this many MB per second')
+    parser.add_argument('--fixed-concurrency', action='store_true',
+                       help='Keep workers x part-concurrency requests in flight instead of adapting')
+    parser.add_argument('--manifest', default=str(DEFAULT_MANIFEST_PATH),
+                       help='Local manifest used to skip files unchanged since the last run')
+    parser.add_argument('--no-manifest', action='store_true',
+                       help='Re-upload everything, ignoring the manifest')
+    parser.add_argument('--journal', default=str(DEFAULT_JOURNAL_PATH),
+                       help='Journal recording each file\'s progress through the run')
+    parser.add_argument('--resume', action='store_true',
+                       help='Continue the last interrupted run, retrying only unfinished files')
+    parser.add_argument('--pipeline', action='store_true',
+                       help='Run metadata, upload and database stages concurrently with bounded queues')
+    parser.add_argument('--metrics-json', default='bible_mp3_metrics.json',
+                       help='Where to write per-stage timings and throughput at the end of the run')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                       help='Serve Prometheus metrics on this port at /metrics while the run is going')
+    parser.add_argument('--profile', nargs='?', metavar='DIR',
+                       const=f"profiles/{time.strftime('%Y%m%d-%H%M%S')}",
+                       help='Write cProfile stats per stage, top allocation sites and the slowest files to DIR')
+    parser.add_argument('--profile-slowest', type=int, default=20,
+                       help='Files kept in the profile\'s slowest-files list')
     parser.add_argument('--verbose', '-v', action='store_true',
                        help='Verbose logging')
     
@@ -86,6 +124,8 @@ def main():
     # Setup
     setup_logging(args.verbose)
     logger = logging.getLogger(__name__)
+    if args.metrics_port:
+        METRICS.serve(args.metrics_port)
     
     # Load configuration
     try:
@@ -93,34 +133,57 @@ def main():
     except SystemExit:
         return 1
     
-    # Initialize uploader
+    profiler = RunProfiler(Path(args.profile), slowest=args.profile_slowest) if args.profile else None
+    
+    # Initialize uploader; it shares one connection pool and reference cache with the database helper
     try:
+        pool = ConnectionPool(config['postgres_url'], maxconn=args.workers + 1)
+        db = BibleDatabase(pool=pool)
         uploader = AudioUploader(
             account_id=config['cloudflare_account_id'],
             access_key=config['cloudflare_r2_access_key'],
             secret_key=config['cloudflare_r2_secret_key'],
             bucket_name=args.bucket_name,
-            postgres_url=config['postgres_url']
+            pool=pool,
+            reference=db.reference,
+            endpoint_url=os.getenv('S3_ENDPOINT_URL'),
+            manifest=None if args.no_manifest else IngestManifest(Path(args.manifest)),
+            profiler=profiler,
+            transfer_settings=TransferSettings(
+                max_workers=args.workers,
+                part_size=args.part_size_mb * MB,
+                part_concurrency=args.part_concurrency,
+                max_inflight_bytes=args.max_inflight_mb * MB,
+                adaptive=not args.fixed_concurrency,
+                max_bytes_per_second=args.max_upload_mbps * MB if args.max_upload_mbps else None
+            )
         )
         
-        db = BibleDatabase(config['postgres_url'])
-        
     except Exception as e:
         logger.error(f"Failed to initialize uploader: {e}")
         return 1
     
+    if not db.ensure_schema():
+        return 1
+    
     # Show database stats
     stats = db.get_database_stats()
     logger.info(f"Database stats: {json.dumps(stats, indent=2)}")
     
+    journal = BatchJournal(Path(args.journal))
     results = {"processed": [], "errors": [], "skipped": []}
+    if profiler:
+        profiler.start()
     
     # Process Grace to You sermons
     if args.collection in ['grace-to-you', 'both']:
         grace_path = Path(args.grace_to_you_path)
         if grace_path.exists():
             logger.info(f"Processing Grace to You sermons from: {grace_path}")
-            grace_results = uploader.process_grace_to_you_directory(grace_path, args.test_mode)
+            grace_results = uploader.process_grace_to_you_directory(
+                grace_path, args.test_mode, journal=journal, resume=args.resume,
+                pipeline=args.pipeline
+            )
             
             # Merge results
             results["processed"].extend(grace_results["processed"])
@@ -139,6 +202,11 @@ def main():
         else:
             logger.warning(f"Word of Promise directory not found: {wop_path}")
     
+    if profiler:
+        report_dir = profiler.stop({"collection": args.collection, "pipeline": args.pipeline,
+                                    "workers": args.workers, "processed": len(results['processed'])})
+        print(f"Profile written to {report_dir}")
+    
     # Results summary
     print("\n" + "="*60)
     print("UPLOAD RESULTS")
@@ -162,6 +230,19 @@ def main():
     print(f"\nFinal database stats:")
     print(f"  Audio resources: {final_stats.get('audio_resources', 0)}")
     print(f"  Verse-audio links: {final_stats.get('verse_audio_links', 0)}")
+    print(f"  Audio span links: {final_stats.get('audio_span_links', 0)}")
+    pool.close()
+    
+    METRICS.write_json(Path(args.metrics_json), {
+        "collection": args.collection,
+        "processed": len(results['processed']),
+        "errors": len(results['errors']),
+        "skipped": len(results['skipped'])
+    })
+    print(f"Stage timings written to {args.metrics_json}")
+    
+    if results['errors']:
+        print("\nRe-run with --resume to retry only the files that did not finish")
     
     if args.test_mode:
         print("\n[TEST MODE] - Only 5 files processed for testing")
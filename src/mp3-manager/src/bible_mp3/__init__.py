@@ -6,8 +6,27 @@ For managing Bible audio collections with Cloudflare R2 and PostgreSQL
 __version__ = "1.0.0"
 __author__ = "David Lowe"
 
-from .uploader import AudioUploader
-from .database import BibleDatabase
+import importlib
+
 from .utils import extract_book_from_filename, get_audio_metadata
 
+# Imported on first access: these pull in boto3, psycopg2 and the worker pools,
+# which the filename and metadata helpers do not need
+_LAZY = {
+    "AudioUploader": ".uploader",
+    "BibleDatabase": ".database",
+}
+
 __all__ = ["AudioUploader", "BibleDatabase", "extract_book_from_filename", "get_audio_metadata"]
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
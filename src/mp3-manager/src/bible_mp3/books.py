@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Book name resolution - One compiled index for every way a book is written
+Canonical names, abbreviations, ordinals ("1st", "First", "I") and numbered directory prefixes
+"""
+
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+
+class Book(NamedTuple):
+    order: int
+    name: str
+    abbreviations: Tuple[str, ...]
+
+
+# Canonical names match the `books` table
+BOOKS = (
+    Book(1, "Genesis", ("gen", "gn")),
+    Book(2, "Exodus", ("exod", "exo")),
+    Book(3, "Leviticus", ("lev", "lv")),
+    Book(4, "Numbers", ("num", "nm")),
+    Book(5, "Deuteronomy", ("deut", "dt")),
+    Book(6, "Joshua", ("josh",)),
+    Book(7, "Judges", ("judg", "jdg")),
+    Book(8, "Ruth", ("rth",)),
+    Book(9, "1 Samuel", ("sam", "sm")),
+    Book(10, "2 Samuel", ("sam", "sm")),
+    Book(11, "1 Kings", ("kgs", "kin")),
+    Book(12, "2 Kings", ("kgs", "kin")),
+    Book(13, "1 Chronicles", ("chron", "chr")),
+    Book(14, "2 Chronicles", ("chron", "chr")),
+    Book(15, "Ezra", ("ezr",)),
+    Book(16, "Nehemiah", ("neh",)),
+    Book(17, "Esther", ("esth", "est")),
+    Book(18, "Job", ("jb",)),
+    Book(19, "Psalms", ("psalm", "pss", "psa", "ps")),
+    Book(20, "Proverbs", ("prov", "prv")),
+    Book(21, "Ecclesiastes", ("eccl", "eccles", "ecc", "qoh", "ecclesiast")),
+    Book(22, "Song of Solomon", ("song of songs", "songofsolomon", "songofsongs", "sos", "canticles")),
+    Book(23, "Isaiah", ("isa",)),
+    Book(24, "Jeremiah", ("jer",)),
+    Book(25, "Lamentations", ("lam",)),
+    Book(26, "Ezekiel", ("ezek", "ezk")),
+    Book(27, "Daniel", ("dan", "dn")),
+    Book(28, "Hosea", ("hos",)),
+    Book(29, "Joel", ("jl",)),
+    Book(30, "Amos", ("amo",)),
+    Book(31, "Obadiah", ("obad", "ob")),
+    Book(32, "Jonah", ("jnh",)),
+    Book(33, "Micah", ("mic",)),
+    Book(34, "Nahum", ("nah",)),
+    Book(35, "Habakkuk", ("hab",)),
+    Book(36, "Zephaniah", ("zeph", "zep")),
+    Book(37, "Haggai", ("hag",)),
+    Book(38, "Zechariah", ("zech", "zec")),
+    Book(39, "Malachi", ("mal",)),
+    Book(40, "Matthew", ("matt", "mat", "mt")),
+    Book(41, "Mark", ("mrk", "mk")),
+    Book(42, "Luke", ("luk", "lk")),
+    Book(43, "John", ("jhn", "jn")),
+    Book(44, "Acts", ("acts of the apostles",)),
+    Book(45, "Romans", ("rom", "rm")),
+    Book(46, "1 Corinthians", ("cor",)),
+    Book(47, "2 Corinthians", ("cor",)),
+    Book(48, "Galatians", ("gal",)),
+    Book(49, "Ephesians", ("eph",)),
+    Book(50, "Philippians", ("phil", "php")),
+    Book(51, "Colossians", ("col",)),
+    Book(52, "1 Thessalonians", ("thess", "thes", "th")),
+    Book(53, "2 Thessalonians", ("thess", "thes", "th")),
+    Book(54, "1 Timothy", ("tim", "tm")),
+    Book(55, "2 Timothy", ("tim", "tm")),
+    Book(56, "Titus", ("tit",)),
+    Book(57, "Philemon", ("philem", "phlm", "phm")),
+    Book(58, "Hebrews", ("heb",)),
+    Book(59, "James", ("jas", "jm")),
+    Book(60, "1 Peter", ("pet", "pt")),
+    Book(61, "2 Peter", ("pet", "pt")),
+    Book(62, "1 John", ("jn", "jhn")),
+    Book(63, "2 John", ("jn", "jhn")),
+    Book(64, "3 John", ("jn", "jhn")),
+    Book(65, "Jude", ("jud",)),
+    Book(66, "Revelation", ("revelations", "rev", "rv", "apocalypse")),
+)
+
+BOOKS_BY_ORDER: Dict[int, Book] = {book.order: book for book in BOOKS}
+BOOKS_BY_NAME: Dict[str, Book] = {book.name: book for book in BOOKS}
+
+# Every way a leading book number is written; roman numerals only bind to numbered books
+ORDINALS = {
+    1: ("1", "1st", "first", "i"),
+    2: ("2", "2nd", "second", "ii"),
+    3: ("3", "3rd", "third", "iii"),
+}
+
+_TOKEN = re.compile(r'\d+|[a-z]+')
+_DIRECTORY = re.compile(r'^(\d{1,2})[_\s-]+(.+)$')
+_END = None  # trie key marking a complete book name
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word and number tokens; "1Samuel_03" -> ["1", "samuel", "03"]"""
+    return _TOKEN.findall(text.lower())
+
+
+class BookResolver:
+    """Token trie over every book name variant, matched longest-first"""
+
+    def __init__(self, books: Iterable[Book] = BOOKS):
+        self.books = tuple(books)
+        self.trie: Dict = {}
+        for book in self.books:
+            for variant in self._variants(book):
+                self._insert(tokenize(variant), book)
+
+    @staticmethod
+    def _variants(book: Book) -> List[str]:
+        number, _, base = book.name.partition(' ')
+        if not number.isdigit():
+            return [book.name, *book.abbreviations]
+        # Numbered books: every ordinal spelling in front of the name or an abbreviation
+        stems = [base, *book.abbreviations]
+        return [f"{ordinal} {stem}" for ordinal in ORDINALS[int(number)] for stem in stems]
+
+    def _insert(self, tokens: List[str], book: Book):
+        node = self.trie
+        for token in tokens:
+            node = node.setdefault(token, {})
+        # First registration wins, so canonical names beat later abbreviations
+        node.setdefault(_END, book)
+
+    def _match(self, tokens: List[str]) -> Optional[Book]:
+        trie = self.trie
+        for start in range(len(tokens)):
+            node = trie.get(tokens[start])
+            if node is None:
+                continue
+            found = node.get(_END)
+            for token in tokens[start + 1:]:
+                node = node.get(token)
+                if node is None:
+                    break
+                found = node.get(_END, found)
+            if found is not None:
+                return found
+        return None
+
+    def resolve_book(self, text: str) -> Optional[Book]:
+        """Book named anywhere in a filename, title or directory name"""
+        return self._match(_TOKEN.findall(text.lower()))
+
+    def resolve(self, text: str) -> Optional[str]:
+        """Canonical book name found in text, or None"""
+        book = self._match(_TOKEN.findall(text.lower()))
+        return book.name if book else None
+
+    def resolve_many(self, texts: Iterable[str]) -> List[Optional[str]]:
+        """Resolve a batch of filenames; repeated strings are only matched once"""
+        cache: Dict[str, Optional[str]] = {}
+        findall, match = _TOKEN.findall, self._match
+        results = []
+        for text in texts:
+            name = cache.get(text, cache)
+            if name is cache:
+                book = match(findall(text.lower()))
+                name = cache[text] = book.name if book else None
+            results.append(name)
+        return results
+
+    def resolve_directory(self, dir_name: str) -> Optional[Tuple[str, int]]:
+        """(name, order) for numbered directories like "01_Genesis" or "62_1 John"
+
+        The name wins over the number; the number is used when the name is not recognised.
+        """
+        match = _DIRECTORY.match(dir_name)
+        if not match:
+            return None
+        book = self.resolve_book(match.group(2)) or BOOKS_BY_ORDER.get(int(match.group(1)))
+        return (book.name, book.order) if book else None
+
+
+# Compiled once at import
+RESOLVER = BookResolver()
+
+resolve_book_name = RESOLVER.resolve
+resolve_many = RESOLVER.resolve_many
+resolve_directory = RESOLVER.resolve_directory
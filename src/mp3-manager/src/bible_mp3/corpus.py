@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Synthetic corpus - Valid MP3 files laid out like the audio collections
+MPEG-1 Layer III frames with ID3 tags, in Grace to You and Word of Promise directory shapes
+"""
+
+import random
+import struct
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+import logging
+
+from .books import BOOKS
+from .utils import LAYER_III_BITRATES, SAMPLE_RATES
+
+logger = logging.getLogger(__name__)
+
+SAMPLES_PER_FRAME = 1152
+# Bitrates (kbps) a VBR file moves between
+VBR_BITRATES = (96, 112, 128, 160, 192)
+
+# Directory under the corpus root, speaker/narrator, kbps and channels per collection
+COLLECTIONS = {
+    'grace-to-you': {'dir': 'GraceToYou', 'artist': 'John MacArthur', 'bitrate': 64, 'channels': 1},
+    'word-of-promise': {'dir': 'WordOfPromise', 'artist': 'Word of Promise', 'bitrate': 128, 'channels': 2},
+}
+
+
+class CorpusFile(NamedTuple):
+    """One file of a synthetic collection"""
+    collection: str
+    path: str  # relative to the corpus root
+    book: str
+    chapter: int
+    seconds: float
+    vbr: bool
+
+
+def _frame_header(bitrate: int, sample_rate: int, channels: int, padding: bool) -> bytes:
+    """MPEG-1 Layer III header without CRC"""
+    bitrate_index = LAYER_III_BITRATES[1].index(bitrate)
+    rate_index = SAMPLE_RATES[1].index(sample_rate)
+    mode = 0xC0 if channels == 1 else 0x40  # mono or joint stereo
+    return bytes((0xFF, 0xFB, bitrate_index << 4 | rate_index << 2 | int(padding) << 1, mode))
+
+
+def _frame_length(bitrate: int, sample_rate: int) -> Tuple[int, int]:
+    """(bytes, remainder) of an unpadded frame; remainders accumulate into padding bytes"""
+    return divmod(SAMPLES_PER_FRAME // 8 * bitrate * 1000, sample_rate)
+
+
+def _text_frame(frame_id: str, text: str) -> bytes:
+    body = b'\x00' + text.encode('latin-1', 'replace')
+    return frame_id.encode('ascii') + struct.pack('>I', len(body)) + b'\x00\x00' + body
+
+
+def id3v2_tag(tags: Dict[str, str], padding: int = 256) -> bytes:
+    """ID3v2.3 tag of Latin-1 text frames (TIT2, TPE1, TALB, ...), with zero padding"""
+    body = b''.join(_text_frame(frame_id, text) for frame_id, text in tags.items() if text)
+    body += b'\x00' * padding
+    size = len(body)
+    synchsafe = bytes(((size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F))
+    return b'ID3\x03\x00\x00' + synchsafe + body
+
+
+def id3v1_tag(title: str = '', artist: str = '', album: str = '') -> bytes:
+    """128-byte ID3v1 tag"""
+    def field(text: str, size: int) -> bytes:
+        return text.encode('latin-1', 'replace')[:size].ljust(size, b'\x00')
+    return b'TAG' + field(title, 30) + field(artist, 30) + field(album, 30) + field('', 4) + field('', 30) + b'\xff'
+
+
+def synthetic_mp3(seconds: float,
+                  bitrate: int = 128,
+                  sample_rate: int = 44100,
+                  channels: int = 2,
+                  vbr: bool = False,
+                  tags: Optional[Dict[str, str]] = None,
+                  id3v1: bool = False,
+                  seed: int = 0) -> bytes:
+    """Bytes of a playable-length MP3 stream whose frames every MP3 parser accepts
+
+    Frame payloads are seeded noise, so files differ but regenerate
+    identically. A VBR file starts with a Xing header giving its frame count.
+    """
+    rng = random.Random(seed)
+    noise = rng.randbytes(2048)
+    frame_count = max(1, round(seconds * sample_rate / SAMPLES_PER_FRAME))
+    header_frame = _xing_frame(frame_count, bitrate, sample_rate, channels) if vbr else b''
+
+    frames, remainders = [], {}
+    carried = 0
+    for index in range(frame_count):
+        rate = rng.choice(VBR_BITRATES) if vbr else bitrate
+        if rate not in remainders:
+            remainders[rate] = _frame_length(rate, sample_rate)
+        length, remainder = remainders[rate]
+        carried += remainder
+        padding = carried >= sample_rate
+        if padding:
+            carried -= sample_rate
+        offset = index * 7 % (len(noise) - length)
+        frames.append(_frame_header(rate, sample_rate, channels, padding) + noise[offset:offset + length - 4 + padding])
+
+    data = b''.join(frames)
+    if vbr:
+        data = header_frame + data
+        # Patch the audio size into the Xing header
+        xing = _xing_offset(channels)
+        data = data[:xing + 12] + struct.pack('>I', len(data)) + data[xing + 16:]
+
+    tags = tags or {}
+    prefix = id3v2_tag(tags) if tags else b''
+    suffix = id3v1_tag(tags.get('TIT2', ''), tags.get('TPE1', ''), tags.get('TALB', '')) if id3v1 else b''
+    return prefix + data + suffix
+
+
+def _xing_offset(channels: int) -> int:
+    # Header, then MPEG-1 side information
+    return 4 + (17 if channels == 1 else 32)
+
+
+def _xing_frame(frame_count: int, bitrate: int, sample_rate: int, channels: int) -> bytes:
+    """Silent first frame carrying a Xing header (frames and bytes fields; bytes patched later)"""
+    length, _ = _frame_length(bitrate, sample_rate)
+    frame = bytearray(length)
+    frame[:4] = _frame_header(bitrate, sample_rate, channels, False)
+    xing = _xing_offset(channels)
+    frame[xing:xing + 16] = b'Xing' + struct.pack('>III', 0x3, frame_count, 0)
+    return bytes(frame)
+
+
+def corpus_layout(collection: str,
+                  books: Optional[Iterable[str]] = None,
+                  files_per_book: int = 3,
+                  minutes: Tuple[float, float] = (1.0, 5.0),
+                  vbr_share: float = 0.25,
+                  seed: int = 1) -> List[CorpusFile]:
+    """Files of one collection, named and nested the way the real collection is
+
+    Grace to You: GraceToYou/01_Genesis/GTY_Genesis_001.mp3
+    Word of Promise: WordOfPromise/Old Testament/01 Genesis/01 Genesis 001.mp3
+    """
+    if collection not in COLLECTIONS:
+        raise ValueError(f"Unknown collection: {collection}")
+    rng = random.Random(f"{collection}:{seed}")
+    wanted = set(books) if books else None
+    root = COLLECTIONS[collection]['dir']
+
+    layout = []
+    for book in BOOKS:
+        if wanted is not None and book.name not in wanted:
+            continue
+        for chapter in range(1, files_per_book + 1):
+            if collection == 'grace-to-you':
+                directory = f"{book.order:02d}_{book.name.replace(' ', '_')}"
+                name = f"GTY_{book.name.replace(' ', '_')}_{chapter:03d}.mp3"
+                path = f"{root}/{directory}/{name}"
+            else:
+                testament = 'Old Testament' if book.order <= 39 else 'New Testament'
+                stem = f"{book.order:02d} {book.name}"
+                path = f"{root}/{testament}/{stem}/{stem} {chapter:03d}.mp3"
+            layout.append(CorpusFile(collection, path, book.name, chapter,
+                                     round(rng.uniform(*minutes) * 60, 1), rng.random() < vbr_share))
+    return layout
+
+
+def write_corpus_file(root: Path, entry: CorpusFile, seed: int = 1) -> int:
+    """Write one corpus file, returning its size"""
+    settings = COLLECTIONS[entry.collection]
+    data = synthetic_mp3(
+        entry.seconds,
+        bitrate=settings['bitrate'],
+        channels=settings['channels'],
+        vbr=entry.vbr,
+        tags={'TIT2': f"{entry.book} {entry.chapter}", 'TPE1': settings['artist'], 'TALB': entry.book},
+        id3v1=entry.chapter % 2 == 0,
+        seed=zlib.crc32(f"{seed}:{entry.path}".encode())
+    )
+    target = Path(root) / entry.path
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.write_bytes(data)
+    return len(data)
+
+
+def generate_corpus(root: Path,
+                    collections: Iterable[str] = ('grace-to-you', 'word-of-promise'),
+                    books: Optional[Iterable[str]] = None,
+                    files_per_book: int = 3,
+                    minutes: Tuple[float, float] = (1.0, 5.0),
+                    vbr_share: float = 0.25,
+                    seed: int = 1) -> Dict:
+    """Write synthetic collections under root
+
+    Returns the file count, total bytes and each collection's directory.
+    The same arguments always produce the same files.
+    """
+    root = Path(root)
+    books = list(books) if books else None
+    summary = {'root': str(root), 'files': 0, 'bytes': 0, 'collections': {}}
+    for collection in collections:
+        layout = corpus_layout(collection, books, files_per_book, minutes, vbr_share, seed)
+        size = sum(write_corpus_file(root, entry, seed) for entry in layout)
+        summary['collections'][collection] = {
+            'path': str(root / COLLECTIONS[collection]['dir']),
+            'files': len(layout),
+            'bytes': size,
+            'seconds': round(sum(entry.seconds for entry in layout), 1),
+        }
+        summary['files'] += len(layout)
+        summary['bytes'] += size
+        logger.info(f"Wrote {len(layout)} {collection} files ({size / 1024 / 1024:.1f} MB)")
+    return summary
@@ -5,26 +5,294 @@ Handles PostgreSQL operations and Bible-specific data structures
 """
 
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from typing import Dict, List, Optional, Tuple
+import psycopg2.extensions
+import psycopg2.extras
+from psycopg2.extras import NamedTupleCursor, RealDictCursor
+from typing import Dict, Iterator, List, Optional, Tuple
 import logging
 
+from .pool import ConnectionPool
+from .reference import ReferenceCache
+from .schema import check_query_plans, migrate
+from .stats import ensure_catalog_stats, exact_counts, read_catalog_stats, recount_catalog_stats
+from .writer import resource_row, upsert_resources
+
 logger = logging.getLogger(__name__)
 
+# Verses are addressed by a canonical ordinal BBCCCVVV (book order, chapter, verse),
+# so a contiguous passage is a single [start, end] range
+BOOK_STRIDE = 1000000
+CHAPTER_STRIDE = 1000
+
+VERSE_ORDINAL_SQL = "(b.book_order * 1000000 + c.chapter_number * 1000 + v.verse_number)"
+
+# Queries with both a list and a streaming variant
+BOOKS_SQL = """
+    SELECT id, name, abbreviation, testament, book_order, chapter_count
+    FROM books
+    ORDER BY book_order
+"""
+
+VERSES_BY_BOOK_SQL = """
+    SELECT v.id, v.verse_number, c.chapter_number, v.text
+    FROM verses v
+    JOIN chapters c ON c.id = v.chapter_id
+    WHERE v.book_id = %s
+    ORDER BY c.chapter_number, v.verse_number
+"""
+
+AUDIO_BY_BOOK_SQL = f"""
+    SELECT r.id, r.title, r.url, r.meta, r.created_at
+    FROM resources r
+    WHERE r.type = 'audio' AND r.id IN (
+        SELECT s.resource_id
+        FROM books b
+        JOIN resource_span_link s
+            ON int4range(s.start_ordinal, s.end_ordinal, '[]')
+               && int4range(b.book_order * {BOOK_STRIDE},
+                            b.book_order * {BOOK_STRIDE} + {BOOK_STRIDE - 1}, '[]')
+        WHERE b.name = %s
+        UNION
+        SELECT vrl.resource_id
+        FROM verse_resource_link vrl
+        JOIN verses v ON v.id = vrl.verse_id
+        JOIN books b ON b.id = v.book_id
+        WHERE b.name = %s
+    )
+    ORDER BY r.created_at
+"""
+
+# Uses the denormalized resources.book_id (schema migration 4)
+AUDIO_FILED_UNDER_BOOK_SQL = """
+    SELECT r.id, r.title, r.url, r.meta, r.created_at
+    FROM resources r
+    JOIN books b ON b.id = r.book_id
+    WHERE b.name = %s AND r.type = 'audio'
+    ORDER BY r.created_at
+"""
+
+AUDIO_FOR_VERSE_SQL = f"""
+    WITH target AS (
+        SELECT {VERSE_ORDINAL_SQL} AS ordinal
+        FROM verses v
+        JOIN books b ON b.id = v.book_id
+        JOIN chapters c ON c.id = v.chapter_id
+        WHERE v.id = %s
+    )
+    SELECT r.id, r.title, r.url, r.meta, s.label, s.relevance
+    FROM target
+    JOIN resource_span_link s
+        ON int4range(s.start_ordinal, s.end_ordinal, '[]') @> target.ordinal
+    JOIN resources r ON r.id = s.resource_id
+    WHERE r.type = 'audio'
+    ORDER BY s.relevance DESC, r.title
+"""
+
+AUDIO_FOR_REFERENCE_SQL = f"""
+    SELECT r.id, r.title, r.url, r.meta, s.label, s.relevance
+    FROM books b
+    JOIN resource_span_link s
+        ON int4range(s.start_ordinal, s.end_ordinal, '[]')
+           @> (b.book_order * {BOOK_STRIDE} + %s * {CHAPTER_STRIDE} + %s)
+    JOIN resources r ON r.id = s.resource_id
+    WHERE b.name = %s AND r.type = 'audio'
+    ORDER BY s.relevance DESC, r.title
+"""
+
+RESOURCES_BY_TYPE_SQL = """
+    SELECT id, type, title, url, local_path, file_size, mime_type, meta, created_at
+    FROM resources
+    WHERE type = %s
+    ORDER BY created_at, id
+"""
+
+# Bucket key of each resource, in the byte order list_objects_v2 returns keys in.
+# Rows from the batch uploader keep the key in meta rather than local_path.
+RESOURCE_OBJECTS_SQL = """
+    SELECT r2_key, id, file_size, meta->>'etag' AS etag, meta->>'original_path' AS original_path
+    FROM (
+        SELECT COALESCE(local_path, meta->>'r2_key') COLLATE "C" AS r2_key, id, file_size, meta
+        FROM resources
+        WHERE type = %s
+    ) r
+    WHERE r2_key LIKE %s
+    ORDER BY r2_key
+"""
+
+# Read queries checked by check_query_plans, with representative parameters
+CHECKED_QUERIES = [
+    ('books', BOOKS_SQL, ()),
+    ('verses_by_book', VERSES_BY_BOOK_SQL, (1,)),
+    ('audio_by_book', AUDIO_BY_BOOK_SQL, ('John', 'John')),
+    ('audio_filed_under_book', AUDIO_FILED_UNDER_BOOK_SQL, ('John',)),
+    ('audio_for_verse', AUDIO_FOR_VERSE_SQL, (1,)),
+    ('audio_for_reference', AUDIO_FOR_REFERENCE_SQL, (3, 16, 'John')),
+    ('resources_by_type', RESOURCES_BY_TYPE_SQL, ('audio',)),
+    ('resource_objects', RESOURCE_OBJECTS_SQL, ('audio', 'audio/%')),
+]
+
+# Row shapes for the iter_* methods; tuples and namedtuples skip building a dict per row
+ROW_TYPES = {
+    'dict': RealDictCursor,
+    'namedtuple': NamedTupleCursor,
+    'tuple': psycopg2.extensions.cursor,
+}
+
+
+def verse_ordinal(book_order: int, chapter: int = 0, verse: int = 0) -> int:
+    """Canonical ordinal for a verse reference"""
+    return book_order * BOOK_STRIDE + chapter * CHAPTER_STRIDE + verse
+
+
+def span_bounds(book_order: int,
+                start_chapter: Optional[int] = None,
+                start_verse: Optional[int] = None,
+                end_chapter: Optional[int] = None,
+                end_verse: Optional[int] = None) -> Tuple[int, int]:
+    """Ordinal range for a whole book, a chapter range or a verse range"""
+    if start_chapter is None:
+        return verse_ordinal(book_order), verse_ordinal(book_order) + BOOK_STRIDE - 1
+    
+    end_chapter = end_chapter if end_chapter is not None else start_chapter
+    start = verse_ordinal(book_order, start_chapter, start_verse or 0)
+    if end_verse is None:
+        end = verse_ordinal(book_order, end_chapter) + CHAPTER_STRIDE - 1
+    else:
+        end = verse_ordinal(book_order, end_chapter, end_verse)
+    if start > end:
+        raise ValueError(f"Span starts after it ends: {start} > {end}")
+    return start, end
+
+
+def insert_book_span(cursor,
+                     resource_id: str,
+                     book_id: Optional[int] = None,
+                     book_name: Optional[str] = None,
+                     label: str = "Audio commentary",
+                     relevance: float = 0.8,
+                     audio_type: Optional[str] = None,
+                     meta: Optional[Dict] = None,
+                     book_order: Optional[int] = None) -> bool:
+    """Link a resource to a whole book with a single span row
+    
+    With audio_type, the label is derived on the server the same way as
+    insert_book_links. Given book_order (e.g. from the reference cache) the
+    books table is not read. Returns False when the book does not exist.
+    """
+    if book_id is None and book_name is None and book_order is None:
+        raise ValueError("book_id, book_name or book_order is required")
+    
+    label_sql = "initcap(replace(%(audio_type)s, '_', ' ')) || ' audio'" if audio_type else "%(label)s"
+    if book_order is not None:
+        start, end = span_bounds(book_order)
+        source = f"SELECT %(resource_id)s, {start}, {end}, {label_sql}, %(relevance)s, %(meta)s"
+    else:
+        where = "b.id = %(book_id)s" if book_id is not None else "b.name = %(book_name)s"
+        source = f"""SELECT %(resource_id)s, b.book_order * {BOOK_STRIDE}, b.book_order * {BOOK_STRIDE} + {BOOK_STRIDE - 1},
+               {label_sql}, %(relevance)s, %(meta)s
+        FROM books b
+        WHERE {where}"""
+    
+    cursor.execute(f"""
+        INSERT INTO resource_span_link (resource_id, start_ordinal, end_ordinal, label, relevance, meta)
+        {source}
+        ON CONFLICT (resource_id, start_ordinal, end_ordinal) DO UPDATE SET
+            label = EXCLUDED.label,
+            relevance = EXCLUDED.relevance,
+            meta = EXCLUDED.meta
+    """, {
+        'resource_id': resource_id,
+        'book_id': book_id,
+        'book_name': book_name,
+        'label': label,
+        'relevance': relevance,
+        'audio_type': audio_type,
+        'meta': psycopg2.extras.Json(meta or {})
+    })
+    return cursor.rowcount > 0
+
+
+def insert_book_links(cursor,
+                      resource_id: str,
+                      book_id: Optional[int] = None,
+                      book_name: Optional[str] = None,
+                      label: str = "Audio commentary",
+                      relevance: float = 0.8,
+                      audio_type: Optional[str] = None,
+                      with_link_ids: bool = False,
+                      meta: Optional[Dict] = None) -> Tuple[int, int]:
+    """Link a resource to every verse of a book in one statement
+    
+    The verse set is selected on the server, so no verse ids travel to the
+    client. With audio_type, the label is derived on the server ("Sermon audio",
+    "Bible Reading audio"). With with_link_ids, link ids are generated on the
+    server as VRL-<first 12 hex of md5("<verse_id>-<resource_id>")>.
+    
+    Returns (verses in the book, links created).
+    """
+    if book_id is None and book_name is None:
+        raise ValueError("book_id or book_name is required")
+    
+    columns = ["verse_id", "resource_id", "label", "relevance"]
+    values = ["t.id", "%(resource_id)s", "%(label)s", "%(relevance)s"]
+    if audio_type:
+        values[2] = "initcap(replace(%(audio_type)s, '_', ' ')) || ' audio'"
+    if with_link_ids:
+        columns.insert(0, "id")
+        values.insert(0, "'VRL-' || left(md5(t.id::text || '-' || %(resource_id)s), 12)")
+    if meta is not None:
+        columns.append("meta")
+        values.append("%(meta)s")
+    
+    if book_id is not None:
+        target = "SELECT v.id FROM verses v WHERE v.book_id = %(book_id)s"
+    else:
+        target = ("SELECT v.id FROM verses v JOIN books b ON b.id = v.book_id "
+                  "WHERE b.name = %(book_name)s")
+    
+    cursor.execute(f"""
+        WITH t AS ({target}),
+        inserted AS (
+            INSERT INTO verse_resource_link ({', '.join(columns)})
+            SELECT {', '.join(values)} FROM t
+            ON CONFLICT DO NOTHING
+            RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM t) AS verses, (SELECT COUNT(*) FROM inserted) AS linked
+    """, {
+        'resource_id': resource_id,
+        'book_id': book_id,
+        'book_name': book_name,
+        'label': label,
+        'relevance': relevance,
+        'audio_type': audio_type,
+        'meta': psycopg2.extras.Json(meta) if meta is not None else None
+    })
+    row = cursor.fetchone()
+    if isinstance(row, dict):
+        return row['verses'], row['linked']
+    return row[0], row[1]
+
 
 class BibleDatabase:
     """Database interface for Bible study system"""
     
-    def __init__(self, postgres_url: str):
-        self.db_conn = psycopg2.connect(postgres_url, cursor_factory=RealDictCursor)
+    def __init__(self,
+                 postgres_url: Optional[str] = None,
+                 pool: Optional[ConnectionPool] = None,
+                 reference: Optional[ReferenceCache] = None):
+        if pool is None and postgres_url is None:
+            raise ValueError("postgres_url or pool is required")
+        # A pool passed in is shared (e.g. with AudioUploader) and closed by its owner
+        self._owns_pool = pool is None
+        self.pool = pool or ConnectionPool(postgres_url)
+        # Books and verse ids, loaded once and shared with AudioUploader
+        self.reference = reference or ReferenceCache(self.pool)
     
     def get_book_id_by_name(self, book_name: str) -> Optional[int]:
         """Get book ID from book name"""
         try:
-            with self.db_conn.cursor() as cursor:
-                cursor.execute("SELECT id FROM books WHERE name = %s", (book_name,))
-                result = cursor.fetchone()
-                return result['id'] if result else None
+            return self.reference.book_id(book_name)
         except Exception as e:
             logger.error(f"Failed to get book ID for {book_name}: {e}")
             return None
@@ -32,33 +300,56 @@ class BibleDatabase:
     def get_all_books(self) -> List[Dict]:
         """Get all books with their metadata"""
         try:
-            with self.db_conn.cursor() as cursor:
-                cursor.execute("""
-                    SELECT id, name, abbreviation, testament, book_order, chapter_count
-                    FROM books 
-                    ORDER BY book_order
-                """)
-                return cursor.fetchall()
+            return self.reference.books()
         except Exception as e:
             logger.error(f"Failed to get books: {e}")
             return []
     
+    def get_verse_ids(self, book_id: int, chapter: Optional[int] = None) -> List[int]:
+        """Verse ids of a book, or one of its chapters, in canonical order"""
+        try:
+            return self.reference.verse_ids(book_id, chapter).tolist()
+        except Exception as e:
+            logger.error(f"Failed to get verse ids for book {book_id}: {e}")
+            return []
+    
     def get_verses_by_book(self, book_id: int) -> List[Dict]:
         """Get all verses for a specific book"""
         try:
-            with self.db_conn.cursor() as cursor:
-                cursor.execute("""
-                    SELECT v.id, v.verse_number, c.chapter_number, v.text
-                    FROM verses v
-                    JOIN chapters c ON c.id = v.chapter_id
-                    WHERE v.book_id = %s
-                    ORDER BY c.chapter_number, v.verse_number
-                """, (book_id,))
+            with self.pool.cursor() as cursor:
+                cursor.execute(VERSES_BY_BOOK_SQL, (book_id,))
                 return cursor.fetchall()
         except Exception as e:
             logger.error(f"Failed to get verses for book {book_id}: {e}")
             return []
     
+    def iter_verses_by_book(self, book_id: int, itersize: int = 2000, row_type: str = 'dict') -> Iterator:
+        """Stream a book's verses from a server-side cursor (row_type: dict, tuple or namedtuple)"""
+        return self._stream(VERSES_BY_BOOK_SQL, (book_id,), itersize, row_type)
+    
+    def iter_books(self, itersize: int = 2000, row_type: str = 'dict') -> Iterator:
+        """Stream books straight from the database, bypassing the reference cache"""
+        return self._stream(BOOKS_SQL, None, itersize, row_type)
+    
+    def iter_resources(self, resource_type: str = 'audio', itersize: int = 2000, row_type: str = 'dict') -> Iterator:
+        """Stream every resource of a type, oldest first"""
+        return self._stream(RESOURCES_BY_TYPE_SQL, (resource_type,), itersize, row_type)
+    
+    def iter_resource_objects(self, prefix: str = '', resource_type: str = 'audio',
+                              itersize: int = 2000, row_type: str = 'tuple') -> Iterator:
+        """Stream (r2_key, id, file_size, etag, original_path) for resources under a key prefix, sorted by key"""
+        pattern = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        return self._stream(RESOURCE_OBJECTS_SQL, (resource_type, pattern), itersize, row_type)
+    
+    def _stream(self, query: str, params, itersize: int, row_type: str) -> Iterator:
+        if row_type not in ROW_TYPES:
+            raise ValueError(f"Unknown row_type {row_type!r}; expected one of {sorted(ROW_TYPES)}")
+        try:
+            yield from self.pool.stream(query, params, itersize, ROW_TYPES[row_type])
+        except psycopg2.Error as e:
+            logger.error(f"Streaming query failed: {e}")
+            raise
+    
     def create_resource(self, 
                        resource_id: str,
                        title: str,
@@ -66,103 +357,269 @@ class BibleDatabase:
                        resource_type: str = 'audio',
                        metadata: Dict = None) -> bool:
         """Create a new resource record"""
+        return bool(self.create_resources([resource_row(resource_id, title, url, resource_type, meta=metadata)]))
+    
+    def create_resources(self, rows: List[Tuple]) -> List[str]:
+        """Create or update many resource records (built with resource_row) in one statement"""
         try:
-            with self.db_conn.cursor() as cursor:
-                cursor.execute("""
-                    INSERT INTO resources (id, type, title, url, meta, created_at)
-                    VALUES (%s, %s, %s, %s, %s, NOW())
-                    ON CONFLICT (id) DO UPDATE SET
-                        title = EXCLUDED.title,
-                        url = EXCLUDED.url,
-                        meta = EXCLUDED.meta
-                """, (
-                    resource_id,
-                    resource_type,
-                    title,
-                    url,
-                    psycopg2.extras.Json(metadata or {})
-                ))
-                self.db_conn.commit()
-                return True
+            with self.pool.cursor() as cursor:
+                return upsert_resources(cursor, rows)
         except Exception as e:
-            logger.error(f"Failed to create resource {resource_id}: {e}")
-            self.db_conn.rollback()
-            return False
+            logger.error(f"Failed to create {len(rows)} resources: {e}")
+            return []
     
     def link_resource_to_verses(self, 
                                resource_id: str,
                                verse_ids: List[int],
                                label: str = "Audio commentary",
-                               relevance: float = 0.8) -> bool:
-        """Link a resource to multiple verses"""
+                               relevance: float = 0.8) -> int:
+        """Link a resource to multiple verses; returns the links created (existing ones are skipped)"""
         try:
-            with self.db_conn.cursor() as cursor:
-                for verse_id in verse_ids:
-                    cursor.execute("""
-                        INSERT INTO verse_resource_link (verse_id, resource_id, label, relevance)
-                        VALUES (%s, %s, %s, %s)
-                        ON CONFLICT DO NOTHING
-                    """, (verse_id, resource_id, label, relevance))
+            with self.pool.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO verse_resource_link (verse_id, resource_id, label, relevance)
+                    SELECT verse_id, %s, %s, %s FROM unnest(%s::integer[]) AS verse_id
+                    ON CONFLICT DO NOTHING
+                """, (resource_id, label, relevance, list(verse_ids)))
+                linked = cursor.rowcount
                 
-                self.db_conn.commit()
-                logger.info(f"Linked resource {resource_id} to {len(verse_ids)} verses")
-                return True
+                logger.info(f"Linked resource {resource_id} to {linked} of {len(verse_ids)} verses")
+                return linked
         except Exception as e:
             logger.error(f"Failed to link resource {resource_id} to verses: {e}")
-            self.db_conn.rollback()
-            return False
+            return 0
+    
+    def link_resource_to_book(self,
+                              resource_id: str,
+                              book_id: int,
+                              label: str = "Audio commentary",
+                              relevance: float = 0.8,
+                              per_verse: bool = False) -> int:
+        """Link a resource to every verse in a book
+        
+        Writes one span row by default; per_verse fans out into
+        verse_resource_link instead. Returns the rows created.
+        """
+        try:
+            with self.pool.cursor() as cursor:
+                if per_verse:
+                    verse_count, linked = insert_book_links(
+                        cursor, resource_id, book_id=book_id, label=label, relevance=relevance
+                    )
+                    logger.info(f"Linked resource {resource_id} to {linked} of {verse_count} verses")
+                else:
+                    book = self.reference.book_by_id(book_id)
+                    if not book:
+                        logger.warning(f"Book {book_id} not found in database")
+                        return 0
+                    linked = int(insert_book_span(
+                        cursor, resource_id, book_id=book_id, label=label, relevance=relevance,
+                        book_order=book['book_order']
+                    ))
+                    logger.info(f"Linked resource {resource_id} to book {book_id} as a span")
+                return linked
+        except Exception as e:
+            logger.error(f"Failed to link resource {resource_id} to book {book_id}: {e}")
+            return 0
     
-    def get_audio_resources_by_book(self, book_name: str) -> List[Dict]:
-        """Get all audio resources linked to a specific book"""
+    def link_resource_to_span(self,
+                              resource_id: str,
+                              book_id: int,
+                              start_chapter: Optional[int] = None,
+                              start_verse: Optional[int] = None,
+                              end_chapter: Optional[int] = None,
+                              end_verse: Optional[int] = None,
+                              label: str = "Audio commentary",
+                              relevance: float = 0.8) -> bool:
+        """Link a resource to a book, chapter range or verse range"""
         try:
-            with self.db_conn.cursor() as cursor:
+            book = self.reference.book_by_id(book_id)
+            if not book:
+                logger.warning(f"Book {book_id} not found in database")
+                return False
+            
+            with self.pool.cursor() as cursor:
+                start, end = span_bounds(book['book_order'], start_chapter, start_verse,
+                                         end_chapter, end_verse)
                 cursor.execute("""
-                    SELECT DISTINCT r.id, r.title, r.url, r.meta, r.created_at
-                    FROM resources r
-                    JOIN verse_resource_link vrl ON vrl.resource_id = r.id
-                    JOIN verses v ON v.id = vrl.verse_id
-                    JOIN books b ON b.id = v.book_id
-                    WHERE r.type = 'audio' AND b.name = %s
-                    ORDER BY r.created_at
-                """, (book_name,))
+                    INSERT INTO resource_span_link (resource_id, start_ordinal, end_ordinal, label, relevance)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (resource_id, start_ordinal, end_ordinal) DO UPDATE SET
+                        label = EXCLUDED.label,
+                        relevance = EXCLUDED.relevance
+                """, (resource_id, start, end, label, relevance))
+                return True
+        except Exception as e:
+            logger.error(f"Failed to link resource {resource_id} to span: {e}")
+            return False
+    
+    def get_audio_for_verse(self, verse_id: int) -> List[Dict]:
+        """Get audio resources whose spans cover a verse"""
+        try:
+            with self.pool.cursor() as cursor:
+                cursor.execute(AUDIO_FOR_VERSE_SQL, (verse_id,))
+                return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Failed to get audio for verse {verse_id}: {e}")
+            return []
+    
+    def get_audio_for_reference(self, book_name: str, chapter: int, verse: int) -> List[Dict]:
+        """Get audio resources whose spans cover a book/chapter/verse reference"""
+        try:
+            with self.pool.cursor() as cursor:
+                cursor.execute(AUDIO_FOR_REFERENCE_SQL, (chapter, verse, book_name))
+                return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Failed to get audio for {book_name} {chapter}:{verse}: {e}")
+            return []
+    
+    def get_audio_resources_by_book(self, book_name: str, filed_only: bool = False) -> List[Dict]:
+        """Get all audio resources linked to a specific book
+        
+        filed_only returns just the resources filed under the book (their
+        resources.book_id), from one index range instead of joining every link.
+        """
+        try:
+            with self.pool.cursor() as cursor:
+                if filed_only:
+                    cursor.execute(AUDIO_FILED_UNDER_BOOK_SQL, (book_name,))
+                else:
+                    cursor.execute(AUDIO_BY_BOOK_SQL, (book_name, book_name))
                 return cursor.fetchall()
         except Exception as e:
             logger.error(f"Failed to get audio resources for book {book_name}: {e}")
             return []
     
-    def get_database_stats(self) -> Dict:
-        """Get statistics about the database content"""
+    def iter_audio_resources_by_book(self, book_name: str, itersize: int = 2000, row_type: str = 'dict',
+                                     filed_only: bool = False) -> Iterator:
+        """Stream the audio resources linked to a book from a server-side cursor"""
+        if filed_only:
+            return self._stream(AUDIO_FILED_UNDER_BOOK_SQL, (book_name,), itersize, row_type)
+        return self._stream(AUDIO_BY_BOOK_SQL, (book_name, book_name), itersize, row_type)
+    
+    def ensure_schema(self, target: Optional[int] = None) -> bool:
+        """Apply any pending schema migrations (span links, statistics, indexes)"""
         try:
-            with self.db_conn.cursor() as cursor:
-                stats = {}
-                
-                # Count books
-                cursor.execute("SELECT COUNT(*) as count FROM books")
-                stats['books'] = cursor.fetchone()['count']
-                
-                # Count verses
-                cursor.execute("SELECT COUNT(*) as count FROM verses")
-                stats['verses'] = cursor.fetchone()['count']
-                
-                # Count audio resources
-                cursor.execute("SELECT COUNT(*) as count FROM resources WHERE type = 'audio'")
-                stats['audio_resources'] = cursor.fetchone()['count']
-                
-                # Count verse-audio links
-                cursor.execute("""
-                    SELECT COUNT(*) as count 
-                    FROM verse_resource_link vrl
-                    JOIN resources r ON r.id = vrl.resource_id
-                    WHERE r.type = 'audio'
-                """)
-                stats['verse_audio_links'] = cursor.fetchone()['count']
+            for migration in migrate(self.pool, target):
+                logger.info(f"Applied schema migration {migration.version}: {migration.name}")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to migrate database schema: {e}")
+            return False
+    
+    def check_query_plans(self, min_rows: int = 1000) -> List[Dict]:
+        """EXPLAIN the built-in read queries and report sequential scans of large tables"""
+        with self.pool.cursor() as cursor:
+            return check_query_plans(cursor, CHECKED_QUERIES, min_rows)
+    
+    def collapse_verse_links_to_spans(self,
+                                      resource_type: str = 'audio',
+                                      batch_size: int = 100,
+                                      delete_fanout: bool = True) -> Dict:
+        """Migrate per-verse fan-out rows into span rows
+        
+        Contiguous runs of linked verses (in canonical verse order) within a
+        book with the same label and relevance become one span. Each batch of resources is
+        migrated in its own transaction.
+        """
+        stats = {'resources': 0, 'spans_created': 0, 'fanout_deleted': 0}
+        
+        with self.pool.cursor() as cursor:
+            cursor.execute("""
+                SELECT DISTINCT vrl.resource_id
+                FROM verse_resource_link vrl
+                JOIN resources r ON r.id = vrl.resource_id
+                WHERE r.type = %s
+                ORDER BY vrl.resource_id
+            """, (resource_type,))
+            resource_ids = [row['resource_id'] for row in cursor.fetchall()]
+        
+        for start in range(0, len(resource_ids), batch_size):
+            batch = resource_ids[start:start + batch_size]
+            try:
+                with self.pool.cursor() as cursor:
+                    cursor.execute(f"""
+                        WITH seq AS (
+                            SELECT v.id AS verse_id,
+                                   {VERSE_ORDINAL_SQL} AS ordinal,
+                                   dense_rank() OVER (ORDER BY {VERSE_ORDINAL_SQL}) AS n
+                            FROM verses v
+                            JOIN books b ON b.id = v.book_id
+                            JOIN chapters c ON c.id = v.chapter_id
+                        ),
+                        links AS (
+                            SELECT l.resource_id, l.label, l.relevance, s.ordinal,
+                                   s.ordinal / {BOOK_STRIDE} AS book_order,
+                                   s.n - dense_rank() OVER (
+                                       PARTITION BY l.resource_id, l.label, l.relevance,
+                                                    s.ordinal / {BOOK_STRIDE}
+                                       ORDER BY s.n
+                                   ) AS island
+                            FROM verse_resource_link l
+                            JOIN seq s ON s.verse_id = l.verse_id
+                            WHERE l.resource_id = ANY(%(batch)s)
+                        ),
+                        spans AS (
+                            INSERT INTO resource_span_link
+                                (resource_id, start_ordinal, end_ordinal, label, relevance, meta)
+                            SELECT resource_id, MIN(ordinal), MAX(ordinal), label, relevance,
+                                   '{{"collapsed_from_verse_links": true}}'::jsonb
+                            FROM links
+                            GROUP BY resource_id, label, relevance, book_order, island
+                            ON CONFLICT (resource_id, start_ordinal, end_ordinal) DO NOTHING
+                            RETURNING 1
+                        )
+                        SELECT COUNT(*) AS count FROM spans
+                    """, {'batch': batch})
+                    stats['spans_created'] += cursor.fetchone()['count']
+                    
+                    if delete_fanout:
+                        cursor.execute(
+                            "DELETE FROM verse_resource_link WHERE resource_id = ANY(%s)", (batch,)
+                        )
+                        stats['fanout_deleted'] += cursor.rowcount
                 
-                return stats
+                # The batch was committed when its cursor block exited
+                stats['resources'] += len(batch)
+                logger.info(f"Collapsed links for {stats['resources']}/{len(resource_ids)} resources")
+            except Exception as e:
+                logger.error(f"Failed to collapse links for batch starting at {batch[0]}: {e}")
+        
+        return stats
+    
+    def get_database_stats(self) -> Dict:
+        """Get statistics about the database content
+        
+        Reads the trigger-maintained counters; falls back to counting the
+        tables if they have not been installed yet.
+        """
+        try:
+            with self.pool.cursor() as cursor:
+                cursor.execute("SELECT to_regclass('catalog_stats') IS NOT NULL AS installed")
+                if cursor.fetchone()['installed']:
+                    stats = read_catalog_stats(cursor)
+                    if stats:
+                        return stats
+                return exact_counts(cursor)
         except Exception as e:
             logger.error(f"Failed to get database stats: {e}")
             return {}
     
+    def recount_database_stats(self) -> Dict:
+        """Reset the statistics counters to exact counts, returning them"""
+        try:
+            with self.pool.cursor() as cursor:
+                ensure_catalog_stats(cursor)
+                return recount_catalog_stats(cursor)
+        except Exception as e:
+            logger.error(f"Failed to recount database stats: {e}")
+            return {}
+    
+    def close(self):
+        """Close the connection pool if this instance created it"""
+        if getattr(self, '_owns_pool', False):
+            self.pool.close()
+    
     def __del__(self):
-        """Cleanup database connection"""
-        if hasattr(self, 'db_conn'):
-            self.db_conn.close()
+        """Cleanup database connections"""
+        self.close()
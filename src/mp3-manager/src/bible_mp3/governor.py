@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Upload governor - Adaptive concurrency and a bandwidth cap for R2 uploads
+Concurrency follows AIMD on measured throughput, latency and errors; a token bucket caps bytes per second
+"""
+
+import threading
+import time
+from typing import Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# Fraction of requests in a round that may fail before concurrency is halved
+ERROR_THRESHOLD = 0.05
+# Seconds per MB this many times the best seen means requests are queueing
+LATENCY_FACTOR = 2.0
+# Throughput must hold within this fraction of the last round to keep growing
+THROUGHPUT_SLACK = 0.10
+
+# Request timeouts derived from observed speed
+MIN_TIMEOUT = 60.0
+MAX_TIMEOUT = 3600.0
+DEFAULT_TIMEOUT = 300.0
+
+
+class TokenBucket:
+    """Global bytes-per-second cap shared by every upload thread
+
+    Callers take what they are about to send up front and sleep off any
+    debt, so the long-run rate stays at the cap however many threads send.
+    """
+
+    def __init__(self, rate: Optional[float], burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst or rate or 0
+        self._tokens = self.burst
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited = 0.0
+
+    def consume(self, amount: int) -> float:
+        """Take amount bytes, sleeping until the bucket can cover them; returns seconds slept"""
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            self._tokens -= amount
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.waited += delay
+        if delay:
+            time.sleep(delay)
+        return delay
+
+
+class UploadGovernor:
+    """Decides how many upload requests may be in flight, and how fast they may send
+
+    Every body-carrying request (a PUT or an upload part) goes through
+    acquire() and release(). Once per round, that is once per `limit`
+    completed requests, the limit is adjusted:
+
+    - more than ERROR_THRESHOLD of the round failed: halve it
+    - seconds per MB rose past LATENCY_FACTOR times the best seen while
+      throughput did not grow: halve it, the link is saturated
+    - throughput held up: add one
+
+    The round after a cut only measures, since its requests were mostly
+    started under the old limit. With adaptive=False the limit stays at
+    max_concurrency.
+    """
+
+    def __init__(self,
+                 max_concurrency: int,
+                 initial_concurrency: Optional[int] = None,
+                 min_concurrency: int = 1,
+                 max_bytes_per_second: Optional[float] = None,
+                 adaptive: bool = True):
+        if min_concurrency < 1 or max_concurrency < min_concurrency:
+            raise ValueError("need 1 <= min_concurrency <= max_concurrency")
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.adaptive = adaptive
+        initial = initial_concurrency if adaptive and initial_concurrency else max_concurrency
+        self.limit = max(min_concurrency, min(initial, max_concurrency))
+        self.bucket = TokenBucket(max_bytes_per_second)
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+        # Totals for the run
+        self.requests = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.adjustments = 0
+        self._started = time.monotonic()
+
+        # Current round
+        self._round_start = self._started
+        self._round = {"requests": 0, "errors": 0, "bytes": 0, "seconds": 0.0}
+        self.throughput = 0.0
+        self.seconds_per_mb: Optional[float] = None
+        self._best_seconds_per_mb: Optional[float] = None
+        self._settling = False
+
+    @property
+    def max_bytes_per_second(self) -> Optional[float]:
+        return self.bucket.rate
+
+    def acquire(self, nbytes: int):
+        """Wait for bandwidth and a free request slot before sending nbytes"""
+        self.bucket.consume(nbytes)
+        with self._cond:
+            while self.in_flight >= self.limit:
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, nbytes: int, elapsed: float, ok: bool):
+        """Record how a request went and free its slot"""
+        with self._cond:
+            self.in_flight -= 1
+            self.requests += 1
+            current = self._round
+            current["requests"] += 1
+            if ok:
+                self.bytes_sent += nbytes
+                current["bytes"] += nbytes
+                current["seconds"] += elapsed
+            else:
+                self.errors += 1
+                current["errors"] += 1
+            if current["requests"] >= self.limit:
+                self._end_round()
+            self._cond.notify_all()
+
+    def _end_round(self):
+        """Measure the round just finished and apply the AIMD rule"""
+        now = time.monotonic()
+        current = self._round
+        throughput = current["bytes"] / max(now - self._round_start, 1e-6)
+        seconds_per_mb = current["seconds"] / (current["bytes"] / MB) if current["bytes"] else None
+        error_rate = current["errors"] / current["requests"]
+        previous = self.throughput
+
+        old, reason = self.limit, None
+        if self.adaptive and self._settling:
+            self._settling = False
+        elif self.adaptive:
+            if error_rate > ERROR_THRESHOLD:
+                self.limit = max(self.min_concurrency, self.limit // 2)
+                reason = f"{error_rate:.0%} of requests failed"
+            elif (seconds_per_mb and self._best_seconds_per_mb
+                  and seconds_per_mb > self._best_seconds_per_mb * LATENCY_FACTOR
+                  and throughput <= previous):
+                self.limit = max(self.min_concurrency, self.limit // 2)
+                reason = f"latency {seconds_per_mb:.2f} s/MB without more throughput"
+            elif throughput >= previous * (1 - THROUGHPUT_SLACK):
+                self.limit = min(self.max_concurrency, self.limit + 1)
+                reason = "throughput holding"
+
+        if seconds_per_mb:
+            self._best_seconds_per_mb = min(self._best_seconds_per_mb or seconds_per_mb, seconds_per_mb)
+            self.seconds_per_mb = seconds_per_mb
+        if current["bytes"]:
+            self.throughput = throughput
+        self._round_start = now
+        self._round = {"requests": 0, "errors": 0, "bytes": 0, "seconds": 0.0}
+
+        if self.limit != old:
+            self._settling = self.limit < old
+            self.adjustments += 1
+            log = logger.warning if self.limit < old else logger.info
+            log(f"Upload concurrency {old} -> {self.limit} ({reason}); {self._status()}")
+
+    def timeout_for(self, nbytes: int) -> float:
+        """Seconds to allow one request of nbytes, from the speed seen so far"""
+        with self._cond:
+            seconds_per_mb = self.seconds_per_mb
+        if seconds_per_mb is None and not self.bucket.rate:
+            return DEFAULT_TIMEOUT
+        expected = nbytes / MB * (seconds_per_mb or 0)
+        if self.bucket.rate:
+            expected = max(expected, nbytes / self.bucket.rate)
+        return max(MIN_TIMEOUT, min(MAX_TIMEOUT, expected * 4 + 30))
+
+    def _status(self) -> str:
+        parts = [f"concurrency {self.in_flight}/{self.limit}",
+                 f"{self.throughput / MB:.1f} MB/s"]
+        if self.seconds_per_mb is not None:
+            parts.append(f"{self.seconds_per_mb:.2f} s/MB")
+        if self.requests:
+            parts.append(f"errors {self.errors / self.requests:.0%}")
+        if self.bucket.rate:
+            parts.append(f"cap {self.bucket.rate / MB:.1f} MB/s")
+        return ", ".join(parts)
+
+    def status(self) -> str:
+        """One-line summary for progress output"""
+        with self._cond:
+            return self._status()
+
+    def snapshot(self) -> Dict:
+        """Current state and run totals"""
+        with self._cond:
+            elapsed = time.monotonic() - self._started
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "adaptive": self.adaptive,
+                "requests": self.requests,
+                "errors": self.errors,
+                "adjustments": self.adjustments,
+                "mb_sent": round(self.bytes_sent / MB, 1),
+                "average_mb_per_s": round(self.bytes_sent / MB / elapsed, 2) if elapsed else 0.0,
+                "mb_per_s": round(self.throughput / MB, 2),
+                "seconds_per_mb": round(self.seconds_per_mb, 3) if self.seconds_per_mb else None,
+                "cap_mb_per_s": round(self.bucket.rate / MB, 2) if self.bucket.rate else None,
+                "throttled_s": round(self.bucket.waited, 1),
+            }
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Batch journal - Crash-safe record of each file's progress through an ingest run
+Every stage transition is committed before the next stage starts, so a run can resume
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOURNAL_PATH = Path('.bible_mp3_journal.sqlite')
+
+# Stages in the order a file passes through them
+STAGES = ('scanned', 'uploaded', 'db_recorded', 'linked')
+
+
+def new_job(item: Dict) -> Dict:
+    """Job dict, in the same shape as BatchJournal.pending, for a freshly scanned file"""
+    return {'path': str(item['path']), 'stage': 'scanned', 'info': item,
+            'r2_key': None, 'etag': None, 'resource_id': None, 'attempts': 0, 'error': None}
+
+
+def stage_reached(item: Dict, stage: str) -> bool:
+    """True if a journal item has completed the given stage"""
+    return STAGES.index(item['stage']) >= STAGES.index(stage)
+
+
+class BatchJournal:
+    """Write-ahead journal of ingest runs and their files"""
+
+    def __init__(self, path: Path = DEFAULT_JOURNAL_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # FULL: a committed stage survives a power cut, not just a crash
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                params TEXT,
+                started_at REAL NOT NULL,
+                scan_completed_at REAL,
+                finished_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS items (
+                run_id INTEGER NOT NULL REFERENCES runs(run_id),
+                path TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                stage TEXT NOT NULL,
+                info TEXT,
+                r2_key TEXT,
+                etag TEXT,
+                resource_id TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                updated_at REAL,
+                PRIMARY KEY (run_id, path)
+            );
+            CREATE INDEX IF NOT EXISTS idx_items_run_stage ON items (run_id, stage);
+        """)
+        self._conn.commit()
+
+    def start_run(self, name: str, params: Optional[Dict] = None) -> int:
+        """Open a new run and return its id"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO runs (name, params, started_at) VALUES (?, ?, ?)",
+                (name, json.dumps(params or {}), time.time())
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def last_unfinished_run(self, name: str) -> Optional[int]:
+        """Most recent run with this name that did not finish"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT run_id FROM runs WHERE name = ? AND finished_at IS NULL "
+                "ORDER BY run_id DESC LIMIT 1",
+                (name,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def mark_scan_complete(self, run_id: int):
+        """Record that every file of the run has been added"""
+        with self._lock:
+            self._conn.execute("UPDATE runs SET scan_completed_at = ? WHERE run_id = ?", (time.time(), run_id))
+            self._conn.commit()
+
+    def scan_complete(self, run_id: int) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT scan_completed_at FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        return bool(row and row[0])
+
+    def finish_run(self, run_id: int):
+        with self._lock:
+            self._conn.execute("UPDATE runs SET finished_at = ? WHERE run_id = ?", (time.time(), run_id))
+            self._conn.commit()
+
+    def add_items(self, run_id: int, items: Iterable[Dict]) -> int:
+        """Record scanned files, returning how many were new to the run
+
+        Each item needs a 'path'; the whole item is kept as the job's info.
+        """
+        now = time.time()
+        with self._lock:
+            seq = self._conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM items WHERE run_id = ?", (run_id,)
+            ).fetchone()[0]
+            rows = []
+            for item in items:
+                seq += 1
+                rows.append((run_id, str(item['path']), seq, 'scanned', json.dumps(item), now))
+            cursor = self._conn.executemany(
+                "INSERT OR IGNORE INTO items (run_id, path, seq, stage, info, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def paths(self, run_id: int) -> Set[str]:
+        """Every file journaled for the run, whatever its stage"""
+        with self._lock:
+            rows = self._conn.execute("SELECT path FROM items WHERE run_id = ?", (run_id,)).fetchall()
+        return {path for path, in rows}
+
+    def advance(self, run_id: int, path, stage: str, **fields):
+        """Mark a file as having completed a stage (r2_key, etag, resource_id may be given)"""
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage: {stage}")
+        unknown = set(fields) - {'r2_key', 'etag', 'resource_id'}
+        if unknown:
+            raise ValueError(f"Unknown journal fields: {sorted(unknown)}")
+
+        assignments = ''.join(f", {name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE items SET stage = ?, error = NULL, updated_at = ?{assignments} "
+                "WHERE run_id = ? AND path = ?",
+                (stage, time.time(), *fields.values(), run_id, str(path))
+            )
+            self._conn.commit()
+
+    def fail(self, run_id: int, path, error: str):
+        """Record a failed attempt; the file keeps the last stage it completed"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE items SET attempts = attempts + 1, error = ?, updated_at = ? "
+                "WHERE run_id = ? AND path = ?",
+                (error, time.time(), run_id, str(path))
+            )
+            self._conn.commit()
+
+    def pending(self, run_id: int, max_attempts: int = 3) -> List[Dict]:
+        """Files not yet linked, in scan order
+
+        Failed files are included until they have used up max_attempts.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, stage, info, r2_key, etag, resource_id, attempts, error FROM items "
+                "WHERE run_id = ? AND stage != 'linked' AND attempts < ? ORDER BY seq",
+                (run_id, max_attempts)
+            ).fetchall()
+        return [{
+            'path': path, 'stage': stage, 'info': json.loads(info or '{}'),
+            'r2_key': r2_key, 'etag': etag, 'resource_id': resource_id,
+            'attempts': attempts, 'error': error
+        } for path, stage, info, r2_key, etag, resource_id, attempts, error in rows]
+
+    def summary(self, run_id: int) -> Dict:
+        """Count of files per stage, plus failures"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT stage, COUNT(*), SUM(error IS NOT NULL) FROM items WHERE run_id = ? GROUP BY stage",
+                (run_id,)
+            ).fetchall()
+        summary = {stage: 0 for stage in STAGES}
+        summary['failed'] = 0
+        for stage, count, failed in rows:
+            summary[stage] = count
+            summary['failed'] += failed or 0
+        return summary
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Streaming load test - Concurrent simulated listeners against the audio streaming path
+Each listener reads Range windows at playback rate over a pooled session and seeks now and then
+"""
+
+import random
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+def percentile(values: Sequence[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile (q in 0..100) of unsorted values"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), round(q / 100 * len(ordered) + 0.5)))
+    return ordered[rank - 1]
+
+
+class LoadStats:
+    """Per-request timings and outcomes, shared by every listener thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ttfb: List[float] = []
+        self.latency: List[float] = []
+        self.bytes = 0
+        self.requests = 0
+        self.errors: Dict[str, int] = {}
+        self.statuses: Dict[int, int] = {}
+        self.streams = 0
+        self.seeks = 0
+        self.rebuffers = 0
+
+    def record(self, status: Optional[int], ttfb: Optional[float], latency: float,
+               nbytes: int, error: Optional[str] = None):
+        with self._lock:
+            self.requests += 1
+            self.bytes += nbytes
+            if status is not None:
+                self.statuses[status] = self.statuses.get(status, 0) + 1
+            if error:
+                self.errors[error] = self.errors.get(error, 0) + 1
+            else:
+                self.ttfb.append(ttfb)
+                self.latency.append(latency)
+
+    def count(self, field: str):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def report(self, elapsed: float) -> Dict:
+        with self._lock:
+            failed = sum(self.errors.values())
+            def ms(values, q):
+                value = percentile(values, q)
+                return round(value * 1000, 1) if value is not None else None
+            return {
+                'seconds': round(elapsed, 1),
+                'streams': self.streams,
+                'requests': self.requests,
+                'requests_per_second': round(self.requests / elapsed, 1) if elapsed else 0.0,
+                'mb_per_second': round(self.bytes / 1024 / 1024 / elapsed, 2) if elapsed else 0.0,
+                'ttfb_ms': {f'p{q}': ms(self.ttfb, q) for q in (50, 95, 99)},
+                'latency_ms': {f'p{q}': ms(self.latency, q) for q in (50, 95, 99)},
+                'error_rate': round(failed / self.requests, 4) if self.requests else 0.0,
+                'errors': dict(self.errors),
+                'statuses': dict(self.statuses),
+                'seeks': self.seeks,
+                'rebuffers': self.rebuffers,
+            }
+
+
+class StreamLoadTest:
+    """Simulated listeners playing audio over HTTP Range requests
+
+    Each listener opens a stream at a random URL and fetches it in windows of
+    buffer_seconds of audio, asking for the next one when half of the
+    buffer has played. A window that arrives after its audio was
+    due counts as a rebuffer. Before each window the listener may seek to a
+    random offset (seek_probability), and after listen_seconds it moves to
+    another URL. speed > 1 plays faster than real time to compress a test.
+    """
+
+    def __init__(self,
+                 urls: Sequence[str],
+                 listeners: int = 50,
+                 duration: float = 60.0,
+                 bitrate_kbps: int = 64,
+                 buffer_seconds: float = 10.0,
+                 listen_seconds: float = 120.0,
+                 seek_probability: float = 0.1,
+                 speed: float = 1.0,
+                 timeout: float = 10.0,
+                 seed: Optional[int] = None):
+        if not urls:
+            raise ValueError("no URLs to stream")
+        self.urls = list(urls)
+        self.listeners = listeners
+        self.duration = duration
+        self.byte_rate = bitrate_kbps * 1000 / 8 * speed
+        self.window = max(1, int(bitrate_kbps * 1000 / 8 * buffer_seconds))
+        self.listen_seconds = listen_seconds / speed
+        self.seek_probability = seek_probability
+        self.timeout = timeout
+        self.seed = seed
+        self.stats = LoadStats()
+        self.session = requests.Session()
+        # One keep-alive connection per listener
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=listeners, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._sizes: Dict[str, int] = {}
+        self._stop = threading.Event()
+
+    def run(self) -> Dict:
+        """Run every listener for duration seconds; returns the report"""
+        threads = [threading.Thread(target=self._listener, args=(index,), name=f"listener-{index}", daemon=True)
+                   for index in range(self.listeners)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        try:
+            self._stop.wait(self.duration)
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join(self.timeout + 1)
+            self.session.close()
+        report = self.stats.report(time.perf_counter() - started)
+        report.update(listeners=self.listeners, urls=len(self.urls))
+        return report
+
+    def _listener(self, index: int):
+        rng = random.Random(None if self.seed is None else self.seed + index)
+        # Stagger start-up over the first second
+        if self._stop.wait(rng.random()):
+            return
+        while not self._stop.is_set():
+            self._play(rng.choice(self.urls), rng)
+
+    def _play(self, url: str, rng: random.Random):
+        """One listening session on url"""
+        self.stats.count('streams')
+        position = 0
+        size = self._sizes.get(url) or self._open(url)
+        if not size:
+            return
+        started = time.perf_counter()
+        # Playback clock: where the audio should be, in bytes, at any moment
+        clock_start, clock_offset = started, 0
+        while not self._stop.is_set() and time.perf_counter() - started < self.listen_seconds:
+            if size and position and rng.random() < self.seek_probability:
+                position = rng.randrange(0, size)
+                self.stats.count('seeks')
+                clock_start, clock_offset = time.perf_counter(), position
+            if position >= size:
+                return
+            end = min(position + self.window - 1, size - 1)
+
+            received = self._fetch(url, position, end)
+            if received is None:
+                return
+            due = clock_start + (position - clock_offset) / self.byte_rate
+            if position != clock_offset and time.perf_counter() > due:
+                self.stats.count('rebuffers')
+                # Playback stalled; it resumes from now
+                clock_start, clock_offset = time.perf_counter(), position
+            position += received
+
+            # Refill when half the buffer has played, as players do
+            next_due = clock_start + (position - clock_offset) / self.byte_rate
+            pause = next_due - self.window / self.byte_rate / 2 - time.perf_counter()
+            if pause > 0 and self._stop.wait(pause):
+                return
+
+    def _open(self, url: str) -> Optional[int]:
+        """HEAD the stream for its size, as a player does before seeking; None on failure"""
+        requested = time.perf_counter()
+        try:
+            response = self.session.head(url, timeout=self.timeout)
+        except requests.RequestException as e:
+            self.stats.record(None, None, time.perf_counter() - requested, 0, type(e).__name__)
+            return None
+        elapsed = time.perf_counter() - requested
+        size = int(response.headers.get('Content-Length') or 0)
+        if response.status_code != 200 or not size:
+            self.stats.record(response.status_code, None, elapsed, 0, f'HTTP {response.status_code}')
+            return None
+        self.stats.record(response.status_code, elapsed, elapsed, 0)
+        self._sizes[url] = size
+        return size
+
+    def _fetch(self, url: str, start: int, end: int) -> Optional[int]:
+        """GET one Range window; returns the bytes received, or None on failure"""
+        requested = time.perf_counter()
+        ttfb, received, status = None, 0, None
+        try:
+            with self.session.get(url, headers={'Range': f'bytes={start}-{end}'},
+                                  stream=True, timeout=self.timeout) as response:
+                status = response.status_code
+                if status == 416:
+                    self.stats.record(status, None, time.perf_counter() - requested, 0, 'range not satisfiable')
+                    return None
+                if status != 206:
+                    error = 'range ignored' if status == 200 else f'HTTP {status}'
+                    self.stats.record(status, None, time.perf_counter() - requested, 0, error)
+                    return None
+                for chunk in response.iter_content(64 * 1024):
+                    if ttfb is None:
+                        ttfb = time.perf_counter() - requested
+                    received += len(chunk)
+        except requests.RequestException as e:
+            self.stats.record(status, None, time.perf_counter() - requested, received, type(e).__name__)
+            return None
+        if received != end - start + 1:
+            self.stats.record(status, None, time.perf_counter() - requested, received, 'short read')
+            return None
+        self.stats.record(status, ttfb or 0.0, time.perf_counter() - requested, received)
+        return received
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Ingest manifest - Local record of what has already been uploaded
+SQLite store keyed by path, size and mtime so unchanged files are skipped without opening them
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+from typing import Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MANIFEST_PATH = Path('.bible_mp3_manifest.sqlite')
+
+FIELDS = ('sha256', 'r2_key', 'etag', 'resource_id', 'linked')
+
+# Stand-in for os.stat_result when size and mtime were captured during a scan
+FileStat = namedtuple('FileStat', ['st_size', 'st_mtime_ns'])
+
+
+class IngestManifest:
+    """Persistent path -> (hash, R2 key, ETag, resource id) store"""
+
+    def __init__(self, path: Path = DEFAULT_MANIFEST_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                sha256 TEXT,
+                r2_key TEXT,
+                etag TEXT,
+                resource_id TEXT,
+                linked INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_files_r2_key ON files (r2_key)")
+        self._conn.commit()
+
+    @staticmethod
+    def _key(file_path) -> str:
+        return os.path.abspath(file_path)
+
+    def lookup(self, file_path: Path, stat_result: Optional[os.stat_result] = None) -> Optional[Dict]:
+        """Entry for a file, or None if unknown or changed since it was recorded"""
+        try:
+            st = stat_result or os.stat(file_path)
+        except OSError:
+            return None
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, sha256, r2_key, etag, resource_id, linked FROM files WHERE path = ?",
+                (self._key(file_path),)
+            ).fetchone()
+
+        if row is None or row[0] != st.st_size or row[1] != st.st_mtime_ns:
+            return None
+        return dict(zip(('size', 'mtime_ns') + FIELDS, row))
+
+    def is_complete(self,
+                    file_path: Path,
+                    r2_key: Optional[str] = None,
+                    stat_result: Optional[os.stat_result] = None) -> bool:
+        """True if the file is unchanged and was uploaded, recorded and linked"""
+        entry = self.lookup(file_path, stat_result)
+        if not entry or not (entry['r2_key'] and entry['resource_id'] and entry['linked']):
+            return False
+        return r2_key is None or entry['r2_key'] == r2_key
+
+    def record(self,
+               file_path: Path,
+               stat_result: Optional[os.stat_result] = None,
+               **fields):
+        """Merge fields into a file's entry
+
+        If the file changed since its entry was written, the old fields are
+        dropped before the new ones are stored.
+        """
+        unknown = set(fields) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown manifest fields: {sorted(unknown)}")
+
+        st = stat_result or os.stat(file_path)
+        key = self._key(file_path)
+        with self._lock:
+            self._conn.execute("""
+                INSERT INTO files (path, size, mtime_ns, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (path) DO UPDATE SET
+                    sha256 = CASE WHEN files.size = excluded.size AND files.mtime_ns = excluded.mtime_ns
+                                  THEN files.sha256 END,
+                    r2_key = CASE WHEN files.size = excluded.size AND files.mtime_ns = excluded.mtime_ns
+                                  THEN files.r2_key END,
+                    etag = CASE WHEN files.size = excluded.size AND files.mtime_ns = excluded.mtime_ns
+                                THEN files.etag END,
+                    resource_id = CASE WHEN files.size = excluded.size AND files.mtime_ns = excluded.mtime_ns
+                                       THEN files.resource_id END,
+                    linked = CASE WHEN files.size = excluded.size AND files.mtime_ns = excluded.mtime_ns
+                                  THEN files.linked ELSE 0 END,
+                    size = excluded.size,
+                    mtime_ns = excluded.mtime_ns,
+                    updated_at = excluded.updated_at
+            """, (key, st.st_size, st.st_mtime_ns, time.time()))
+            if fields:
+                assignments = ', '.join(f"{name} = ?" for name in fields)
+                self._conn.execute(
+                    f"UPDATE files SET {assignments} WHERE path = ?",
+                    (*(int(v) if isinstance(v, bool) else v for v in fields.values()), key)
+                )
+            self._conn.commit()
+
+    def find_by_r2_key(self, r2_key: str) -> Optional[Dict]:
+        """Entry that was uploaded under an R2 key"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT path, size, mtime_ns, sha256, r2_key, etag, resource_id, linked "
+                "FROM files WHERE r2_key = ?",
+                (r2_key,)
+            ).fetchone()
+        return dict(zip(('path', 'size', 'mtime_ns') + FIELDS, row)) if row else None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
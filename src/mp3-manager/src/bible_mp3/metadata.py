@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Metadata extraction - Audio tags and stream info across a process pool
+Reads only the ID3 header, the first frames and the ID3v1 tail of each file
+"""
+
+import io
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional
+import logging
+
+from .metrics import METRICS
+from .profiling import profiled_call
+from .utils import ID3V1_SIZE, id3v2_size, scan_mp3
+
+logger = logging.getLogger(__name__)
+
+# Bytes of audio read past the ID3v2 tag; enough to sync and find a Xing/VBRI header
+DEFAULT_READ_BUDGET = 256 * 1024
+# Embedded cover art can make ID3v2 tags large, but never read more than this
+MAX_READ_BYTES = 16 * 1024 * 1024
+
+
+def _tag_text(tags, frame_id: str) -> str:
+    return str(tags[frame_id][0]) if frame_id in tags else ''
+
+
+def extract_metadata(file_path, read_budget: int = DEFAULT_READ_BUDGET) -> Dict:
+    """Extract audio metadata from the head and tail of a file
+
+    Returns {'path', 'metadata', 'elapsed', 'bytes_read', 'error'}. Runs in
+    worker processes, so it only takes and returns picklable values.
+    """
+    started = time.perf_counter()
+    file_path = Path(file_path)
+    result = {'path': str(file_path), 'metadata': {}, 'elapsed': 0.0, 'bytes_read': 0, 'error': None}
+
+    try:
+        file_size = file_path.stat().st_size
+        with open(file_path, 'rb') as f:
+            header = f.read(10)
+            limit = min(file_size, id3v2_size(header) + read_budget, MAX_READ_BYTES)
+            data = header + f.read(limit - len(header))
+            tail = b''
+            if len(data) < file_size and file_size - len(data) > ID3V1_SIZE:
+                f.seek(-ID3V1_SIZE, os.SEEK_END)
+                tail = f.read(ID3V1_SIZE)
+        result['bytes_read'] = len(data) + len(tail)
+        _parse(result, file_path, data, tail, file_size)
+    except Exception as e:
+        result['error'] = str(e)
+    finally:
+        result['elapsed'] = time.perf_counter() - started
+
+    return result
+
+
+def extract_metadata_from_sample(file_path, head: bytes, tail: bytes, file_size: int) -> Dict:
+    """Like extract_metadata, from bytes already read (see bible_mp3.reader) instead of the file"""
+    started = time.perf_counter()
+    file_path = Path(file_path)
+    result = {'path': str(file_path), 'metadata': {}, 'elapsed': 0.0, 'bytes_read': 0, 'error': None}
+    try:
+        if len(head) >= file_size:
+            head, tail = head[:file_size], b''
+        elif file_size - len(head) <= ID3V1_SIZE:
+            tail = b''
+        _parse(result, file_path, head, tail, file_size)
+    except Exception as e:
+        result['error'] = str(e)
+    finally:
+        result['elapsed'] = time.perf_counter() - started
+    return result
+
+
+def _parse(result: Dict, file_path: Path, data: bytes, tail: bytes, file_size: int):
+    """Fill result['metadata'] from the start of a file and, if it was not all read, its last 128 bytes
+
+    Stream info comes from the frame scanner in utils; mutagen only parses the tags.
+    """
+    metadata = {'file_size': file_size, 'format': file_path.suffix.lower()}
+    result['metadata'] = metadata
+
+    stream = scan_mp3(data, file_size)
+    if stream is None:
+        return
+    metadata.update({
+        'duration': stream['duration'],
+        'bitrate': stream['bitrate'],
+        'sample_rate': stream['sample_rate'],
+        'title': '',
+        'artist': '',
+        'album': '',
+        'track': ''
+    })
+
+    # ID3v1 lives in the last 128 bytes
+    has_v1 = tail.startswith(b'TAG')
+    if not (data.startswith(b'ID3') or has_v1):
+        return
+    try:
+        from mutagen.id3 import ID3
+    except ImportError:
+        result['error'] = "mutagen not installed; tags skipped"
+        return
+    try:
+        tags = ID3(io.BytesIO(data + tail if has_v1 else data))
+    except Exception as e:
+        logger.debug(f"No readable ID3 tags in {file_path}: {e}")
+        return
+    metadata.update({
+        'title': _tag_text(tags, 'TIT2'),
+        'artist': _tag_text(tags, 'TPE1'),
+        'album': _tag_text(tags, 'TALB'),
+        'track': _tag_text(tags, 'TRCK')
+    })
+
+
+class MetadataExtractor:
+    """Fans metadata extraction out across CPU cores"""
+
+    def __init__(self,
+                 max_workers: Optional[int] = None,
+                 read_budget: int = DEFAULT_READ_BUDGET,
+                 window: Optional[int] = None,
+                 profiler=None):
+        self.max_workers = max_workers or os.cpu_count() or 2
+        self.read_budget = read_budget
+        # Files in flight at once for extract_many; keeps results ordered without reading ahead forever
+        self.window = window or self.max_workers * 4
+        # A RunProfiler; worker processes then profile each file and send the stats back
+        self.profiler = profiler
+        self._executor = None
+        self._lock = threading.Lock()
+        self._started = None
+        self.stats = {'files': 0, 'errors': 0, 'bytes_read': 0, 'cpu_seconds': 0.0}
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                self._started = time.perf_counter()
+            return self._executor
+
+    def _account(self, result: Dict):
+        with self._lock:
+            self.stats['files'] += 1
+            self.stats['errors'] += bool(result['error'])
+            self.stats['bytes_read'] += result['bytes_read']
+            self.stats['cpu_seconds'] += result['elapsed']
+        METRICS.observe('metadata_seconds', result['elapsed'])
+        METRICS.count('metadata_files')
+        METRICS.count('metadata_bytes_read', result['bytes_read'])
+        if result['error']:
+            METRICS.count('metadata_errors')
+            logger.warning(f"Could not extract metadata from {result['path']}: {result['error']}")
+
+    def submit(self, file_path) -> Future:
+        """Queue one file; the future resolves to the extract_metadata result"""
+        return self._submit(extract_metadata, str(file_path), self.read_budget)
+
+    def submit_sample(self, file_path, sample) -> Future:
+        """Queue parsing of a FileSample captured while the file was read for upload"""
+        return self._submit(extract_metadata_from_sample, str(file_path), sample.head, sample.tail, sample.size)
+
+    def _submit(self, func, *args) -> Future:
+        if self.profiler is not None:
+            future = self.executor.submit(profiled_call, func, *args)
+        else:
+            future = self.executor.submit(func, *args)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future: Future):
+        if not future.cancelled() and future.exception() is None:
+            result = future.result()
+            stats = result.pop('_profile', None)
+            if stats is not None and self.profiler is not None:
+                self.profiler.add_stats('metadata', stats)
+            self._account(result)
+
+    def extract_many(self, paths: Iterable) -> Iterator[Dict]:
+        """Extract metadata for many files, yielding results in input order"""
+        in_flight = deque()
+        for file_path in paths:
+            in_flight.append(self.submit(file_path))
+            if len(in_flight) >= self.window:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+    def report(self) -> Dict:
+        """Per-file timing and overall throughput so far"""
+        with self._lock:
+            stats = dict(self.stats)
+            wall = time.perf_counter() - self._started if self._started else 0.0
+        files = stats['files']
+        stats.update({
+            'wall_seconds': wall,
+            'avg_ms_per_file': 1000 * stats['cpu_seconds'] / files if files else 0.0,
+            'files_per_second': files / wall if wall else 0.0,
+            'mb_read_per_file': stats['bytes_read'] / files / (1024 * 1024) if files else 0.0
+        })
+        return stats
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Ingest metrics - Counters and latency histograms for each stage of an ingest run
+Exported as JSON when a run ends, and in Prometheus text format while it runs
+"""
+
+import bisect
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Latency bucket upper bounds in seconds: 1 ms to about 2 minutes, doubling
+LATENCY_BUCKETS = tuple(0.001 * 2 ** i for i in range(18))
+
+
+class Histogram:
+    """Fixed-bucket histogram; an observation is a bisect and a few additions under a lock"""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def state(self) -> Tuple[List[int], int, float, float]:
+        """Consistent copy of (bucket counts, count, sum, max)"""
+        with self._lock:
+            return list(self.counts), self.count, self.sum, self.max
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate of the q-quantile (0..1), interpolated within its bucket"""
+        counts, count, _, largest = self.state()
+        if not count:
+            return None
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else largest
+                return min(largest, lower + (upper - lower) * (rank - seen) / bucket_count)
+            seen += bucket_count
+        return largest
+
+    def summary(self) -> Dict:
+        _, count, total, largest = self.state()
+        return {
+            'count': count,
+            'sum': round(total, 6),
+            'mean': round(total / count, 6) if count else None,
+            **{f'p{q}': (None if value is None else round(value, 6))
+               for q, value in ((50, self.quantile(0.5)), (95, self.quantile(0.95)), (99, self.quantile(0.99)))},
+            'max': round(largest, 6),
+        }
+
+
+class Metrics:
+    """Named counters and latency histograms, safe to update from any thread
+
+    Counters and histograms are created on first use. Recording costs a dict
+    lookup and a short critical section, so instrumentation can stay on in
+    production runs.
+    """
+
+    def __init__(self, prefix: str = 'bible_mp3'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._histograms: Dict[str, Histogram] = {}
+        self.started = time.time()
+        self._clock = time.perf_counter()
+
+    def count(self, name: str, value: float = 1):
+        """Add value to a counter"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def histogram(self, name: str) -> Histogram:
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, Histogram())
+        return histogram
+
+    def observe(self, name: str, seconds: float):
+        """Record one duration in a histogram"""
+        self.histogram(name).observe(seconds)
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """Time the enclosed block into a histogram, whether or not it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def counter(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def reset(self):
+        """Forget everything recorded and restart the clock"""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self.started = time.time()
+            self._clock = time.perf_counter()
+
+    def snapshot(self) -> Dict:
+        """Counters, per-second rates and histogram summaries so far"""
+        elapsed = time.perf_counter() - self._clock
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = dict(self._histograms)
+        snapshot = {
+            'started': self.started,
+            'elapsed_seconds': round(elapsed, 3),
+            'counters': counters,
+            'rates': {name: round(value / elapsed, 3) for name, value in counters.items()} if elapsed else {},
+            'histograms': {name: histogram.summary() for name, histogram in sorted(histograms.items())},
+        }
+        upload_seconds = histograms.get('upload_seconds')
+        if counters.get('upload_bytes') and upload_seconds and upload_seconds.sum:
+            # Wall-clock rate above counts concurrency; this is one upload's rate on average
+            snapshot['upload_mb_per_second_per_file'] = round(
+                counters['upload_bytes'] / 1024 / 1024 / upload_seconds.sum, 3
+            )
+        return snapshot
+
+    def prometheus(self) -> str:
+        """Everything recorded so far in the Prometheus text exposition format"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+        lines = []
+        for name, value in counters:
+            metric = f"{self.prefix}_{name}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value!r}"]
+        for name, histogram in histograms:
+            metric = f"{self.prefix}_{name}"
+            counts, count, total, _ = histogram.state()
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{metric}_bucket{{le="{bound:g}"}} {cumulative}')
+            lines += [f'{metric}_bucket{{le="+Inf"}} {count}', f"{metric}_sum {total!r}", f"{metric}_count {count}"]
+        metric = f"{self.prefix}_elapsed_seconds"
+        lines += [f"# TYPE {metric} gauge", f"{metric} {time.perf_counter() - self._clock:.3f}"]
+        return '\n'.join(lines) + '\n'
+
+    def write_json(self, path: Path, extra: Optional[Dict] = None):
+        """Write snapshot() (merged with extra) to a JSON file"""
+        report = self.snapshot()
+        if extra:
+            report.update(extra)
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(report, indent=2, default=str))
+        logger.info(f"Wrote metrics to {path}")
+
+    def serve(self, port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+        """Serve prometheus() at /metrics on a daemon thread; call shutdown() on the result to stop"""
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        logger.info(f"Serving metrics at http://{host}:{server.server_port}/metrics")
+        return server
+
+
+# Process-wide registry the package's stages record into
+METRICS = Metrics()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Ingest pipeline - asyncio stages connected by bounded queues
+Each stage works on a limited number of items at once; a full queue stalls the stages before it
+"""
+
+import asyncio
+import inspect
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Queue marker telling a worker there is nothing more to come
+STOP = object()
+
+
+class IngestError(Exception):
+    """A stage could not complete an item; the message is reported as-is"""
+
+
+class Stage:
+    """One step of the pipeline and how many items it may work on at once
+
+    func takes a job dict and returns it (usually updated). Coroutine functions
+    are awaited on the event loop, so they should only wait on I/O or on
+    futures from another pool (e.g. a process pool for CPU-bound work). Plain
+    functions run on executor, or on a thread pool with `workers` threads.
+    Jobs for which skip(job) is true pass through untouched.
+    """
+
+    def __init__(self,
+                 name: str,
+                 func: Callable[[Dict], Dict],
+                 workers: int = 1,
+                 executor: Optional[Executor] = None,
+                 skip: Optional[Callable[[Dict], bool]] = None):
+        if workers < 1:
+            raise ValueError(f"Stage {name} needs at least one worker")
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.executor = executor
+        self.skip = skip
+        self.is_async = inspect.iscoroutinefunction(func)
+        self.stats = {'items': 0, 'skipped': 0, 'errors': 0, 'busy_seconds': 0.0, 'max_queued': 0}
+
+
+class Pipeline:
+    """Runs jobs through stages concurrently, with at most queue_size jobs waiting per stage
+
+    A job that fails a stage skips the rest and goes straight to on_result
+    with 'error', 'exception' and 'failed_stage' set.
+    """
+
+    def __init__(self, stages: List[Stage], queue_size: int = 32):
+        if not stages:
+            raise ValueError("A pipeline needs at least one stage")
+        self.stages = stages
+        self.queue_size = queue_size
+        self.stats = {'fed': 0, 'completed': 0, 'failed': 0, 'feed_blocked_seconds': 0.0, 'wall_seconds': 0.0}
+
+    def run(self, source: Iterable[Dict], on_result: Callable[[Dict], None]) -> Dict:
+        """Run the pipeline to completion from synchronous code"""
+        return asyncio.run(self.run_async(source, on_result))
+
+    async def run_async(self, source: Iterable[Dict], on_result: Callable[[Dict], None]) -> Dict:
+        started = time.perf_counter()
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in self.stages]
+        done_queue = asyncio.Queue(maxsize=self.queue_size)
+        # Sources such as directory scans block, so they are read on their own thread
+        feed_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="feed")
+        own_executors = {
+            stage.name: ThreadPoolExecutor(max_workers=stage.workers, thread_name_prefix=stage.name)
+            for stage in self.stages if not stage.is_async and stage.executor is None
+        }
+
+        tasks = [asyncio.ensure_future(self._feed(source, queues[0], feed_executor))]
+        for index, stage in enumerate(self.stages):
+            downstream = queues[index + 1] if index + 1 < len(self.stages) else done_queue
+            executor = stage.executor or own_executors.get(stage.name)
+            tasks.append(asyncio.ensure_future(
+                self._run_stage(index, stage, queues[index], downstream, done_queue, executor)
+            ))
+        tasks.append(asyncio.ensure_future(self._drain(done_queue, on_result)))
+
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        finally:
+            feed_executor.shutdown(wait=False)
+            for executor in own_executors.values():
+                executor.shutdown(wait=True)
+            self.stats['wall_seconds'] = time.perf_counter() - started
+
+        return self.report()
+
+    async def _feed(self, source: Iterable[Dict], queue: asyncio.Queue, executor: Executor):
+        loop = asyncio.get_running_loop()
+        items = iter(source)
+        while True:
+            job = await loop.run_in_executor(executor, next, items, STOP)
+            if job is STOP:
+                break
+            waited = time.perf_counter()
+            # Blocks while the first stage is backed up, so scanning slows to match
+            await queue.put(job)
+            self.stats['feed_blocked_seconds'] += time.perf_counter() - waited
+            self.stats['fed'] += 1
+        for _ in range(self.stages[0].workers):
+            await queue.put(STOP)
+
+    async def _run_stage(self,
+                         index: int,
+                         stage: Stage,
+                         inbox: asyncio.Queue,
+                         downstream: asyncio.Queue,
+                         done_queue: asyncio.Queue,
+                         executor: Optional[Executor]):
+        await asyncio.gather(*(
+            self._work(stage, inbox, downstream, done_queue, executor) for _ in range(stage.workers)
+        ))
+        # Every worker has stopped, so nothing more can reach the next stage
+        if downstream is done_queue:
+            await done_queue.put(STOP)
+        else:
+            for _ in range(self.stages[index + 1].workers):
+                await downstream.put(STOP)
+
+    async def _work(self,
+                    stage: Stage,
+                    inbox: asyncio.Queue,
+                    downstream: asyncio.Queue,
+                    done_queue: asyncio.Queue,
+                    executor: Optional[Executor]):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await inbox.get()
+            if job is STOP:
+                return
+            stage.stats['max_queued'] = max(stage.stats['max_queued'], inbox.qsize() + 1)
+
+            if stage.skip and stage.skip(job):
+                stage.stats['skipped'] += 1
+                await downstream.put(job)
+                continue
+
+            started = time.perf_counter()
+            try:
+                if stage.is_async:
+                    job = await stage.func(job)
+                else:
+                    job = await loop.run_in_executor(executor, stage.func, job)
+            except Exception as e:
+                stage.stats['errors'] += 1
+                job.update({'error': str(e), 'exception': e, 'failed_stage': stage.name})
+                await done_queue.put(job)
+                continue
+            finally:
+                elapsed = time.perf_counter() - started
+                stage.stats['busy_seconds'] += elapsed
+                job.setdefault('timings', {})[stage.name] = elapsed
+
+            stage.stats['items'] += 1
+            await downstream.put(job)
+
+    async def _drain(self, done_queue: asyncio.Queue, on_result: Callable[[Dict], None]):
+        while True:
+            job = await done_queue.get()
+            if job is STOP:
+                return
+            self.stats['failed' if job.get('failed_stage') else 'completed'] += 1
+            on_result(job)
+
+    def report(self) -> Dict:
+        """Overall counts plus per-stage work, busy time and deepest queue seen"""
+        report = dict(self.stats)
+        report['stages'] = {stage.name: dict(stage.stats, workers=stage.workers) for stage in self.stages}
+        return report
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Connection pool - Thread-safe PostgreSQL connections shared by the database and uploader
+Checks idle connections before handing them out and replaces broken ones
+"""
+
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Errors that mean the connection itself is unusable, not just the statement
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+# Server-side cursor names must be unique per connection
+_stream_ids = itertools.count(1)
+
+
+class ConnectionPool:
+    """ThreadedConnectionPool with blocking checkout, health checks and reconnect"""
+
+    def __init__(self,
+                 postgres_url: Optional[str] = None,
+                 minconn: int = 1,
+                 maxconn: int = 8,
+                 cursor_factory=RealDictCursor,
+                 health_check_after: float = 30.0,
+                 **connect_kwargs):
+        # connect_kwargs (host, port, user, ...) may be given instead of, or on top of, a URL
+        self.postgres_url = postgres_url
+        self.maxconn = maxconn
+        # Connections idle longer than this are pinged before reuse
+        self.health_check_after = health_check_after
+        self._pool = ThreadedConnectionPool(minconn, maxconn, postgres_url,
+                                            cursor_factory=cursor_factory, **connect_kwargs)
+        # ThreadedConnectionPool raises when exhausted; callers wait for a free slot instead
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._last_used: Dict[int, float] = {}
+        self._lock = threading.Lock()
+        self.stats = {'checkouts': 0, 'reconnects': 0}
+
+    def _is_healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn))
+        if last_used is None or time.monotonic() - last_used < self.health_check_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except CONNECTION_ERRORS as e:
+            logger.warning(f"Discarding dead database connection: {e}")
+            return False
+
+    def _discard(self, conn):
+        with self._lock:
+            self._last_used.pop(id(conn), None)
+            self.stats['reconnects'] += 1
+        self._pool.putconn(conn, close=True)
+
+    def _checkout(self):
+        # One retry per pooled connection, so a pool full of stale sockets is fully replaced
+        for _ in range(self.maxconn + 1):
+            conn = self._pool.getconn()
+            if self._is_healthy(conn):
+                return conn
+            self._discard(conn)
+        raise psycopg2.OperationalError("Could not get a working database connection")
+
+    @contextmanager
+    def connection(self) -> Iterator:
+        """Borrow a connection; it is rolled back on error and always returned
+
+        Blocks while every connection is in use. A connection that fails with a
+        connection-level error is closed and replaced with a fresh one.
+        """
+        with self._slots:
+            conn = self._checkout()
+            with self._lock:
+                self.stats['checkouts'] += 1
+            broken = False
+            try:
+                yield conn
+            except Exception:
+                try:
+                    conn.rollback()
+                except CONNECTION_ERRORS:
+                    broken = True
+                raise
+            finally:
+                if broken or conn.closed:
+                    self._discard(conn)
+                else:
+                    with self._lock:
+                        self._last_used[id(conn)] = time.monotonic()
+                    self._pool.putconn(conn)
+
+    @contextmanager
+    def cursor(self, cursor_factory=None) -> Iterator:
+        """Cursor in its own transaction, committed when the block exits cleanly"""
+        with self.connection() as conn:
+            with conn.cursor(cursor_factory=cursor_factory) as cursor:
+                yield cursor
+            conn.commit()
+
+    def stream(self, query: str, params=None, itersize: int = 2000, cursor_factory=None) -> Iterator:
+        """Yield rows from a named server-side cursor, itersize rows per round trip
+
+        The connection stays checked out until the generator is exhausted or
+        closed, so consume it promptly.
+        """
+        name = f"bible_mp3_stream_{next(_stream_ids)}"
+        with self.connection() as conn:
+            with conn.cursor(name=name, cursor_factory=cursor_factory) as cursor:
+                cursor.itersize = itersize
+                cursor.execute(query, params)
+                yield from cursor
+            # Read-only; ends the transaction the named cursor needed
+            conn.rollback()
+    
+    def close(self):
+        """Close every connection in the pool"""
+        if not self._pool.closed:
+            self._pool.closeall()
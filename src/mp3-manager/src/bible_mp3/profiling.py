@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Run profiler - cProfile per worker pool, tracemalloc allocation sites and the slowest files of an ingest run
+Writes a report directory whose text files can be diffed between runs
+"""
+
+import cProfile
+import heapq
+import io
+import itertools
+import json
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import logging
+
+from .metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Worker threads are named <pool prefix>_<n> (ThreadPoolExecutor) or <name>-<n>
+_THREAD_SUFFIX = re.compile(r'(?:[-_]\d+)+$')
+
+
+def thread_group(name: str) -> str:
+    """Pool a thread belongs to: 'r2-upload_3' -> 'r2-upload', 'MainThread' -> 'main'"""
+    if name == 'MainThread':
+        return 'main'
+    if name == 'all':
+        return name
+    return _THREAD_SUFFIX.sub('', name) or name
+
+
+class _Stats:
+    """Raw cProfile stats in the shape pstats.Stats loads"""
+
+    def __init__(self, stats: Dict):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def profiled_call(func: Callable, *args) -> Dict:
+    """Run func (returning a dict) under cProfile; the raw stats come back under '_profile'
+
+    For process-pool workers, whose time the parent's profiler cannot see.
+    """
+    profile = cProfile.Profile()
+    result = profile.runcall(func, *args)
+    profile.create_stats()
+    result['_profile'] = profile.stats
+    return result
+
+
+class RunProfiler:
+    """Profiles an ingest run into report_dir
+
+    While started, every thread gets its own cProfile profiler, and profiles
+    are merged per thread pool. The pools map onto the ingest stages: scan
+    (directory walk), r2-upload / r2-part (read, hash, send), metadata (parsed
+    in worker processes, sent back with profiled_call), resource-writer
+    (upserts), link, and main. tracemalloc records allocation sites with
+    trace_frames frames. record_file keeps the `slowest` files by total time
+    with their per-stage seconds. From Python 3.12 only one profiler can run
+    at a time, so every thread is reported in a single group, 'all'.
+    """
+
+    def __init__(self,
+                 report_dir: Path,
+                 slowest: int = 20,
+                 top: int = 40,
+                 trace_frames: int = 10):
+        self.report_dir = Path(report_dir)
+        self.slowest = slowest
+        self.top = top
+        self.trace_frames = trace_frames
+        self._lock = threading.Lock()
+        self._profiles: List[tuple] = []
+        self._extra: Dict[str, List[Dict]] = {}
+        self._files: List[tuple] = []
+        self._order = itertools.count()
+        self._baseline = None
+        self._started = None
+
+    def start(self):
+        """Begin profiling this thread and every thread started from now on"""
+        tracemalloc.start(self.trace_frames)
+        self._baseline = tracemalloc.take_snapshot()
+        self._started = time.perf_counter()
+        if sys.version_info >= (3, 12):
+            # cProfile is process-wide from 3.12 (sys.monitoring): one profiler sees every thread
+            self._enable('all')
+            return
+        threading.setprofile(self._thread_started)
+        self._enable(threading.current_thread().name)
+
+    def _thread_started(self, frame, event, arg):
+        # First profile event of a new thread; cProfile replaces this hook for the thread
+        sys.setprofile(None)
+        self._enable(threading.current_thread().name)
+
+    def _enable(self, thread_name: str):
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append((thread_group(thread_name), profile))
+        profile.enable()
+
+    def add_stats(self, group: str, stats: Dict):
+        """Merge raw cProfile stats from elsewhere (e.g. a worker process) into a group"""
+        with self._lock:
+            self._extra.setdefault(group, []).append(stats)
+
+    def record_file(self, path: str, timings: Dict[str, float], error: Optional[str] = None):
+        """Offer one file's per-stage seconds for the slowest-files list
+
+        Dotted names ('upload.read') break a stage down and are not added to the total.
+        """
+        total = sum(seconds for name, seconds in timings.items() if '.' not in name)
+        entry = (total, next(self._order), {'file': str(path), 'total_seconds': round(total, 4),
+                                            'stages': {name: round(seconds, 4) for name, seconds in timings.items()},
+                                            'error': error})
+        with self._lock:
+            if len(self._files) < self.slowest:
+                heapq.heappush(self._files, entry)
+            elif total > self._files[0][0]:
+                heapq.heapreplace(self._files, entry)
+
+    def stop(self, extra: Optional[Dict] = None) -> Path:
+        """Stop profiling and write the report directory; returns its path
+
+        Call once the run's worker pools are idle. extra is merged into summary.json.
+        """
+        threading.setprofile(None)
+        with self._lock:
+            profiles = list(self._profiles)
+            extra_stats = {group: list(stats) for group, stats in self._extra.items()}
+            files = sorted(self._files, reverse=True)
+        for _, profile in profiles:
+            profile.disable()
+        wall = time.perf_counter() - self._started
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.report_dir.mkdir(parents=True, exist_ok=True)
+        groups = self._write_profiles(profiles, extra_stats)
+        self._write_allocations(snapshot)
+        slowest = [entry for _, _, entry in files]
+        (self.report_dir / 'slowest_files.json').write_text(json.dumps(slowest, indent=2))
+
+        summary = {
+            'wall_seconds': round(wall, 3),
+            'profiles': groups,
+            'memory': {'traced_current_mb': round(current / 1024 / 1024, 2),
+                       'traced_peak_mb': round(peak / 1024 / 1024, 2)},
+            'slowest_files': [entry['file'] for entry in slowest],
+            'metrics': METRICS.snapshot(),
+            **(extra or {})
+        }
+        (self.report_dir / 'summary.json').write_text(json.dumps(summary, indent=2, default=str))
+        logger.info(f"Profile report written to {self.report_dir}")
+        return self.report_dir
+
+    def _write_profiles(self, profiles: List[tuple], extra_stats: Dict[str, List[Dict]]) -> Dict:
+        """cprofile/<group>.prof (pstats format) and .txt (top functions by cumulative time)"""
+        directory = self.report_dir / 'cprofile'
+        directory.mkdir(exist_ok=True)
+        merged: Dict[str, pstats.Stats] = {}
+        sources = [(group, profile) for group, profile in profiles]
+        sources += [(group, _Stats(stats)) for group, items in extra_stats.items() for stats in items]
+        for group, source in sources:
+            try:
+                if group in merged:
+                    merged[group].add(source)
+                else:
+                    merged[group] = pstats.Stats(source)
+            except TypeError:
+                continue  # a profiler that never saw an event has nothing to load
+
+        groups = {}
+        for group, stats in sorted(merged.items()):
+            stats.dump_stats(str(directory / f"{group}.prof"))
+            text = io.StringIO()
+            stats.stream = text
+            stats.sort_stats('cumulative').print_stats(self.top)
+            # Drop the call-count and total-time line so reports diff cleanly
+            (directory / f"{group}.txt").write_text(re.sub(r'^.*function calls.*\n', '', text.getvalue(), flags=re.M))
+            groups[group] = {'calls': stats.total_calls, 'seconds': round(stats.total_tt, 3)}
+        return groups
+
+    def _write_allocations(self, snapshot: tracemalloc.Snapshot):
+        """Top allocation sites at the end of the run, and growth since start"""
+        directory = self.report_dir / 'tracemalloc'
+        directory.mkdir(exist_ok=True)
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+        ])
+        snapshot.dump(str(directory / 'end.snapshot'))
+
+        lines = [str(stat) for stat in snapshot.statistics('lineno')[:self.top]]
+        (directory / 'top_lines.txt').write_text('\n'.join(lines) + '\n')
+
+        traces = []
+        for stat in snapshot.statistics('traceback')[:min(self.top, 10)]:
+            traces.append(f"{stat.count} blocks, {stat.size / 1024:.1f} KiB")
+            traces.extend(f"    {line}" for line in stat.traceback.format())
+        (directory / 'top_tracebacks.txt').write_text('\n'.join(traces) + '\n')
+
+        growth = [str(stat) for stat in snapshot.compare_to(self._baseline, 'lineno')[:self.top]]
+        (directory / 'growth.txt').write_text('\n'.join(growth) + '\n')
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Single-pass file reader - Reads each file once, in part-sized buffers
+Every buffer feeds the SHA-256 of the whole file, the MD5 of its upload part and the upload itself
+"""
+
+import base64
+import hashlib
+import time
+from pathlib import Path
+from typing import Iterator, List, NamedTuple, Optional
+import logging
+
+from .metadata import MAX_READ_BYTES
+from .utils import id3v2_size
+
+logger = logging.getLogger(__name__)
+
+# Audio kept from the start of the file (after any ID3v2 tag) for header checks and metadata parsing
+HEAD_BYTES = 1024 * 1024
+# ID3v1 lives in the last 128 bytes
+TAIL_BYTES = 128
+
+
+class Part(NamedTuple):
+    """One upload part with the MD5 the server's ETag should match"""
+    number: int
+    data: bytes
+    md5: bytes
+
+    @property
+    def content_md5(self) -> str:
+        """Content-MD5 header value, so the server rejects a corrupted part"""
+        return base64.b64encode(self.md5).decode('ascii')
+
+    @property
+    def etag(self) -> str:
+        return self.md5.hex()
+
+
+class FileSample(NamedTuple):
+    """The bytes of a file that header checks and metadata parsing need"""
+    head: bytes
+    tail: bytes
+    size: int
+
+
+def multipart_etag(part_md5s: List[bytes]) -> str:
+    """ETag S3 gives a multipart object: MD5 of the part MD5s, then the part count"""
+    return f"{hashlib.md5(b''.join(part_md5s)).hexdigest()}-{len(part_md5s)}"
+
+
+class SinglePassReader:
+    """Iterates a file as upload parts, reading every byte exactly once
+
+    The head of the file is available as soon as the first part has been
+    read, so a bad file can be rejected before anything is sent. sha256 and
+    sample are complete once the parts are exhausted.
+    """
+
+    def __init__(self, file_path: Path, part_size: int, head_bytes: int = HEAD_BYTES):
+        self.file_path = Path(file_path)
+        self.part_size = part_size
+        self.head_bytes = head_bytes
+        self.head = b''
+        self._tail = b''
+        self._sha256 = hashlib.sha256()
+        self.part_md5s: List[bytes] = []
+        self.bytes_read = 0
+        # Time spent in reads and in hashing, for the ingest metrics
+        self.read_seconds = 0.0
+        self.hash_seconds = 0.0
+        self._done = False
+
+    def parts(self) -> Iterator[Part]:
+        with open(self.file_path, 'rb', buffering=0) as f:
+            number = 0
+            while True:
+                started = time.perf_counter()
+                data = f.read(self.part_size)
+                # Unbuffered reads may come back short; top up to a full part
+                while data and len(data) < self.part_size:
+                    more = f.read(self.part_size - len(data))
+                    if not more:
+                        break
+                    data += more
+                hashed = time.perf_counter()
+                self.read_seconds += hashed - started
+                if not data and number:
+                    break
+                number += 1
+                if number == 1:
+                    self.head = data[:min(id3v2_size(data[:10]) + self.head_bytes, MAX_READ_BYTES)]
+                self._sha256.update(data)
+                self._tail = (self._tail + data[-TAIL_BYTES:])[-TAIL_BYTES:]
+                self.bytes_read += len(data)
+                md5 = hashlib.md5(data).digest()
+                self.part_md5s.append(md5)
+                self.hash_seconds += time.perf_counter() - hashed
+                # A short part is the last one, so the totals are final before it is sent
+                last = len(data) < self.part_size
+                self._done = last
+                yield Part(number, data, md5)
+                if last:
+                    break
+        self._done = True
+
+    @property
+    def sha256(self) -> Optional[str]:
+        """Hex SHA-256 of the file, once every part has been read"""
+        return self._sha256.hexdigest() if self._done else None
+
+    @property
+    def sample(self) -> Optional[FileSample]:
+        """Head and tail of the file, once every part has been read"""
+        return FileSample(self.head, self._tail, self.bytes_read) if self._done else None
+
+    def expected_etag(self, multipart: bool) -> str:
+        """ETag the server should report for what was read"""
+        return multipart_etag(self.part_md5s) if multipart else self.part_md5s[0].hex()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Bucket reconciliation - Compares the resources table with the objects in the audio bucket
+Merge-joins a paged bucket listing with a key-ordered stream of resource rows, then repairs the differences
+"""
+
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+import logging
+
+from .manifest import IngestManifest
+
+logger = logging.getLogger(__name__)
+
+# list_objects_v2 and delete_objects both stop at 1,000 keys per call
+PAGE_SIZE = 1000
+DELETE_BATCH_SIZE = 1000
+
+KINDS = ('missing', 'orphan', 'size_mismatch', 'etag_mismatch')
+
+
+class BucketObject(NamedTuple):
+    """One entry of a bucket listing"""
+    key: str
+    size: int
+    etag: str
+
+
+class Discrepancy(NamedTuple):
+    """A key where the bucket and the resources table disagree
+
+    missing: a resource row with no object; orphan: an object with no row;
+    size_mismatch / etag_mismatch: both exist but the object is not the file
+    that was recorded.
+    """
+    kind: str
+    key: str
+    resource_id: Optional[str] = None
+    expected_size: Optional[int] = None
+    actual_size: Optional[int] = None
+    expected_etag: Optional[str] = None
+    actual_etag: Optional[str] = None
+    local_path: Optional[str] = None
+
+
+def _ordered(items: Iterable, key, source: str) -> Iterator:
+    """Pass items through, raising ValueError if their keys go backwards"""
+    previous = None
+    for item in items:
+        current = key(item)
+        if previous is not None and current < previous:
+            raise ValueError(f"{source} is not sorted by key: {current!r} after {previous!r}")
+        previous = current
+        yield item
+
+
+def merge_join(objects: Iterable[BucketObject], rows: Iterable[Tuple]) -> Iterator[Tuple]:
+    """Pair objects and rows (r2_key first) with equal keys; both streams must be sorted
+
+    Yields (object, row), (object, None) or (None, row). Several rows naming
+    the same key are each paired with the one object.
+    """
+    objects = _ordered(objects, lambda obj: obj.key, "Bucket listing")
+    rows = _ordered(rows, lambda row: row[0], "Resource stream")
+    obj, row = next(objects, None), next(rows, None)
+    while obj is not None or row is not None:
+        if row is None or (obj is not None and obj.key < row[0]):
+            yield obj, None
+            obj = next(objects, None)
+        elif obj is None or row[0] < obj.key:
+            yield None, row
+            row = next(rows, None)
+        else:
+            while row is not None and row[0] == obj.key:
+                yield obj, row
+                row = next(rows, None)
+            obj = next(objects, None)
+
+
+class BucketReconciler:
+    """Finds and repairs differences between the audio bucket and the resources table
+
+    The bucket is listed PAGE_SIZE keys per call and resource rows arrive
+    from a server-side cursor in the same byte order, so 100k objects are
+    checked in about a hundred list calls with constant memory. Sizes are
+    always compared; ETags when the row or the ingest manifest recorded one.
+    """
+
+    def __init__(self,
+                 client,
+                 bucket_name: str,
+                 manifest: Optional[IngestManifest] = None,
+                 page_size: int = PAGE_SIZE):
+        self.client = client
+        self.bucket_name = bucket_name
+        self.manifest = manifest
+        self.page_size = min(page_size, PAGE_SIZE)
+        self.stats = {'list_calls': 0, 'delete_calls': 0, 'objects': 0, 'rows': 0, 'matched': 0,
+                      'etag_unchecked': 0, **{kind: 0 for kind in KINDS}}
+
+    def list_objects(self, prefix: str = '') -> Iterator[BucketObject]:
+        """Every object under prefix, in key order, one list_objects_v2 page at a time"""
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix,
+                                       PaginationConfig={'PageSize': self.page_size}):
+            self.stats['list_calls'] += 1
+            for entry in page.get('Contents', ()):
+                yield BucketObject(entry['Key'], entry['Size'], entry['ETag'].strip('"'))
+
+    def compare(self, rows: Iterable[Tuple], prefix: str = '') -> Iterator[Discrepancy]:
+        """Discrepancies between the bucket and rows of (r2_key, id, file_size, etag, original_path)
+
+        rows must be sorted by key in byte order and limited to prefix, as
+        BibleDatabase.iter_resource_objects returns them.
+        """
+        previous = None
+        for obj, row in merge_join(self.list_objects(prefix), rows):
+            if obj is not None and obj is not previous:
+                self.stats['objects'] += 1
+                previous = obj
+            if row is None:
+                self.stats['orphan'] += 1
+                yield Discrepancy('orphan', obj.key, actual_size=obj.size, actual_etag=obj.etag)
+                continue
+
+            self.stats['rows'] += 1
+            key, resource_id, size, etag, original_path = row
+            recorded = self.manifest.find_by_r2_key(key) if self.manifest and not (etag and original_path) else None
+            etag = etag or (recorded or {}).get('etag')
+            local_path = original_path or (recorded or {}).get('path')
+            found = Discrepancy(None, key, resource_id, size, None, etag, None, local_path)
+
+            if obj is None:
+                self.stats['missing'] += 1
+                yield found._replace(kind='missing')
+            elif size is not None and size != obj.size:
+                self.stats['size_mismatch'] += 1
+                yield found._replace(kind='size_mismatch', actual_size=obj.size, actual_etag=obj.etag)
+            elif etag and etag != obj.etag:
+                self.stats['etag_mismatch'] += 1
+                yield found._replace(kind='etag_mismatch', actual_size=obj.size, actual_etag=obj.etag)
+            else:
+                self.stats['matched'] += 1
+                if not etag:
+                    self.stats['etag_unchecked'] += 1
+
+    def delete_orphans(self, keys: Iterable[str], dry_run: bool = False) -> Dict:
+        """Delete objects in delete_objects batches of up to 1,000 keys"""
+        result = {'deleted': 0, 'errors': []}
+        batch: List[str] = []
+
+        def flush():
+            if dry_run:
+                result['deleted'] += len(batch)
+                return
+            self.stats['delete_calls'] += 1
+            response = self.client.delete_objects(
+                Bucket=self.bucket_name,
+                Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True}
+            )
+            errors = response.get('Errors', [])
+            result['deleted'] += len(batch) - len(errors)
+            result['errors'].extend(f"{error['Key']}: {error.get('Message', error.get('Code'))}" for error in errors)
+
+        for key in keys:
+            batch.append(key)
+            if len(batch) >= DELETE_BATCH_SIZE:
+                flush()
+                batch = []
+        if batch:
+            flush()
+        logger.info(f"{'Would delete' if dry_run else 'Deleted'} {result['deleted']} orphan objects")
+        return result
+
+    def reupload(self, discrepancies: Iterable[Discrepancy], engine, dry_run: bool = False) -> Dict:
+        """Upload the local files of missing and mismatched objects again through a TransferEngine"""
+        result = {'uploaded': 0, 'no_local_file': [], 'errors': []}
+        queued = []
+        for found in discrepancies:
+            if found.kind == 'orphan':
+                continue
+            if not found.local_path or not Path(found.local_path).is_file():
+                result['no_local_file'].append(found.key)
+                continue
+            queued.append((Path(found.local_path), found.key))
+
+        if dry_run:
+            result['uploaded'] = len(queued)
+            return result
+        for upload in engine.upload_many(queued):
+            if not upload['success']:
+                result['errors'].append(f"{upload['r2_key']}: {upload['error']}")
+                continue
+            result['uploaded'] += 1
+            if self.manifest:
+                self.manifest.record(Path(upload['file']), r2_key=upload['r2_key'], etag=upload['etag'])
+        logger.info(f"Re-uploaded {result['uploaded']} of {len(queued)} objects")
+        return result
+
+    def report(self) -> Dict:
+        """Counts so far, with the API calls the run took"""
+        stats = dict(self.stats)
+        stats['discrepancies'] = sum(stats[kind] for kind in KINDS)
+        return stats
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Reference data cache - Books and verse ids held in memory for the life of the process
+Loaded with one query and reloaded only when the reference tables change
+"""
+
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+import psycopg2.extensions
+import logging
+
+from .books import RESOLVER
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_SQL = """
+    SELECT b.id, b.name, b.abbreviation, b.testament, b.book_order, b.chapter_count,
+           c.chapter_number, v.id
+    FROM books b
+    LEFT JOIN verses v ON v.book_id = b.id
+    LEFT JOIN chapters c ON c.id = v.chapter_id
+    ORDER BY b.book_order, c.chapter_number, v.verse_number, v.id
+"""
+
+# Cheap fingerprint of the reference tables: row count plus write counters
+VERSION_SQL = """
+    SELECT (SELECT COUNT(*) FROM books),
+           COALESCE((SELECT SUM(n_tup_ins + n_tup_upd + n_tup_del)
+                     FROM pg_stat_user_tables
+                     WHERE relname IN ('books', 'chapters', 'verses')), 0)
+"""
+
+
+class ReferenceSnapshot:
+    """One immutable load of the reference tables"""
+
+    def __init__(self, rows: List[Tuple], version: Tuple):
+        self.version = version
+        self.books: List[Dict] = []
+        self.books_by_id: Dict[int, Dict] = {}
+        self.books_by_name: Dict[str, Dict] = {}
+        # Verse ids per book in canonical order, and each chapter's slice of that array
+        self.verse_ids: Dict[int, array] = {}
+        self.chapters: Dict[int, Dict[int, Tuple[int, int]]] = {}
+
+        for book_id, name, abbreviation, testament, book_order, chapter_count, chapter, verse_id in rows:
+            if book_id not in self.books_by_id:
+                book = {'id': book_id, 'name': name, 'abbreviation': abbreviation, 'testament': testament,
+                        'book_order': book_order, 'chapter_count': chapter_count}
+                self.books.append(book)
+                self.books_by_id[book_id] = book
+                self.books_by_name[name.lower()] = book
+                self.verse_ids[book_id] = array('i')
+                self.chapters[book_id] = {}
+            if verse_id is None:
+                continue
+            ids = self.verse_ids[book_id]
+            start, _ = self.chapters[book_id].get(chapter, (len(ids), len(ids)))
+            ids.append(verse_id)
+            self.chapters[book_id][chapter] = (start, len(ids))
+
+        # Abbreviations never shadow a full name
+        for book in self.books:
+            if book['abbreviation']:
+                self.books_by_name.setdefault(book['abbreviation'].lower(), book)
+
+
+class ReferenceCache:
+    """Books by name or abbreviation, and compact verse-id arrays per book and chapter
+
+    The first lookup loads everything with a single query. After that the
+    tables are fingerprinted at most every check_interval seconds and
+    reloaded only if they changed.
+    """
+
+    def __init__(self, pool, check_interval: float = 60.0):
+        self.pool = pool
+        self.check_interval = check_interval
+        self._snapshot: Optional[ReferenceSnapshot] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.stats = {'loads': 0, 'checks': 0}
+
+    def _fetch(self, query: str) -> List[Tuple]:
+        # Plain tuple rows: tens of thousands of dicts would cost more than the cache saves
+        with self.pool.cursor(cursor_factory=psycopg2.extensions.cursor) as cursor:
+            cursor.execute(query)
+            return cursor.fetchall()
+
+    def _current(self) -> ReferenceSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return snapshot
+        with self._lock:
+            if self._snapshot is not None and time.monotonic() - self._checked_at < self.check_interval:
+                return self._snapshot
+            version = self._fetch(VERSION_SQL)[0]
+            self.stats['checks'] += 1
+            if self._snapshot is None or self._snapshot.version != version:
+                self._load(version)
+            self._checked_at = time.monotonic()
+            return self._snapshot
+
+    def _load(self, version: Tuple):
+        started = time.perf_counter()
+        snapshot = ReferenceSnapshot(self._fetch(REFERENCE_SQL), version)
+        self._snapshot = snapshot
+        self.stats['loads'] += 1
+        verses = sum(len(ids) for ids in snapshot.verse_ids.values())
+        logger.info(f"Loaded {len(snapshot.books)} books and {verses} verse ids "
+                    f"in {time.perf_counter() - started:.2f}s")
+
+    def invalidate(self):
+        """Force a version check on the next lookup"""
+        self._checked_at = 0.0
+
+    def books(self) -> List[Dict]:
+        """All books in canonical order"""
+        return list(self._current().books)
+
+    def book(self, name: str) -> Optional[Dict]:
+        """Book by name, abbreviation or any spelling the book resolver knows"""
+        snapshot = self._current()
+        book = snapshot.books_by_name.get(name.lower().strip())
+        if book is None:
+            canonical = RESOLVER.resolve(name)
+            book = snapshot.books_by_name.get(canonical.lower()) if canonical else None
+        return book
+
+    def book_by_id(self, book_id: int) -> Optional[Dict]:
+        return self._current().books_by_id.get(book_id)
+
+    def book_id(self, name: str) -> Optional[int]:
+        book = self.book(name)
+        return book['id'] if book else None
+
+    def verse_ids(self, book_id: int, chapter: Optional[int] = None) -> array:
+        """Verse ids of a book, or of one chapter, in canonical order (shared; do not modify)"""
+        snapshot = self._current()
+        ids = snapshot.verse_ids.get(book_id, array('i'))
+        if chapter is None:
+            return ids
+        start, end = snapshot.chapters.get(book_id, {}).get(chapter, (0, 0))
+        return ids[start:end]
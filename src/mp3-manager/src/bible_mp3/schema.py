@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Schema migrations - Versioned DDL for the tables and indexes this package relies on
+Also checks the query plans of the built-in queries for sequential scans of large tables
+"""
+
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+import json
+import logging
+
+from .stats import ensure_catalog_stats
+
+logger = logging.getLogger(__name__)
+
+# Any fixed key works; it only has to match between concurrent migrators
+MIGRATION_LOCK_KEY = 0x6269626c
+
+MIGRATIONS_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+
+SPAN_LINK_DDL = """
+    CREATE TABLE IF NOT EXISTS resource_span_link (
+        id BIGSERIAL PRIMARY KEY,
+        resource_id TEXT NOT NULL REFERENCES resources(id) ON DELETE CASCADE,
+        start_ordinal INTEGER NOT NULL,
+        end_ordinal INTEGER NOT NULL,
+        label TEXT,
+        relevance REAL,
+        meta JSONB,
+        UNIQUE (resource_id, start_ordinal, end_ordinal),
+        CHECK (start_ordinal <= end_ordinal)
+    );
+    CREATE INDEX IF NOT EXISTS idx_resource_span_link_range
+        ON resource_span_link USING gist (int4range(start_ordinal, end_ordinal, '[]'));
+    CREATE INDEX IF NOT EXISTS idx_resource_span_link_resource
+        ON resource_span_link (resource_id);
+"""
+
+LOOKUP_INDEXES_DDL = """
+    CREATE INDEX IF NOT EXISTS idx_verse_resource_link_resource ON verse_resource_link (resource_id);
+    CREATE INDEX IF NOT EXISTS idx_verse_resource_link_verse ON verse_resource_link (verse_id);
+    CREATE INDEX IF NOT EXISTS idx_verses_book ON verses (book_id);
+    CREATE INDEX IF NOT EXISTS idx_resources_type_created ON resources (type, created_at, id);
+"""
+
+# resources.book_id is the book a resource is filed under: the first single-book
+# span or verse link written for it. Triggers keep it set as links are added.
+RESOURCE_BOOK_DDL = """
+    ALTER TABLE resources ADD COLUMN IF NOT EXISTS book_id INTEGER REFERENCES books(id) ON DELETE SET NULL;
+    CREATE INDEX IF NOT EXISTS idx_resources_book_created
+        ON resources (book_id, created_at) WHERE book_id IS NOT NULL;
+
+    UPDATE resources r SET book_id = b.id
+    FROM (
+        SELECT DISTINCT ON (resource_id) resource_id, start_ordinal / 1000000 AS book_order
+        FROM resource_span_link
+        WHERE start_ordinal / 1000000 = end_ordinal / 1000000
+        ORDER BY resource_id, id
+    ) s
+    JOIN books b ON b.book_order = s.book_order
+    WHERE r.id = s.resource_id AND r.book_id IS NULL;
+
+    UPDATE resources r SET book_id = x.book_id
+    FROM (
+        SELECT DISTINCT ON (vrl.resource_id) vrl.resource_id, v.book_id
+        FROM verse_resource_link vrl
+        JOIN verses v ON v.id = vrl.verse_id
+        ORDER BY vrl.resource_id, v.id
+    ) x
+    WHERE r.id = x.resource_id AND r.book_id IS NULL;
+
+    CREATE OR REPLACE FUNCTION resources_file_under_span_book() RETURNS trigger AS $$
+    BEGIN
+        UPDATE resources r SET book_id = b.id
+        FROM (
+            SELECT DISTINCT ON (resource_id) resource_id, start_ordinal / 1000000 AS book_order
+            FROM new_rows
+            WHERE start_ordinal / 1000000 = end_ordinal / 1000000
+            ORDER BY resource_id, start_ordinal
+        ) s
+        JOIN books b ON b.book_order = s.book_order
+        WHERE r.id = s.resource_id AND r.book_id IS NULL;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION resources_file_under_verse_book() RETURNS trigger AS $$
+    BEGIN
+        UPDATE resources r SET book_id = x.book_id
+        FROM (
+            SELECT DISTINCT ON (n.resource_id) n.resource_id, v.book_id
+            FROM new_rows n
+            JOIN verses v ON v.id = n.verse_id
+            ORDER BY n.resource_id, v.id
+        ) x
+        WHERE r.id = x.resource_id AND r.book_id IS NULL;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS resources_file_under_span ON resource_span_link;
+    CREATE TRIGGER resources_file_under_span AFTER INSERT ON resource_span_link
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE PROCEDURE resources_file_under_span_book();
+    DROP TRIGGER IF EXISTS resources_file_under_verse ON verse_resource_link;
+    CREATE TRIGGER resources_file_under_verse AFTER INSERT ON verse_resource_link
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE PROCEDURE resources_file_under_verse_book();
+"""
+
+
+# Bucket reconciliation streams resources in key order; the "C" collation sorts
+# by bytes, as object listings do, and lets key-prefix LIKE use the index
+RESOURCE_OBJECT_KEY_DDL = """
+    CREATE INDEX IF NOT EXISTS idx_resources_object_key
+        ON resources ((COALESCE(local_path, meta->>'r2_key') COLLATE "C"))
+        WHERE type = 'audio';
+"""
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    # SQL text, or a function applying the migration with a cursor
+    apply: Union[str, Callable]
+
+
+# Append only; never renumber or edit a migration that has shipped
+MIGRATIONS: List[Migration] = [
+    Migration(1, "resource span links", SPAN_LINK_DDL),
+    Migration(2, "catalog statistics", ensure_catalog_stats),
+    Migration(3, "lookup indexes", LOOKUP_INDEXES_DDL),
+    Migration(4, "resource book column", RESOURCE_BOOK_DDL),
+    Migration(5, "resource object key index", RESOURCE_OBJECT_KEY_DDL),
+]
+
+
+def applied_versions(cursor) -> Dict[int, str]:
+    """Versions already applied, with their names"""
+    cursor.execute("SELECT to_regclass('schema_migrations') IS NOT NULL AS installed")
+    row = cursor.fetchone()
+    if not (row['installed'] if isinstance(row, dict) else row[0]):
+        return {}
+    cursor.execute("SELECT version, name FROM schema_migrations ORDER BY version")
+    return {
+        (row['version'] if isinstance(row, dict) else row[0]): (row['name'] if isinstance(row, dict) else row[1])
+        for row in cursor.fetchall()
+    }
+
+
+def pending_migrations(pool, target: Optional[int] = None) -> List[Migration]:
+    """Migrations not yet applied, up to target if given"""
+    with pool.cursor() as cursor:
+        applied = applied_versions(cursor)
+    return [m for m in MIGRATIONS if m.version not in applied and (target is None or m.version <= target)]
+
+
+def migrate(pool, target: Optional[int] = None) -> List[Migration]:
+    """Apply pending migrations in order, each in its own transaction
+
+    An advisory lock serializes concurrent runs, so two uploaders starting
+    together apply each migration once. Returns the migrations applied.
+    """
+    applied = []
+    for migration in MIGRATIONS:
+        if target is not None and migration.version > target:
+            break
+        with pool.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_KEY,))
+            cursor.execute(MIGRATIONS_TABLE_DDL)
+            cursor.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (migration.version,))
+            if cursor.fetchone():
+                continue
+            logger.info(f"Applying schema migration {migration.version}: {migration.name}")
+            if callable(migration.apply):
+                migration.apply(cursor)
+            else:
+                cursor.execute(migration.apply)
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                (migration.version, migration.name)
+            )
+        applied.append(migration)
+    return applied
+
+
+def _plan_nodes(node: Dict):
+    yield node
+    for child in node.get('Plans', []):
+        yield from _plan_nodes(child)
+
+
+def explain_query(cursor, sql: str, params: Sequence = ()) -> Dict:
+    """EXPLAIN (not ANALYZE) a query and return its plan tree"""
+    cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params or None)
+    row = cursor.fetchone()
+    plan = row['QUERY PLAN'] if isinstance(row, dict) else row[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']
+
+
+def check_query_plans(cursor,
+                      queries: Sequence[Tuple[str, str, Sequence]],
+                      min_rows: int = 1000) -> List[Dict]:
+    """Flag sequential scans of tables with more than min_rows rows
+
+    queries holds (name, sql, sample params). Table sizes are the planner's
+    estimates, so ANALYZE first. Small tables such as books are cheaper to
+    scan than to index, so they are not reported. Returns one entry
+    per query with its estimated cost and any flagged scans.
+    """
+    cursor.execute("SELECT relname, reltuples FROM pg_class WHERE relkind IN ('r', 'p')")
+    table_rows = {
+        (row['relname'] if isinstance(row, dict) else row[0]): (row['reltuples'] if isinstance(row, dict) else row[1])
+        for row in cursor.fetchall()
+    }
+
+    report = []
+    for name, sql, params in queries:
+        plan = explain_query(cursor, sql, params)
+        seq_scans = [
+            {'table': node['Relation Name'],
+             'table_rows': int(table_rows.get(node['Relation Name'], 0)),
+             'filter': node.get('Filter')}
+            for node in _plan_nodes(plan)
+            if node['Node Type'] == 'Seq Scan' and table_rows.get(node['Relation Name'], 0) > min_rows
+        ]
+        report.append({'query': name, 'total_cost': plan['Total Cost'], 'seq_scans': seq_scans})
+    return report
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Catalog statistics - Row counts kept current by triggers as data is written
+Reads are a single small aggregate; recount_catalog_stats repairs any drift with exact counts
+"""
+
+from typing import Dict
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Each counter is spread over a few slots (picked by backend pid) so concurrent
+# writers do not queue on one hot row; readers sum the slots
+STAT_SLOTS = 8
+
+# Exact definitions, used by recounts and as the fallback before the table exists
+EXACT_COUNTS = {
+    'books': "SELECT COUNT(*) FROM books",
+    'verses': "SELECT COUNT(*) FROM verses",
+    'audio_resources': "SELECT COUNT(*) FROM resources WHERE type = 'audio'",
+    'verse_audio_links': """
+        SELECT COUNT(*)
+        FROM verse_resource_link vrl
+        JOIN resources r ON r.id = vrl.resource_id
+        WHERE r.type = 'audio'
+    """,
+    'audio_span_links': """
+        SELECT COUNT(*)
+        FROM resource_span_link s
+        JOIN resources r ON r.id = s.resource_id
+        WHERE r.type = 'audio'
+    """,
+}
+
+# Statement-level triggers with transition tables: one counter update per
+# statement, however many rows it wrote (PostgreSQL 10+)
+CATALOG_STATS_DDL = f"""
+    CREATE TABLE IF NOT EXISTS catalog_stats (
+        name TEXT NOT NULL,
+        slot SMALLINT NOT NULL DEFAULT 0,
+        value BIGINT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        recounted_at TIMESTAMPTZ,
+        PRIMARY KEY (name, slot)
+    );
+
+    CREATE OR REPLACE FUNCTION catalog_stats_bump(stat TEXT, delta BIGINT) RETURNS void AS $$
+    BEGIN
+        IF delta <> 0 THEN
+            INSERT INTO catalog_stats (name, slot, value)
+            VALUES (stat, pg_backend_pid() % {STAT_SLOTS}, delta)
+            ON CONFLICT (name, slot) DO UPDATE
+                SET value = catalog_stats.value + EXCLUDED.value, updated_at = now();
+        END IF;
+    END $$ LANGUAGE plpgsql;
+
+    -- Plain row counts; TG_ARGV[0] names the counter
+    CREATE OR REPLACE FUNCTION catalog_stats_rows() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            PERFORM catalog_stats_bump(TG_ARGV[0], (SELECT COUNT(*) FROM new_rows));
+        ELSE
+            PERFORM catalog_stats_bump(TG_ARGV[0], -(SELECT COUNT(*) FROM old_rows));
+        END IF;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION catalog_stats_resources() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            PERFORM catalog_stats_bump('audio_resources', (SELECT COUNT(*) FROM new_rows WHERE type = 'audio'));
+        END IF;
+        IF TG_OP IN ('DELETE', 'UPDATE') THEN
+            PERFORM catalog_stats_bump('audio_resources', -(SELECT COUNT(*) FROM old_rows WHERE type = 'audio'));
+        END IF;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql;
+
+    -- Links to audio resources; TG_ARGV[0] names the counter
+    CREATE OR REPLACE FUNCTION catalog_stats_audio_links() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            PERFORM catalog_stats_bump(TG_ARGV[0], (
+                SELECT COUNT(*) FROM new_rows n JOIN resources r ON r.id = n.resource_id WHERE r.type = 'audio'
+            ));
+        ELSE
+            -- Links removed by deleting their resource were already counted by
+            -- catalog_stats_resource_delete, and no longer join here
+            PERFORM catalog_stats_bump(TG_ARGV[0], -(
+                SELECT COUNT(*) FROM old_rows o JOIN resources r ON r.id = o.resource_id WHERE r.type = 'audio'
+            ));
+        END IF;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION catalog_stats_resource_delete() RETURNS trigger AS $$
+    BEGIN
+        IF OLD.type = 'audio' THEN
+            PERFORM catalog_stats_bump('verse_audio_links',
+                -(SELECT COUNT(*) FROM verse_resource_link WHERE resource_id = OLD.id));
+            PERFORM catalog_stats_bump('audio_span_links',
+                -(SELECT COUNT(*) FROM resource_span_link WHERE resource_id = OLD.id));
+        END IF;
+        RETURN OLD;
+    END $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS catalog_stats_books_ins ON books;
+    CREATE TRIGGER catalog_stats_books_ins AFTER INSERT ON books
+        REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE catalog_stats_rows('books');
+    DROP TRIGGER IF EXISTS catalog_stats_books_del ON books;
+    CREATE TRIGGER catalog_stats_books_del AFTER DELETE ON books
+        REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE PROCEDURE catalog_stats_rows('books');
+
+    DROP TRIGGER IF EXISTS catalog_stats_verses_ins ON verses;
+    CREATE TRIGGER catalog_stats_verses_ins AFTER INSERT ON verses
+        REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE catalog_stats_rows('verses');
+    DROP TRIGGER IF EXISTS catalog_stats_verses_del ON verses;
+    CREATE TRIGGER catalog_stats_verses_del AFTER DELETE ON verses
+        REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE PROCEDURE catalog_stats_rows('verses');
+
+    DROP TRIGGER IF EXISTS catalog_stats_resources_ins ON resources;
+    CREATE TRIGGER catalog_stats_resources_ins AFTER INSERT ON resources
+        REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE catalog_stats_resources();
+    DROP TRIGGER IF EXISTS catalog_stats_resources_upd ON resources;
+    CREATE TRIGGER catalog_stats_resources_upd AFTER UPDATE ON resources
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE PROCEDURE catalog_stats_resources();
+    DROP TRIGGER IF EXISTS catalog_stats_resources_del ON resources;
+    CREATE TRIGGER catalog_stats_resources_del AFTER DELETE ON resources
+        REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE PROCEDURE catalog_stats_resources();
+    DROP TRIGGER IF EXISTS catalog_stats_resource_links_del ON resources;
+    CREATE TRIGGER catalog_stats_resource_links_del BEFORE DELETE ON resources
+        FOR EACH ROW EXECUTE PROCEDURE catalog_stats_resource_delete();
+
+    DROP TRIGGER IF EXISTS catalog_stats_vrl_ins ON verse_resource_link;
+    CREATE TRIGGER catalog_stats_vrl_ins AFTER INSERT ON verse_resource_link
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE PROCEDURE catalog_stats_audio_links('verse_audio_links');
+    DROP TRIGGER IF EXISTS catalog_stats_vrl_del ON verse_resource_link;
+    CREATE TRIGGER catalog_stats_vrl_del AFTER DELETE ON verse_resource_link
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE PROCEDURE catalog_stats_audio_links('verse_audio_links');
+
+    DROP TRIGGER IF EXISTS catalog_stats_span_ins ON resource_span_link;
+    CREATE TRIGGER catalog_stats_span_ins AFTER INSERT ON resource_span_link
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE PROCEDURE catalog_stats_audio_links('audio_span_links');
+    DROP TRIGGER IF EXISTS catalog_stats_span_del ON resource_span_link;
+    CREATE TRIGGER catalog_stats_span_del AFTER DELETE ON resource_span_link
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE PROCEDURE catalog_stats_audio_links('audio_span_links');
+"""
+
+
+def _value(row) -> int:
+    return row['count'] if isinstance(row, dict) else row[0]
+
+
+def exact_counts(cursor) -> Dict[str, int]:
+    """Count every statistic from the tables themselves (full scans)"""
+    stats = {}
+    for name, query in EXACT_COUNTS.items():
+        cursor.execute(f"SELECT ({query}) AS count")
+        stats[name] = _value(cursor.fetchone())
+    return stats
+
+
+def read_catalog_stats(cursor) -> Dict[str, int]:
+    """Current counters; empty if they have never been counted"""
+    cursor.execute("SELECT name, SUM(value)::bigint AS count FROM catalog_stats GROUP BY name")
+    rows = cursor.fetchall()
+    stats = {name: 0 for name in EXACT_COUNTS} if rows else {}
+    for row in rows:
+        name = row['name'] if isinstance(row, dict) else row[0]
+        stats[name] = row['count'] if isinstance(row, dict) else row[1]
+    return stats
+
+
+def recount_catalog_stats(cursor) -> Dict[str, int]:
+    """Replace the counters with exact counts
+
+    Writers that would bump a counter wait for this transaction, so no
+    update is lost or counted twice. Commit promptly.
+    """
+    cursor.execute("LOCK TABLE catalog_stats IN SHARE ROW EXCLUSIVE MODE")
+    stats = exact_counts(cursor)
+    cursor.execute("DELETE FROM catalog_stats")
+    for name, value in stats.items():
+        cursor.execute(
+            "INSERT INTO catalog_stats (name, slot, value, recounted_at) VALUES (%s, 0, %s, now())",
+            (name, value)
+        )
+    return stats
+
+
+def ensure_catalog_stats(cursor) -> bool:
+    """Install the counters and their triggers, seeding them with an exact count the first time
+
+    Returns True if a recount was needed.
+    """
+    cursor.execute(CATALOG_STATS_DDL)
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM catalog_stats) AS seeded")
+    row = cursor.fetchone()
+    seeded = row['seeded'] if isinstance(row, dict) else row[0]
+    if seeded:
+        return False
+    recount_catalog_stats(cursor)
+    return True
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Transfer engine - Concurrent multipart uploads to Cloudflare R2
+Runs many files at once with a bounded amount of data in flight; each file is read once
+"""
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import logging
+
+from .governor import UploadGovernor
+from .metrics import METRICS
+from .reader import Part, SinglePassReader
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+class TransferSettings:
+    """Tuning knobs for the transfer engine"""
+
+    def __init__(self,
+                 max_workers: int = 8,
+                 part_size: int = 16 * MB,
+                 part_concurrency: int = 4,
+                 max_inflight_bytes: int = 512 * MB,
+                 adaptive: bool = True,
+                 max_bytes_per_second: Optional[float] = None):
+        if max_workers < 1 or part_concurrency < 1:
+            raise ValueError("max_workers and part_concurrency must be at least 1")
+        if part_size < 5 * MB:
+            # S3/R2 reject multipart parts smaller than 5 MB (except the last)
+            raise ValueError("part_size must be at least 5 MB")
+
+        self.max_workers = max_workers
+        self.part_size = part_size
+        self.part_concurrency = part_concurrency
+        self.max_inflight_bytes = max_inflight_bytes
+        # AIMD concurrency between 1 and max_pool_connections, starting at max_workers
+        self.adaptive = adaptive
+        # Global upload rate cap; None for no cap
+        self.max_bytes_per_second = max_bytes_per_second
+
+    @property
+    def max_pool_connections(self) -> int:
+        """HTTP connections needed to keep every worker's parts moving"""
+        return self.max_workers * self.part_concurrency
+
+    def reservation(self, file_size: int) -> int:
+        """Bytes a single file may hold in memory while it uploads"""
+        if file_size <= self.part_size:
+            reserved = file_size
+        else:
+            reserved = self.part_size * self.part_concurrency
+        # A file larger than the whole budget must still be able to run alone
+        return max(1, min(reserved, file_size, self.max_inflight_bytes))
+
+    def governor(self) -> UploadGovernor:
+        """Request scheduler for these settings"""
+        return UploadGovernor(
+            max_concurrency=self.max_pool_connections,
+            initial_concurrency=self.max_workers,
+            max_bytes_per_second=self.max_bytes_per_second,
+            adaptive=self.adaptive
+        )
+
+
+class ByteBudget:
+    """Counting semaphore measured in bytes"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.in_use = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, amount: int):
+        with self._cond:
+            while self.in_use + amount > self.capacity:
+                self._cond.wait()
+            self.in_use += amount
+
+    def release(self, amount: int):
+        with self._cond:
+            self.in_use -= amount
+            self._cond.notify_all()
+
+
+def _handed_over(first: Part, parts: Iterator[Part]) -> Iterator[Part]:
+    """first, then the rest of parts, without keeping a reference to first once it is taken
+
+    itertools.chain([first], parts) would hold first in its arguments until parts ran out.
+    """
+    part = first
+    del first
+    yield part
+    del part
+    yield from parts
+
+
+class TransferEngine:
+    """Uploads files to an S3-compatible bucket from a pool of workers
+
+    Each file is read once, a part at a time. The same buffers are hashed
+    (SHA-256 of the file, MD5 of each part) and sent, and every ETag the
+    server returns is checked against the MD5s. validate, if given, sees the
+    head of the file before anything is sent and rejects it by returning False.
+    Every PUT and upload part is scheduled by the governor, which sets how
+    many are in flight and caps the bytes sent per second.
+    """
+
+    def __init__(self,
+                 client,
+                 bucket_name: str,
+                 settings: Optional[TransferSettings] = None,
+                 validate: Optional[Callable[[bytes], bool]] = None,
+                 governor: Optional[UploadGovernor] = None):
+        self.client = client
+        self.bucket_name = bucket_name
+        self.settings = settings or TransferSettings()
+        self.validate = validate
+        self.governor = governor or self.settings.governor()
+        self.budget = ByteBudget(self.settings.max_inflight_bytes)
+        self._executor = None
+        self._part_executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.settings.max_workers,
+                    thread_name_prefix="r2-upload"
+                )
+            return self._executor
+
+    @property
+    def part_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._part_executor is None:
+                self._part_executor = ThreadPoolExecutor(
+                    max_workers=self.settings.max_pool_connections,
+                    thread_name_prefix="r2-part"
+                )
+            return self._part_executor
+
+    def upload(self,
+               file_path: Path,
+               r2_key: str,
+               content_type: str = 'audio/mpeg',
+               file_size: Optional[int] = None,
+               metadata: Optional[Dict] = None) -> Dict:
+        """Upload one file, blocking until it is done
+        
+        The result also carries the file's sha256 and a FileSample of its head
+        and tail, so callers need not read the file again for metadata.
+        """
+        file_path = Path(file_path)
+        result = {"file": str(file_path), "r2_key": r2_key, "success": False,
+                  "bytes": 0, "elapsed": 0.0, "read_seconds": 0.0, "hash_seconds": 0.0,
+                  "etag": None, "sha256": None, "sample": None, "error": None}
+        try:
+            if file_size is None:
+                file_size = file_path.stat().st_size
+            reserved = self.settings.reservation(file_size)
+        except OSError as e:
+            result["error"] = str(e)
+            return result
+
+        extra_args = {'ContentType': content_type}
+        if metadata:
+            extra_args['Metadata'] = {key: str(value) for key, value in metadata.items()}
+
+        reader = SinglePassReader(file_path, self.settings.part_size)
+        self.budget.acquire(reserved)
+        started = time.perf_counter()
+        try:
+            etag = self._send(reader, r2_key, extra_args)
+            # Confirm the object landed whole
+            head = self.client.head_object(Bucket=self.bucket_name, Key=r2_key)
+            if head['ContentLength'] != reader.bytes_read:
+                raise IOError(f"Size mismatch after upload: {head['ContentLength']} != {reader.bytes_read}")
+            result.update(success=True, bytes=reader.bytes_read, etag=etag,
+                          sha256=reader.sha256, sample=reader.sample)
+        except Exception as e:
+            logger.error(f"Failed to upload {file_path} to R2: {e}")
+            result["error"] = str(e)
+        finally:
+            self.budget.release(reserved)
+            result.update(elapsed=time.perf_counter() - started,
+                          read_seconds=reader.read_seconds, hash_seconds=reader.hash_seconds)
+            self._record_metrics(result, reader)
+
+        return result
+
+    @staticmethod
+    def _record_metrics(result: Dict, reader: SinglePassReader):
+        METRICS.observe('read_seconds', reader.read_seconds)
+        METRICS.observe('hash_seconds', reader.hash_seconds)
+        METRICS.count('hash_bytes', reader.bytes_read)
+        METRICS.observe('upload_seconds', result["elapsed"])
+        if result["success"]:
+            METRICS.count('upload_files')
+            METRICS.count('upload_bytes', result["bytes"])
+        else:
+            METRICS.count('upload_errors')
+
+    def _send(self, reader: SinglePassReader, r2_key: str, extra_args: Dict) -> str:
+        """Send the file as one PUT or as a multipart upload; returns the verified ETag"""
+        parts = reader.parts()
+        first = next(parts)
+        if self.validate and not self.validate(reader.head):
+            parts.close()
+            raise ValueError("File failed its header check; not uploaded")
+
+        if len(first.data) < self.settings.part_size:
+            response = self._request(
+                self.client.put_object, len(first.data),
+                Bucket=self.bucket_name, Key=r2_key, Body=first.data,
+                ContentMD5=first.content_md5, **extra_args
+            )
+            return self._verify_etag(response['ETag'], reader.expected_etag(multipart=False))
+
+        # Hand the first part to _send_parts instead of holding it for the whole upload,
+        # so no more than part_concurrency parts (what reservation() budgets) are alive
+        parts = _handed_over(first, parts)
+        del first
+        upload_id = self.client.create_multipart_upload(
+            Bucket=self.bucket_name, Key=r2_key, **extra_args
+        )['UploadId']
+        try:
+            completed = self._send_parts(upload_id, r2_key, parts)
+            response = self.client.complete_multipart_upload(
+                Bucket=self.bucket_name, Key=r2_key, UploadId=upload_id,
+                MultipartUpload={'Parts': completed}
+            )
+        except Exception:
+            try:
+                self.client.abort_multipart_upload(Bucket=self.bucket_name, Key=r2_key, UploadId=upload_id)
+            except Exception as e:
+                logger.warning(f"Could not abort multipart upload of {r2_key}: {e}")
+            raise
+        return self._verify_etag(response['ETag'], reader.expected_etag(multipart=True))
+
+    def _send_parts(self, upload_id: str, r2_key: str, parts: Iterator[Part]) -> List[Dict]:
+        """Upload parts as they are read, holding at most part_concurrency in memory"""
+        slots = threading.BoundedSemaphore(self.settings.part_concurrency)
+        futures = []
+        while True:
+            slots.acquire()
+            if any(f.done() and f.exception() for f in futures):
+                slots.release()
+                break  # a part already failed; stop reading
+            part = next(parts, None)
+            if part is None:
+                slots.release()
+                break
+            future = self.part_executor.submit(self._send_part, upload_id, r2_key, part)
+            future.add_done_callback(lambda _: slots.release())
+            futures.append(future)
+            del part  # otherwise a sent part stays alive while the next one is read
+        return [future.result() for future in futures]
+
+    def _send_part(self, upload_id: str, r2_key: str, part: Part) -> Dict:
+        response = self._request(
+            self.client.upload_part, len(part.data),
+            Bucket=self.bucket_name, Key=r2_key, UploadId=upload_id,
+            PartNumber=part.number, Body=part.data, ContentMD5=part.content_md5
+        )
+        etag = response['ETag'].strip('"')
+        if etag != part.etag:
+            raise IOError(f"Part {part.number} of {r2_key} has ETag {etag}, expected {part.etag}")
+        return {'PartNumber': part.number, 'ETag': response['ETag']}
+
+    def _request(self, call: Callable, nbytes: int, **kwargs) -> Dict:
+        """Make one body-carrying request under the governor"""
+        self.governor.acquire(nbytes)
+        started = time.perf_counter()
+        ok = False
+        try:
+            response = call(**kwargs)
+            ok = True
+            return response
+        finally:
+            elapsed = time.perf_counter() - started
+            self.governor.release(nbytes, elapsed, ok)
+            METRICS.observe('upload_request_seconds', elapsed)
+
+    @staticmethod
+    def _verify_etag(etag: str, expected: str) -> str:
+        etag = etag.strip('"')
+        # Stores that do not use S3's md5-of-md5s form for multipart objects are
+        # covered by the per-part checks
+        if '-' in expected and '-' not in etag:
+            return etag
+        if etag != expected:
+            raise IOError(f"ETag mismatch after upload: {etag} != {expected}")
+        return etag
+
+    def submit(self, file_path: Path, r2_key: str, **kwargs) -> Future:
+        """Queue one file for upload on the worker pool"""
+        return self.executor.submit(self.upload, file_path, r2_key, **kwargs)
+
+    def upload_many(self, items: Iterable[Tuple[Path, str]]) -> Iterator[Dict]:
+        """Upload (file_path, r2_key) pairs concurrently, yielding results as they finish
+        
+        items is consumed lazily, so uploads start while a scan is still producing
+        them; at most a few files per worker are queued ahead.
+        """
+        max_pending = self.settings.max_workers * 2
+        pending = set()
+        for file_path, r2_key in items:
+            pending.add(self.submit(file_path, r2_key))
+            done, pending = wait(pending, timeout=0 if len(pending) < max_pending else None,
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+        for future in as_completed(pending):
+            yield future.result()
+
+    def shutdown(self, wait: bool = True):
+        """Stop the worker pools"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+            if self._part_executor is not None:
+                self._part_executor.shutdown(wait=wait)
+                self._part_executor = None
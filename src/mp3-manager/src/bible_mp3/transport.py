@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Upload transports for Cloudflare R2
+An in-process, connection-pooled S3 client by default, with wrangler as a fallback
+"""
+
+import os
+import subprocess
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, Optional
+import logging
+
+from .governor import UploadGovernor
+from .metrics import METRICS
+from .transfer import TransferEngine, TransferSettings
+from .utils import is_mp3_header
+
+logger = logging.getLogger(__name__)
+
+
+def r2_endpoint(account_id: str) -> str:
+    """S3-compatible endpoint for a Cloudflare account"""
+    return f'https://{account_id}.r2.cloudflarestorage.com'
+
+
+def make_s3_client(endpoint_url: str,
+                   access_key: str,
+                   secret_key: str,
+                   max_pool_connections: int = 10):
+    """Build an S3 client that keeps its connections alive between requests"""
+    # boto3 takes a few hundred milliseconds to import; only pay for it when a client is built
+    import boto3
+    from botocore.config import Config
+
+    return boto3.client(
+        's3',
+        endpoint_url=endpoint_url,
+        aws_access_key_id=access_key,
+        aws_secret_access_key=secret_key,
+        region_name='auto',
+        config=Config(
+            signature_version='s3v4',
+            max_pool_connections=max_pool_connections,
+            tcp_keepalive=True,
+            retries={'max_attempts': 5, 'mode': 'standard'}
+        )
+    )
+
+
+class R2Transport(ABC):
+    """Interface for putting objects into the audio bucket; subclasses implement put"""
+
+    name = "base"
+
+    @abstractmethod
+    def put(self,
+            file_path: Path,
+            r2_key: str,
+            metadata: Optional[Dict] = None,
+            content_type: str = 'audio/mpeg') -> Dict:
+        """Upload a file, returning a result dict with success, etag and error"""
+
+    def status(self) -> str:
+        """One-line summary of upload progress, for progress output"""
+        return ""
+
+    def close(self):
+        """Release any held resources"""
+
+
+class S3Transport(R2Transport):
+    """Uploads through a shared, pooled boto3 client
+
+    Each file is read once; results also carry its sha256 and a FileSample.
+    """
+
+    name = "s3"
+
+    def __init__(self,
+                 bucket_name: str,
+                 endpoint_url: Optional[str] = None,
+                 access_key: Optional[str] = None,
+                 secret_key: Optional[str] = None,
+                 settings: Optional[TransferSettings] = None,
+                 client=None,
+                 validate=is_mp3_header):
+        self.bucket_name = bucket_name
+        self.settings = settings or TransferSettings()
+        self.client = client or make_s3_client(
+            endpoint_url, access_key, secret_key, self.settings.max_pool_connections
+        )
+        self.engine = TransferEngine(self.client, bucket_name, self.settings, validate=validate)
+
+    def put(self, file_path, r2_key, metadata=None, content_type='audio/mpeg'):
+        return self.engine.upload(file_path, r2_key, content_type=content_type, metadata=metadata)
+
+    def status(self):
+        return self.engine.governor.status()
+
+    def close(self):
+        self.engine.shutdown()
+
+
+class WranglerTransport(R2Transport):
+    """Uploads by shelling out to `npx wrangler r2 object put`
+
+    Without a fixed timeout, each process gets one scaled to the file's
+    size and the upload speed seen so far. A governor's bandwidth cap is
+    applied between files.
+    """
+
+    name = "wrangler"
+
+    def __init__(self, bucket_name: str, timeout: Optional[float] = None,
+                 governor: Optional[UploadGovernor] = None):
+        self.bucket_name = bucket_name
+        self.timeout = timeout
+        self.governor = governor or UploadGovernor(max_concurrency=1)
+
+    def put(self, file_path, r2_key, metadata=None, content_type='audio/mpeg'):
+        result = {"file": str(file_path), "r2_key": r2_key, "success": False, "etag": None, "error": None}
+        try:
+            file_size = Path(file_path).stat().st_size
+        except OSError as e:
+            result["error"] = str(e)
+            return result
+        timeout = self.timeout or self.governor.timeout_for(file_size)
+        cmd = [
+            'npx', 'wrangler', 'r2', 'object', 'put',
+            f"{self.bucket_name}/{r2_key}",
+            '--file', str(file_path),
+            '--content-type', content_type
+        ]
+
+        # Add metadata
+        if metadata:
+            for key, value in metadata.items():
+                cmd.extend(['--metadata', f"{key}:{str(value)}"])
+
+        self.governor.acquire(file_size)
+        started = time.perf_counter()
+        try:
+            completed = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+            if completed.returncode != 0:
+                result["error"] = completed.stderr.strip()
+            else:
+                result["success"] = True
+        except subprocess.TimeoutExpired:
+            result["error"] = f"timed out after {timeout:.0f}s"
+        except Exception as e:
+            result["error"] = str(e)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.governor.release(file_size, elapsed, ok=result["success"])
+            METRICS.observe('upload_seconds', elapsed)
+            METRICS.count('upload_files' if result["success"] else 'upload_errors')
+            if result["success"]:
+                METRICS.count('upload_bytes', file_size)
+        return result
+
+    def status(self):
+        return self.governor.status()
+
+
+def create_transport(bucket_name: str,
+                     kind: Optional[str] = None,
+                     settings: Optional[TransferSettings] = None) -> R2Transport:
+    """Pick a transport from the environment
+
+    R2_TRANSPORT selects "s3" or "wrangler". Without it, the S3 transport is
+    used whenever R2 credentials are set. S3_ENDPOINT_URL overrides the R2
+    endpoint so a local stand-in (moto_server, MinIO) can be used.
+    """
+    kind = (kind or os.getenv('R2_TRANSPORT') or '').lower()
+    access_key = os.getenv('CLOUDFLARE_R2_ACCESS_KEY')
+    secret_key = os.getenv('CLOUDFLARE_R2_SECRET_KEY')
+    endpoint_url = os.getenv('S3_ENDPOINT_URL')
+    account_id = os.getenv('CLOUDFLARE_ACCOUNT_ID')
+    if not endpoint_url and account_id:
+        endpoint_url = r2_endpoint(account_id)
+
+    has_credentials = bool(access_key and secret_key and endpoint_url)
+    if not kind:
+        kind = 's3' if has_credentials else 'wrangler'
+
+    if kind == 's3':
+        if not has_credentials:
+            raise ValueError("S3 transport needs CLOUDFLARE_R2_ACCESS_KEY, CLOUDFLARE_R2_SECRET_KEY "
+                             "and CLOUDFLARE_ACCOUNT_ID or S3_ENDPOINT_URL")
+        return S3Transport(bucket_name, endpoint_url, access_key, secret_key, settings)
+    if kind == 'wrangler':
+        logger.info("Using wrangler CLI transport (one process per file)")
+        max_bytes_per_second = settings.max_bytes_per_second if settings else None
+        return WranglerTransport(bucket_name, governor=UploadGovernor(
+            max_concurrency=1, max_bytes_per_second=max_bytes_per_second
+        ))
+
+    raise ValueError(f"Unknown R2 transport: {kind}")
@@ -5,20 +5,41 @@ Handles upload to Cloudflare R2 and PostgreSQL metadata storage
 """
 
 import os
-import json
 import hashlib
+import asyncio
+import collections
+import itertools
+import threading
+import time
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
-import boto3
-from botocore.config import Config
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from mutagen import File as MutagenFile
-from mutagen.id3 import ID3NoHeaderError
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from concurrent.futures import Future
 import logging
 
+from .books import resolve_directory
+from .database import insert_book_span
+from .journal import BatchJournal, new_job, stage_reached
+from .manifest import FileStat, IngestManifest
+from .metadata import MetadataExtractor
+from .metrics import METRICS
+from .pipeline import IngestError, Pipeline, Stage
+from .pool import ConnectionPool
+from .profiling import RunProfiler
+from .reference import ReferenceCache
+from .scanner import scan_tree, top_level_dir
+from .transfer import TransferEngine, TransferSettings
+from .transport import make_s3_client, r2_endpoint
+from .writer import BatchedResourceWriter, resource_row
+from .utils import get_audio_metadata, is_mp3_header
+
 logger = logging.getLogger(__name__)
 
+# Log upload speed and concurrency after this many finished files
+PROGRESS_EVERY = 25
+
+# Scanned files are journaled this many at a time, one commit (and fsync) per group
+JOURNAL_BATCH_SIZE = 250
+
 
 class AudioUploader:
     """Handles MP3 uploads to Cloudflare R2 and database linking"""
@@ -28,142 +49,111 @@ class AudioUploader:
                  access_key: str, 
                  secret_key: str,
                  bucket_name: str,
-                 postgres_url: str):
+                 postgres_url: Optional[str] = None,
+                 transfer_settings: Optional[TransferSettings] = None,
+                 endpoint_url: Optional[str] = None,
+                 manifest: Optional[IngestManifest] = None,
+                 pool: Optional[ConnectionPool] = None,
+                 reference: Optional[ReferenceCache] = None,
+                 profiler: Optional[RunProfiler] = None):
         
-        # Initialize R2 client
-        self.r2_client = boto3.client(
-            's3',
-            endpoint_url=f'https://{account_id}.r2.cloudflarestorage.com',
-            aws_access_key_id=access_key,
-            aws_secret_access_key=secret_key,
-            config=Config(signature_version='s3v4')
-        )
+        # Local record of finished files, so re-runs skip them
+        self.manifest = manifest
+        self.transfer_settings = transfer_settings or TransferSettings()
+        
+        # The R2 client and transfer workers are built on first upload (see r2_client),
+        # so constructing an uploader for database work or a dry run skips boto3 entirely
+        self._r2_credentials = (endpoint_url or r2_endpoint(account_id), access_key, secret_key)
+        self._r2_client = None
+        self._transfer = None
+        self._r2_lock = threading.Lock()
         self.bucket_name = bucket_name
         
-        # Initialize database connection
-        self.db_conn = psycopg2.connect(postgres_url)
+        # With a profiler, each file's stage timings are offered to its slowest-files list
+        self.profiler = profiler
+        # Metadata is parsed in worker processes while uploads are in flight
+        self.metadata_extractor = MetadataExtractor(profiler=profiler)
         
-        # Book name mappings for directory parsing
-        self.book_mappings = {
-            "01_Genesis": ("Genesis", 1),
-            "02_Exodus": ("Exodus", 2),
-            "03_Leviticus": ("Leviticus", 3),
-            "04_Numbers": ("Numbers", 4),
-            "05_Deuteronomy": ("Deuteronomy", 5),
-            "06_Joshua": ("Joshua", 6),
-            "07_Judges": ("Judges", 7),
-            "08_Ruth": ("Ruth", 8),
-            "09_1 Samuel": ("1 Samuel", 9),
-            "10_2 Samuel": ("2 Samuel", 10),
-            "11_1 Kings": ("1 Kings", 11),
-            "12_2 Kings": ("2 Kings", 12),
-            "13_1 Chronicles": ("1 Chronicles", 13),
-            "14_2 Chronicles": ("2 Chronicles", 14),
-            "15_Ezra": ("Ezra", 15),
-            "16_Nehemiah": ("Nehemiah", 16),
-            "17_Esther": ("Esther", 17),
-            "18_Job": ("Job", 18),
-            "19_Psalms": ("Psalms", 19),
-            "20_Proverbs": ("Proverbs", 20),
-            "21_Ecclesiastes": ("Ecclesiastes", 21),
-            "22_Song of Solomon": ("Song of Solomon", 22),
-            "23_Isaiah": ("Isaiah", 23),
-            "24_Jeremiah": ("Jeremiah", 24),
-            "25_Lamentations": ("Lamentations", 25),
-            "26_Ezekiel": ("Ezekiel", 26),
-            "27_Daniel": ("Daniel", 27),
-            "28_Hosea": ("Hosea", 28),
-            "29_Joel": ("Joel", 29),
-            "30_Amos": ("Amos", 30),
-            "31_Obadiah": ("Obadiah", 31),
-            "32_Jonah": ("Jonah", 32),
-            "33_Micah": ("Micah", 33),
-            "34_Nahum": ("Nahum", 34),
-            "35_Habakkuk": ("Habakkuk", 35),
-            "36_Zephaniah": ("Zephaniah", 36),
-            "37_Haggai": ("Haggai", 37),
-            "38_Zechariah": ("Zechariah", 38),
-            "39_Malachi": ("Malachi", 39),
-            "40_Matthew": ("Matthew", 40),
-            "41_Mark": ("Mark", 41),
-            "42_Luke": ("Luke", 42),
-            "43_John": ("John", 43),
-            "44_Acts": ("Acts", 44),
-            "45_Romans": ("Romans", 45),
-            "46_1 Corinthians": ("1 Corinthians", 46),
-            "47_2 Corinthians": ("2 Corinthians", 47),
-            "48_Galatians": ("Galatians", 48),
-            "49_Ephesians": ("Ephesians", 49),
-            "50_Philippians": ("Philippians", 50),
-            "51_Colossians": ("Colossians", 51),
-            "52_1 Thessalonians": ("1 Thessalonians", 52),
-            "53_2 Thessalonians": ("2 Thessalonians", 53),
-            "54_1 Timothy": ("1 Timothy", 54),
-            "55_2 Timothy": ("2 Timothy", 55),
-            "56_Titus": ("Titus", 56),
-            "57_Philemon": ("Philemon", 57),
-            "58_Hebrews": ("Hebrews", 58),
-            "59_James": ("James", 59),
-            "60_1 Peter": ("1 Peter", 60),
-            "61_2 Peter": ("2 Peter", 61),
-            "62_1 John": ("1 John", 62),
-            "63_2 John": ("2 John", 63),
-            "64_3 John": ("3 John", 64),
-            "65_Jude": ("Jude", 65),
-            "66_Revelation": ("Revelation", 66)
-        }
+        # Database connections, shared with BibleDatabase when a pool is passed in
+        if pool is None and postgres_url is None:
+            raise ValueError("postgres_url or pool is required")
+        self._owns_pool = pool is None
+        self.pool = pool or ConnectionPool(postgres_url, maxconn=self.transfer_settings.max_workers)
+        # Book lookups are answered from memory; pass BibleDatabase.reference to share one load
+        self.reference = reference or ReferenceCache(self.pool)
+        # Resource rows from the pipeline are committed in groups rather than one per file
+        self.writer = BatchedResourceWriter(self.pool)
+    
+    @property
+    def r2_client(self):
+        """R2 client, sized so every upload worker's parts get a connection"""
+        if self._r2_client is None:
+            with self._r2_lock:
+                if self._r2_client is None:
+                    self._r2_client = make_s3_client(*self._r2_credentials,
+                                                     self.transfer_settings.max_pool_connections)
+        return self._r2_client
+    
+    @property
+    def transfer(self) -> TransferEngine:
+        """Upload engine: files are read once, and the same buffers are hashed, header-checked and uploaded"""
+        if self._transfer is None:
+            client = self.r2_client
+            with self._r2_lock:
+                if self._transfer is None:
+                    self._transfer = TransferEngine(client, self.bucket_name, self.transfer_settings,
+                                                    validate=is_mp3_header)
+        return self._transfer
     
     def get_audio_metadata(self, file_path: Path) -> Dict:
         """Extract metadata from MP3 file"""
-        try:
-            audio_file = MutagenFile(file_path)
-            if audio_file is None:
-                return {}
-                
-            metadata = {
-                'duration': getattr(audio_file.info, 'length', 0),
-                'bitrate': getattr(audio_file.info, 'bitrate', 0),
-                'sample_rate': getattr(audio_file.info, 'sample_rate', 0),
-                'title': '',
-                'artist': '',
-                'album': '',
-                'track': ''
-            }
-            
-            # Extract ID3 tags if available
-            if hasattr(audio_file, 'tags') and audio_file.tags:
-                tags = audio_file.tags
-                metadata.update({
-                    'title': str(tags.get('TIT2', [''])[0]) if 'TIT2' in tags else '',
-                    'artist': str(tags.get('TPE1', [''])[0]) if 'TPE1' in tags else '',
-                    'album': str(tags.get('TALB', [''])[0]) if 'TALB' in tags else '',
-                    'track': str(tags.get('TRCK', [''])[0]) if 'TRCK' in tags else ''
-                })
-            
-            return metadata
-            
-        except (ID3NoHeaderError, Exception) as e:
-            logger.warning(f"Could not extract metadata from {file_path}: {e}")
-            return {}
+        return get_audio_metadata(file_path)
     
     def upload_to_r2(self, file_path: Path, r2_key: str) -> Tuple[bool, str]:
         """Upload MP3 file to Cloudflare R2"""
-        try:
-            with open(file_path, 'rb') as f:
-                self.r2_client.upload_fileobj(
-                    f, 
-                    self.bucket_name, 
-                    r2_key,
-                    ExtraArgs={'ContentType': 'audio/mpeg'}
-                )
-            
-            # Generate streaming URL
-            streaming_url = f"https://your-worker-domain.workers.dev/audio/{r2_key}"
-            return True, streaming_url
-            
-        except Exception as e:
-            logger.error(f"Failed to upload {file_path} to R2: {e}")
-            return False, str(e)
+        result = self.transfer.upload(file_path, r2_key)
+        if not result["success"]:
+            return False, result["error"]
+        
+        return True, self.streaming_url(r2_key)
+    
+    def streaming_url(self, r2_key: str) -> str:
+        """Generate streaming URL for an uploaded key"""
+        return f"https://your-worker-domain.workers.dev/audio/{r2_key}"
+    
+    def audio_resource_row(self,
+                           file_path: Path,
+                           r2_key: str,
+                           streaming_url: str,
+                           book_name: str,
+                           audio_type: str = "sermon",
+                           speaker: str = "John MacArthur",
+                           file_size: Optional[int] = None,
+                           metadata: Optional[Dict] = None,
+                           etag: Optional[str] = None) -> Tuple:
+        """Build the resources row for an uploaded MP3"""
+        if metadata is None:
+            metadata = self.get_audio_metadata(file_path)
+        if file_size is None:
+            file_size = file_path.stat().st_size
+        
+        return resource_row(
+            hashlib.md5(r2_key.encode()).hexdigest()[:16],
+            file_path.name,
+            streaming_url,
+            local_path=r2_key,
+            file_size=file_size,
+            mime_type='audio/mpeg',
+            meta={
+                'duration': metadata.get('duration', 0),
+                'bitrate': metadata.get('bitrate', 0),
+                'audio_type': audio_type,
+                'speaker': speaker,
+                'book_name': book_name,
+                **metadata,
+                **({'etag': etag} if etag else {})
+            }
+        )
     
     def store_audio_metadata(self, 
                            file_path: Path,
@@ -171,154 +161,391 @@ class AudioUploader:
                            streaming_url: str,
                            book_name: str,
                            audio_type: str = "sermon",
-                           speaker: str = "John MacArthur") -> Optional[str]:
+                           speaker: str = "John MacArthur",
+                           file_size: Optional[int] = None,
+                           metadata: Optional[Dict] = None,
+                           etag: Optional[str] = None) -> Optional[str]:
         """Store audio metadata in PostgreSQL"""
         try:
-            metadata = self.get_audio_metadata(file_path)
-            file_size = file_path.stat().st_size
-            
-            # Create resource record
-            resource_id = hashlib.md5(r2_key.encode()).hexdigest()[:16]
-            
-            with self.db_conn.cursor() as cursor:
-                # Insert into resources table
-                cursor.execute("""
-                    INSERT INTO resources (id, type, title, url, local_path, file_size, mime_type, meta)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (id) DO UPDATE SET 
-                        title = EXCLUDED.title,
-                        url = EXCLUDED.url,
-                        file_size = EXCLUDED.file_size,
-                        meta = EXCLUDED.meta
-                """, (
-                    resource_id,
-                    'audio',
-                    file_path.name,
-                    streaming_url,
-                    r2_key,
-                    file_size,
-                    'audio/mpeg',
-                    json.dumps({
-                        'duration': metadata.get('duration', 0),
-                        'bitrate': metadata.get('bitrate', 0),
-                        'audio_type': audio_type,
-                        'speaker': speaker,
-                        'book_name': book_name,
-                        **metadata
-                    })
-                ))
-                
-                self.db_conn.commit()
-                logger.info(f"Stored metadata for {file_path.name} as resource {resource_id}")
-                return resource_id
+            row = self.audio_resource_row(file_path, r2_key, streaming_url, book_name,
+                                          audio_type, speaker, file_size, metadata, etag)
+            resource_id = self.writer.write(row)
+            logger.info(f"Stored metadata for {file_path.name} as resource {resource_id}")
+            return resource_id
                 
         except Exception as e:
             logger.error(f"Failed to store metadata for {file_path}: {e}")
-            self.db_conn.rollback()
             return None
     
-    def link_audio_to_book(self, resource_id: str, book_name: str) -> bool:
-        """Link audio resource to all verses in a book"""
+    def link_audio_to_book(self, resource_id: str, book_name: str) -> int:
+        """Link audio resource to all verses in a book; returns the link rows written (0 on failure)"""
         try:
-            with self.db_conn.cursor() as cursor:
-                # Get book ID
-                cursor.execute("SELECT id FROM books WHERE name = %s", (book_name,))
-                book_result = cursor.fetchone()
-                
-                if not book_result:
-                    logger.warning(f"Book '{book_name}' not found in database")
-                    return False
-                
-                book_id = book_result[0]
-                
-                # Get all verses for this book
-                cursor.execute("SELECT id FROM verses WHERE book_id = %s", (book_id,))
-                verse_ids = [row[0] for row in cursor.fetchall()]
-                
-                if not verse_ids:
-                    logger.warning(f"No verses found for book '{book_name}'")
-                    return False
-                
-                # Link resource to all verses in the book
-                for verse_id in verse_ids:
-                    cursor.execute("""
-                        INSERT INTO verse_resource_link (verse_id, resource_id, label, relevance)
-                        VALUES (%s, %s, %s, %s)
-                        ON CONFLICT DO NOTHING
-                    """, (verse_id, resource_id, f"Audio commentary", 0.85))
-                
-                self.db_conn.commit()
-                logger.info(f"Linked resource {resource_id} to {len(verse_ids)} verses in {book_name}")
-                return True
+            book = self.reference.book(book_name)
+            if not book:
+                logger.warning(f"Book '{book_name}' not found in database")
+                METRICS.count('link_errors')
+                return 0
+            
+            with METRICS.timer('link_seconds'), self.pool.cursor() as cursor:
+                linked = int(insert_book_span(cursor, resource_id, book_id=book['id'], book_order=book['book_order'],
+                                              label="Audio commentary", relevance=0.85))
+            
+            METRICS.count('links', linked)
+            logger.info(f"Linked resource {resource_id} to {book_name}")
+            return linked
                 
         except Exception as e:
             logger.error(f"Failed to link resource {resource_id} to book {book_name}: {e}")
-            self.db_conn.rollback()
-            return False
+            METRICS.count('link_errors')
+            return 0
     
-    def process_grace_to_you_directory(self, base_dir: Path, test_mode: bool = True) -> Dict:
-        """Process Grace to You sermon directories"""
-        results = {"processed": [], "errors": [], "skipped": []}
-        
-        # Find numbered book directories
-        book_dirs = [d for d in base_dir.iterdir() 
-                    if d.is_dir() and any(d.name.startswith(f"{i:02d}_") for i in range(1, 67))]
+    def scan_grace_to_you_directory(self, base_dir: Path, test_mode: bool = True,
+                                    skipped: Optional[List[str]] = None) -> Iterator[Dict]:
+        """Stream sermon files to ingest from the numbered book directories
         
-        for book_dir in sorted(book_dirs):
-            if book_dir.name not in self.book_mappings:
-                logger.warning(f"Unknown book directory: {book_dir.name}")
+        Files the manifest shows as already ingested are appended to skipped.
+        """
+        found = 0
+        book_dirs = {}
+        for record in scan_tree(base_dir, max_depth=2):
+            dir_name = top_level_dir(record, base_dir)
+            if dir_name is None:
+                continue
+            if dir_name not in book_dirs:
+                book_dirs[dir_name] = resolve_directory(dir_name)
+                if book_dirs[dir_name] is None and dir_name[:2].isdigit():
+                    logger.warning(f"Unknown book directory: {dir_name}")
+            if book_dirs[dir_name] is None:
                 continue
             
-            book_name, book_order = self.book_mappings[book_dir.name]
-            logger.info(f"Processing {book_name} from {book_dir}")
-            
-            # Find MP3 files
-            mp3_files = list(book_dir.glob("*.mp3"))
+            book_name, book_order = book_dirs[dir_name]
+            r2_key = f"sermons/john_macarthur/{book_name.lower().replace(' ', '_')}/{record['name']}"
+            file_stat = FileStat(record['size'], record['mtime_ns'])
+            if self.manifest and self.manifest.is_complete(record['path'], r2_key, file_stat):
+                if skipped is not None:
+                    skipped.append(record['path'])
+                continue
             
-            if test_mode and len(results["processed"]) >= 5:
+            yield {"path": record['path'], "book_name": book_name, "r2_key": r2_key,
+                   "size": record['size'], "mtime_ns": record['mtime_ns']}
+            found += 1
+            if test_mode and found >= 5:
                 logger.info("Test mode: Stopping after 5 files")
-                break
-            
-            for mp3_file in mp3_files:
+                return
+    
+    def process_grace_to_you_directory(self,
+                                       base_dir: Path,
+                                       test_mode: bool = True,
+                                       journal: Optional[BatchJournal] = None,
+                                       resume: bool = False,
+                                       pipeline: bool = False) -> Dict:
+        """Process Grace to You sermon directories
+        
+        Uploads start while the scan is still running. With a journal, every
+        file's stage is recorded as it completes. With resume, the last
+        unfinished run continues from those stages instead of rescanning,
+        retrying only files that have not been linked yet. With pipeline,
+        database work also runs concurrently (see _run_pipeline).
+        """
+        results = {"processed": [], "errors": [], "skipped": []}
+        
+        run_id = journal.last_unfinished_run('grace-to-you') if (journal and resume) else None
+        resuming = bool(run_id)
+        resumed = []
+        if run_id:
+            resumed = journal.pending(run_id)
+            logger.info(f"Resuming run {run_id} ({journal.summary(run_id)})")
+        else:
+            if resume:
+                logger.info("No unfinished run to resume, starting a new one")
+            if journal:
+                run_id = journal.start_run('grace-to-you', {"base_dir": str(base_dir), "test_mode": test_mode})
+        
+        def scanned_jobs():
+            # A resumed run only rescans if it was interrupted before the scan finished
+            if resumed and journal.scan_complete(run_id):
+                return
+            scanned = self.scan_grace_to_you_directory(base_dir, test_mode, results["skipped"])
+            if not journal:
+                yield from map(new_job, scanned)
+                return
+            # Files the interrupted run already journaled come back through resumed instead
+            known = journal.paths(run_id) if resuming else set()
+            # A job is handed on only once its row is committed, so its stages can be recorded
+            batch = []
+            for item in scanned:
+                if str(item["path"]) in known:
+                    continue
+                batch.append(item)
+                if len(batch) >= JOURNAL_BATCH_SIZE:
+                    journal.add_items(run_id, batch)
+                    yield from map(new_job, batch)
+                    batch = []
+            if batch:
+                journal.add_items(run_id, batch)
+                yield from map(new_job, batch)
+            journal.mark_scan_complete(run_id)
+        
+        jobs = itertools.chain(resumed, scanned_jobs())
+        
+        if pipeline:
+            results["pipeline_stats"] = self._run_pipeline(jobs, results, journal, run_id)
+            logger.info(f"Pipeline: {results['pipeline_stats']}")
+            return self._finish_run(results, journal, run_id)
+        
+        # Jobs already uploaded by an interrupted run skip the transfer engine
+        by_key, ready = {}, collections.deque()
+        # Rows are committed a writer batch at a time; files link, in order, once theirs is in
+        storing = collections.deque()
+        
+        def finish(job: Dict, upload: Optional[Dict]):
+            queued = self._finish_job(job, upload, results, journal, run_id)
+            if queued:
+                storing.append(queued)
+            while storing and (storing[0][1] is None or storing[0][1].done()):
+                self._complete_job(*storing.popleft(), results, journal, run_id)
+        
+        def upload_feed():
+            for job in jobs:
+                by_key[job["info"]["r2_key"]] = job
+                if stage_reached(job, 'uploaded'):
+                    # Not read for upload this time, so metadata needs a read of its own
+                    if not stage_reached(job, 'db_recorded'):
+                        job["metadata_future"] = self.metadata_extractor.submit(job["path"])
+                    ready.append(job)
+                else:
+                    yield Path(job["path"]), job["info"]["r2_key"]
+        
+        # Uploads run concurrently; database work happens here as each one finishes.
+        # The transfer engine (and boto3) is only built once a file actually needs uploading.
+        feed = upload_feed()
+        first = next(feed, None)
+        uploads = self.transfer.upload_many(itertools.chain([first], feed)) if first else ()
+        for upload in uploads:
+            while ready:
+                finish(ready.popleft(), None)
+            finish(by_key.pop(upload["r2_key"]), upload)
+        while ready:
+            finish(ready.popleft(), None)
+        self.writer.flush()
+        while storing:
+            self._complete_job(*storing.popleft(), results, journal, run_id)
+        
+        return self._finish_run(results, journal, run_id)
+    
+    def _finish_run(self, results: Dict, journal: Optional[BatchJournal], run_id: Optional[int]) -> Dict:
+        """Log run totals and close the journal run if every file made it"""
+        if results["skipped"]:
+            logger.info(f"Skipped {len(results['skipped'])} files unchanged since the last run")
+        results["metadata_stats"] = self.metadata_extractor.report()
+        logger.info(f"Metadata extraction: {results['metadata_stats']}")
+        # A run with nothing to upload never built the transfer engine; don't build it for a report
+        results["transfer_stats"] = self._transfer.governor.snapshot() if self._transfer is not None else {}
+        logger.info(f"Uploads: {results['transfer_stats']}")
+        results["metrics"] = METRICS.snapshot()
+        if journal and not results["errors"]:
+            journal.finish_run(run_id)
+        
+        return results
+    
+    def _finish_job(self,
+                    job: Dict,
+                    upload: Optional[Dict],
+                    results: Dict,
+                    journal: Optional[BatchJournal],
+                    run_id: Optional[int]) -> Optional[Tuple[Dict, Optional[Future]]]:
+        """Journal one file's upload and queue its resource row (upload is None if done by an earlier run)
+        
+        Returns (job, row future) for _complete_job, with no future if an
+        earlier run stored the row, or None if the file failed.
+        """
+        timings = job.setdefault("timings", {})
+        try:
+            if upload is not None:
+                self._record_upload(job, upload, journal, run_id)
+            if stage_reached(job, 'db_recorded'):
+                return job, None
+            started = time.perf_counter()
+            job["metadata"] = self._metadata_future(job).result()["metadata"]
+            timings["metadata"] = time.perf_counter() - started
+            job["record_started"] = time.perf_counter()
+            return job, self.writer.submit(self._job_row(job))
+        except IngestError as e:
+            self._job_failed(job, str(e), results, journal, run_id)
+        except Exception as e:
+            self._job_failed(job, f"Processing failed: {job['path']} - {e}", results, journal, run_id)
+            logger.error(f"Failed to process {job['path']}: {e}")
+        return None
+    
+    def _complete_job(self,
+                      job: Dict,
+                      future: Optional[Future],
+                      results: Dict,
+                      journal: Optional[BatchJournal],
+                      run_id: Optional[int]):
+        """Journal a file's committed resource row and link it"""
+        timings = job.setdefault("timings", {})
+        try:
+            if future is not None:
                 try:
-                    # Generate R2 key
-                    r2_key = f"sermons/john_macarthur/{book_name.lower().replace(' ', '_')}/{mp3_file.name}"
-                    
-                    # Upload to R2
-                    success, streaming_url = self.upload_to_r2(mp3_file, r2_key)
-                    if not success:
-                        results["errors"].append(f"Upload failed: {mp3_file} - {streaming_url}")
-                        continue
-                    
-                    # Store metadata
-                    resource_id = self.store_audio_metadata(
-                        mp3_file, r2_key, streaming_url, book_name, "sermon", "John MacArthur"
-                    )
-                    
-                    if resource_id:
-                        # Link to book verses
-                        if self.link_audio_to_book(resource_id, book_name):
-                            results["processed"].append({
-                                "file": str(mp3_file),
-                                "book": book_name,
-                                "resource_id": resource_id,
-                                "streaming_url": streaming_url
-                            })
-                        else:
-                            results["errors"].append(f"Linking failed: {mp3_file}")
-                    else:
-                        results["errors"].append(f"Metadata storage failed: {mp3_file}")
-                    
-                    if test_mode and len(results["processed"]) >= 5:
-                        break
-                        
+                    resource_id = future.result()
                 except Exception as e:
-                    results["errors"].append(f"Processing failed: {mp3_file} - {e}")
-                    logger.error(f"Failed to process {mp3_file}: {e}")
+                    raise IngestError(f"Metadata storage failed: {job['path']} - {e}")
+                finally:
+                    timings["record"] = time.perf_counter() - job.pop("record_started")
+                self._stored(job, resource_id, journal, run_id)
+            started = time.perf_counter()
+            self._link_job(job, journal, run_id)
+            timings["link"] = time.perf_counter() - started
+            self._job_done(job, results)
+        except IngestError as e:
+            self._job_failed(job, str(e), results, journal, run_id)
+        except Exception as e:
+            self._job_failed(job, f"Processing failed: {job['path']} - {e}", results, journal, run_id)
+            logger.error(f"Failed to process {job['path']}: {e}")
+    
+    def _record_upload(self, job: Dict, upload: Dict, journal: Optional[BatchJournal], run_id: Optional[int]):
+        """Journal a finished upload, raising IngestError if it failed"""
+        mp3_file = Path(job["path"])
+        r2_key = job["info"]["r2_key"]
+        if not upload["success"]:
+            raise IngestError(f"Upload failed: {mp3_file} - {upload['error']}")
+        job.update({"stage": 'uploaded', "sample": upload.get("sample"), "etag": upload["etag"]})
+        job.setdefault("timings", {}).update({
+            "upload": upload["elapsed"], "upload.read": upload["read_seconds"], "upload.hash": upload["hash_seconds"]
+        })
+        if journal:
+            journal.advance(run_id, job["path"], 'uploaded', r2_key=r2_key, etag=upload["etag"])
+        if self.manifest:
+            hashed = {"sha256": upload["sha256"]} if upload.get("sha256") else {}
+            self.manifest.record(mp3_file, r2_key=r2_key, etag=upload["etag"], **hashed)
+    
+    def _metadata_future(self, job: Dict):
+        """Parse metadata from the head the upload kept, or read the file if there is none"""
+        sample = job.pop("sample", None)
+        if sample is not None:
+            return self.metadata_extractor.submit_sample(job["path"], sample)
+        return job.get("metadata_future") or self.metadata_extractor.submit(job["path"])
+    
+    def _job_row(self, job: Dict) -> Tuple:
+        """Resource row for a job whose metadata has been parsed"""
+        r2_key = job["info"]["r2_key"]
+        return self.audio_resource_row(
+            Path(job["path"]), r2_key, self.streaming_url(r2_key), job["info"]["book_name"],
+            file_size=job["info"].get("size"), metadata=job["metadata"], etag=job.get("etag")
+        )
+    
+    def _stored(self, job: Dict, resource_id: str, journal: Optional[BatchJournal], run_id: Optional[int]) -> Dict:
+        """Journal a committed resource row"""
+        job.update({"stage": 'db_recorded', "resource_id": resource_id})
+        if journal:
+            journal.advance(run_id, job["path"], 'db_recorded', resource_id=resource_id)
+        if self.manifest:
+            self.manifest.record(Path(job["path"]), resource_id=resource_id)
+        return job
+    
+    def _link_job(self, job: Dict, journal: Optional[BatchJournal], run_id: Optional[int]) -> Dict:
+        """Link the stored resource to its book"""
+        mp3_file = Path(job["path"])
+        job["links"] = self.link_audio_to_book(job["resource_id"], job["info"]["book_name"])
+        if not job["links"]:
+            raise IngestError(f"Linking failed: {mp3_file}")
+        job["stage"] = 'linked'
+        if journal:
+            journal.advance(run_id, job["path"], 'linked')
+        if self.manifest:
+            self.manifest.record(mp3_file, linked=True)
+        return job
+    
+    def _job_done(self, job: Dict, results: Dict):
+        """Add a fully linked file to the results"""
+        if self.profiler:
+            self.profiler.record_file(job["path"], job.get("timings", {}))
+        results["processed"].append({
+            "file": job["path"],
+            "book": job["info"]["book_name"],
+            "resource_id": job["resource_id"],
+            "streaming_url": self.streaming_url(job["info"]["r2_key"])
+        })
+        if len(results["processed"]) % PROGRESS_EVERY == 0:
+            uploads = f"; uploads: {self._transfer.governor.status()}" if self._transfer is not None else ""
+            logger.info(f"{len(results['processed'])} files done{uploads}")
+    
+    def _job_failed(self, job: Dict, message: str, results: Dict,
+                    journal: Optional[BatchJournal], run_id: Optional[int]):
+        """Report a failed file; the journal keeps the last stage it completed"""
+        results["errors"].append(message)
+        if self.profiler:
+            self.profiler.record_file(job["path"], job.get("timings", {}), error=message)
+        if journal:
+            journal.fail(run_id, job["path"], message)
+    
+    def _run_pipeline(self,
+                      jobs: Iterable[Dict],
+                      results: Dict,
+                      journal: Optional[BatchJournal],
+                      run_id: Optional[int]) -> Dict:
+        """Ingest jobs through the staged pipeline: upload -> metadata -> record -> link
         
-        return results
+        Uploads run on the transfer engine's threads and metadata is parsed on
+        the extractor's process pool from the head of the file the upload
+        read; both are awaited, not blocked on. Database stages share the
+        connection pool. Returns the pipeline report.
+        """
+        async def extract(job: Dict) -> Dict:
+            result = await asyncio.wrap_future(self._metadata_future(job))
+            job["metadata"] = result["metadata"]
+            return job
+        
+        async def upload(job: Dict) -> Dict:
+            result = await asyncio.wrap_future(self.transfer.submit(
+                Path(job["path"]), job["info"]["r2_key"], file_size=job["info"].get("size")
+            ))
+            # Journal writes fsync, so they stay off the event loop
+            await asyncio.to_thread(self._record_upload, job, result, journal, run_id)
+            return job
+        
+        async def record(job: Dict) -> Dict:
+            try:
+                resource_id = await asyncio.wrap_future(self.writer.submit(self._job_row(job)))
+            except Exception as e:
+                raise IngestError(f"Metadata storage failed: {job['path']} - {e}")
+            await asyncio.to_thread(self._stored, job, resource_id, journal, run_id)
+            return job
+        
+        def on_result(job: Dict):
+            if not job.get("failed_stage"):
+                self._job_done(job, results)
+                return
+            error = job["exception"]
+            message = str(error) if isinstance(error, IngestError) else \
+                f"Processing failed: {job['path']} - {error}"
+            if not isinstance(error, IngestError):
+                logger.error(f"Failed to process {job['path']} in {job['failed_stage']}: {error}")
+            self._job_failed(job, message, results, journal, run_id)
+        
+        db_workers = max(1, self.pool.maxconn // 2)
+        pipeline = Pipeline([
+            Stage("upload", upload, workers=self.transfer_settings.max_workers,
+                  skip=lambda job: stage_reached(job, 'uploaded')),
+            Stage("metadata", extract, workers=self.metadata_extractor.window,
+                  skip=lambda job: stage_reached(job, 'db_recorded')),
+            # Enough records in flight to fill a writer batch
+            Stage("record", record, workers=self.writer.batch_size,
+                  skip=lambda job: stage_reached(job, 'db_recorded')),
+            Stage("link", lambda job: self._link_job(job, journal, run_id), workers=db_workers),
+        ], queue_size=self.transfer_settings.max_workers * 2)
+        report = pipeline.run(jobs, on_result)
+        report["writer"] = dict(self.writer.stats)
+        return report
     
     def __del__(self):
-        """Cleanup database connection"""
-        if hasattr(self, 'db_conn'):
-            self.db_conn.close()
+        """Cleanup transfer workers and database connections"""
+        if hasattr(self, 'writer'):
+            self.writer.close()
+        if getattr(self, '_transfer', None) is not None:
+            self._transfer.shutdown(wait=False)
+        if hasattr(self, 'metadata_extractor'):
+            self.metadata_extractor.shutdown(wait=False)
+        if getattr(self, '_owns_pool', False):
+            self.pool.close()
@@ -4,129 +4,45 @@ Utility functions for Bible MP3 management
 File parsing, book name extraction, and metadata helpers
 """
 
+import functools
+import mmap
 import re
+import struct
 from pathlib import Path
-from typing import Dict, Optional, Tuple
+from typing import Dict, NamedTuple, Optional, Tuple
 import logging
 
+from .books import RESOLVER
+
 logger = logging.getLogger(__name__)
 
 
 def extract_book_from_filename(filename: str) -> Optional[str]:
     """Extract Bible book name from filename"""
-    # Common patterns for book names in filenames
-    patterns = [
-        # Pattern: "01 Genesis" or "01_Genesis"
-        r'(\d{1,2})[_\s]*(.+?)(?:\.\w+)?$',
-        # Pattern: "Genesis 01" or "Genesis_01" 
-        r'^(.+?)[_\s]*(\d{1,2})(?:\.\w+)?$',
-        # Pattern: just book name
-        r'^([a-zA-Z\s]+)(?:\d+)?(?:\.\w+)?$'
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, filename, re.IGNORECASE)
-        if match:
-            # Try to identify which group is the book name
-            groups = match.groups()
-            for group in groups:
-                if group and not group.isdigit():
-                    # Clean up the book name
-                    book_name = group.strip('_- ').title()
-                    return normalize_book_name(book_name)
-    
-    return None
+    return RESOLVER.resolve(filename)
 
 
 def normalize_book_name(book_name: str) -> str:
-    """Normalize book name to standard format"""
-    # Dictionary to handle common variations
-    name_mappings = {
-        '1st Corinthians': '1 Corinthians',
-        '2nd Corinthians': '2 Corinthians',
-        '1st John': '1 John',
-        '2nd John': '2 John',
-        '3rd John': '3 John',
-        '1st Peter': '1 Peter',
-        '2nd Peter': '2 Peter',
-        '1st Samuel': '1 Samuel',
-        '2nd Samuel': '2 Samuel',
-        '1st Kings': '1 Kings',
-        '2nd Kings': '2 Kings',
-        '1st Chronicles': '1 Chronicles',
-        '2nd Chronicles': '2 Chronicles',
-        '1st Timothy': '1 Timothy',
-        '2nd Timothy': '2 Timothy',
-        '1st Thessalonians': '1 Thessalonians',
-        '2nd Thessalonians': '2 Thessalonians',
-        'Song Of Songs': 'Song of Solomon',
-        'Ecclesiast': 'Ecclesiastes',
-        'Phil': 'Philippians',
-        'Col': 'Colossians',
-        'Thess': 'Thessalonians',
-        'Tim': 'Timothy',
-        'Philem': 'Philemon',
-        'Heb': 'Hebrews',
-        'Rev': 'Revelation'
-    }
-    
-    # Check for exact matches first
-    if book_name in name_mappings:
-        return name_mappings[book_name]
-    
-    # Check for partial matches
-    for variant, standard in name_mappings.items():
-        if variant.lower() in book_name.lower():
-            return standard
-    
-    return book_name
+    """Normalize book name to standard format (unrecognised names are returned unchanged)"""
+    return RESOLVER.resolve(book_name) or book_name
 
 
 def get_audio_metadata(file_path: Path) -> Dict:
-    """Extract audio metadata from file"""
-    try:
-        from mutagen import File as MutagenFile
-        
-        audio = MutagenFile(file_path)
-        if audio is None:
-            return {}
-        
-        metadata = {
-            'duration': getattr(audio.info, 'length', 0),
-            'bitrate': getattr(audio.info, 'bitrate', 0),
-            'file_size': file_path.stat().st_size,
-            'format': file_path.suffix.lower()
-        }
-        
-        # Add ID3 tags if available
-        if hasattr(audio, 'tags') and audio.tags:
-            tags = audio.tags
-            metadata.update({
-                'title': str(tags.get('TIT2', [''])[0]) if 'TIT2' in tags else '',
-                'artist': str(tags.get('TPE1', [''])[0]) if 'TPE1' in tags else '',
-                'album': str(tags.get('TALB', [''])[0]) if 'TALB' in tags else '',
-            })
-        
-        return metadata
-        
-    except ImportError:
-        logger.warning("Mutagen not installed, skipping audio metadata extraction")
-        return {'file_size': file_path.stat().st_size}
-    except Exception as e:
-        logger.error(f"Failed to extract metadata from {file_path}: {e}")
-        return {'file_size': file_path.stat().st_size}
+    """Extract audio metadata from file
+    
+    Reads only the tag and first frames; see bible_mp3.metadata for batch extraction.
+    """
+    from .metadata import extract_metadata
+    
+    result = extract_metadata(file_path)
+    if result['error']:
+        logger.warning(f"Failed to extract metadata from {file_path}: {result['error']}")
+    return result['metadata']
 
 
 def parse_directory_name(dir_name: str) -> Tuple[Optional[str], Optional[int]]:
     """Parse directory name to extract book name and order"""
-    # Pattern for "01_Genesis" style directories
-    match = re.match(r'(\d{1,2})_(.+)', dir_name)
-    if match:
-        book_order = int(match.group(1))
-        book_name = normalize_book_name(match.group(2).replace('_', ' '))
-        return book_name, book_order
-    
-    return None, None
+    return RESOLVER.resolve_directory(dir_name) or (None, None)
 
 
 def generate_r2_key(audio_type: str, speaker: str, book_name: str, filename: str) -> str:
@@ -142,6 +58,196 @@ def generate_r2_key(audio_type: str, speaker: str, book_name: str, filename: str
     return f"{audio_type}/{sanitized_speaker}/{sanitized_book}/{sanitized_filename}"
 
 
+# MPEG audio Layer III frame headers
+MPEG_VERSIONS = {0: 2.5, 2: 2, 3: 1}  # version bits -> MPEG version (1 is reserved)
+LAYER_III_BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+SAMPLE_RATES = {1: (44100, 48000, 32000), 2: (22050, 24000, 16000), 2.5: (11025, 12000, 8000)}
+ID3V1_SIZE = 128
+
+
+class FrameHeader(NamedTuple):
+    version: float
+    bitrate: int  # bits per second
+    sample_rate: int
+    channels: int
+    length: int  # bytes, including the header
+    samples: int  # per frame
+
+
+def id3v2_size(header: bytes) -> int:
+    """Total size of a leading ID3v2 tag (0 if there is none)"""
+    if len(header) < 10 or not header.startswith(b'ID3'):
+        return 0
+    # Synchsafe integer: 7 bits per byte
+    size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+    footer = 10 if header[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def is_mp3_header(header: bytes) -> bool:
+    """True if bytes start with an ID3 tag or an MPEG Layer III frame sync (any MPEG version)"""
+    if header.startswith(b'ID3'):
+        return True
+    return len(header) >= 2 and header[0] == 0xFF and header[1] & 0xE6 == 0xE2
+
+
+def parse_frame_header(buf, pos: int) -> Optional[FrameHeader]:
+    """Decode the Layer III frame header at buf[pos:pos + 4], or None if there is not one"""
+    if pos + 4 > len(buf) or buf[pos] != 0xFF:
+        return None
+    b1, b2, b3 = buf[pos + 1], buf[pos + 2], buf[pos + 3]
+    # Frame sync and layer III; the CRC-protection bit may be either value
+    if b1 & 0xE6 != 0xE2:
+        return None
+    version = MPEG_VERSIONS.get((b1 >> 3) & 0x03)
+    bitrate_index, rate_index = b2 >> 4, (b2 >> 2) & 0x03
+    # Free-format and reserved values cannot be scanned
+    if version is None or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    bitrate = LAYER_III_BITRATES[1 if version == 1 else 2][bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version][rate_index]
+    samples = 1152 if version == 1 else 576
+    length = samples // 8 * bitrate // sample_rate + ((b2 >> 1) & 0x01)
+    return FrameHeader(version, bitrate, sample_rate, 1 if b3 >> 6 == 3 else 2, length, samples)
+
+
+@functools.lru_cache(maxsize=None)
+def frame_table() -> Dict[int, Tuple[int, int]]:
+    """(length, samples) for every valid second and third header byte, keyed b1 << 8 | b2
+
+    Frame walking runs once per frame, so it looks lengths up rather than
+    decoding headers. Built on first use.
+    """
+    table = {}
+    for b1 in (b for b in range(0xE0, 0x100) if b & 0xE6 == 0xE2):
+        for b2 in range(0x100):
+            header = parse_frame_header(bytes((0xFF, b1, b2, 0)), 0)
+            if header is not None:
+                table[b1 << 8 | b2] = (header.length, header.samples)
+    return table
+
+
+def find_first_frame(buf, start: int = 0, end: Optional[int] = None) -> Optional[Tuple[int, FrameHeader]]:
+    """First frame at or after start whose successor (if in range) is also a frame
+
+    Requiring two consecutive headers skips stray 0xFF bytes in tag padding.
+    """
+    end = len(buf) if end is None else end
+    pos = start
+    while True:
+        pos = buf.find(b'\xff', pos, end - 3)
+        if pos < 0:
+            return None
+        header = parse_frame_header(buf, pos)
+        if header is not None:
+            following = pos + header.length
+            if following + 4 > end or parse_frame_header(buf, following) is not None:
+                return pos, header
+        pos += 1
+
+
+def _vbr_header(buf, pos: int, header: FrameHeader) -> Optional[Tuple[str, int, Optional[int]]]:
+    """(kind, frames, bytes) from a Xing/Info or VBRI header in the first frame"""
+    if header.version == 1:
+        side_info = 17 if header.channels == 1 else 32
+    else:
+        side_info = 9 if header.channels == 1 else 17
+    xing = pos + 4 + side_info
+    if buf[xing:xing + 4] in (b'Xing', b'Info') and xing + 8 <= len(buf):
+        flags, = struct.unpack_from('>I', buf, xing + 4)
+        offset, frames, size = xing + 8, None, None
+        if flags & 0x1 and offset + 4 <= len(buf):
+            frames, = struct.unpack_from('>I', buf, offset)
+            offset += 4
+        if flags & 0x2 and offset + 4 <= len(buf):
+            size, = struct.unpack_from('>I', buf, offset)
+        if frames:
+            return 'xing', frames, size
+    vbri = pos + 36
+    if buf[vbri:vbri + 4] == b'VBRI' and vbri + 18 <= len(buf):
+        size, frames = struct.unpack_from('>II', buf, vbri + 10)
+        if frames:
+            return 'vbri', frames, size
+    return None
+
+
+def scan_mp3(buf, file_size: Optional[int] = None, audio_limit: Optional[int] = None) -> Optional[Dict]:
+    """Duration and bitrate of MP3 audio in a buffer (bytes, or an mmap)
+
+    buf may be only the start of the file, with file_size the full size, and
+    audio_limit stops the scan that many bytes past the ID3v2 tag. Duration
+    is exact from a Xing/Info or VBRI header, or from counting every frame
+    when the whole file is scanned; otherwise it is extrapolated from the
+    average bitrate of the frames that were. Returns None if no frame is found.
+    """
+    file_size = len(buf) if file_size is None else file_size
+    audio_start = id3v2_size(buf[:10])
+    end = len(buf)
+    # An ID3v1 tag at the end is not audio
+    if end == file_size and end >= ID3V1_SIZE and buf[end - ID3V1_SIZE:end - ID3V1_SIZE + 3] == b'TAG':
+        end -= ID3V1_SIZE
+    if audio_limit is not None:
+        end = min(end, audio_start + audio_limit)
+    found = find_first_frame(buf, audio_start, end)
+    if found is None:
+        return None
+    start, first = found
+    info = {'sample_rate': first.sample_rate, 'channels': first.channels,
+            'mpeg_version': first.version, 'audio_start': start}
+
+    vbr = _vbr_header(buf, start, first)
+    if vbr:
+        kind, frames, size = vbr
+        duration = frames * first.samples / first.sample_rate
+        audio_bytes = size or (file_size - start)
+        info.update(duration=duration, frames=frames, method=kind,
+                    bitrate=int(audio_bytes * 8 / duration) if duration else first.bitrate)
+        return info
+
+    # No VBR header: walk the frames (indexing an mmap reads it in place, without copying)
+    frames, audio_bytes, samples, pos = 0, 0, 0, start
+    table = frame_table()
+    while pos + 4 <= end:
+        entry = table.get(buf[pos + 1] << 8 | buf[pos + 2]) if buf[pos] == 0xFF else None
+        if entry is None:
+            found = find_first_frame(buf, pos + 1, end)
+            if found is None:
+                break
+            pos = found[0]
+            entry = found[1].length, found[1].samples
+        length, frame_samples = entry
+        frames += 1
+        samples += frame_samples
+        audio_bytes += length
+        pos += length
+
+    seconds = samples / first.sample_rate
+    bitrate = int(audio_bytes * 8 / seconds) if seconds else first.bitrate
+    if end < file_size - ID3V1_SIZE:
+        # Only part of the file was scanned: extend by the average bitrate seen
+        info.update(duration=(file_size - start) * 8 / bitrate, frames=None, method='estimate', bitrate=bitrate)
+    else:
+        info.update(duration=seconds, frames=frames, method='frames', bitrate=bitrate)
+    return info
+
+
+def scan_mp3_file(file_path: Path, exact: bool = True) -> Optional[Dict]:
+    """scan_mp3 over a memory-mapped file, so only the pages touched are read
+
+    Without exact, a file lacking a VBR header is estimated from its first
+    256 KB of audio instead of having every frame counted.
+    """
+    with open(file_path, 'rb') as f:
+        size = f.seek(0, 2)
+        if size == 0:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            return scan_mp3(m, size, None if exact else 256 * 1024)
+
+
 def validate_mp3_file(file_path: Path) -> bool:
     """Validate that file is a valid MP3"""
     if not file_path.exists():
@@ -154,17 +260,13 @@ def validate_mp3_file(file_path: Path) -> bool:
     if file_path.stat().st_size < 1024:
         return False
     
-    # Try to read MP3 header
+    # Look for the first audio frame past any ID3v2 tag
     try:
         with open(file_path, 'rb') as f:
-            header = f.read(3)
-            # Check for MP3 magic bytes (ID3 tag or MP3 frame header)
-            if header.startswith(b'ID3') or header.startswith(b'\xff\xfb'):
-                return True
+            f.seek(id3v2_size(f.read(10)))
+            return find_first_frame(f.read(64 * 1024)) is not None
     except Exception:
-        pass
-    
-    return False
+        return False
 
 
 def format_duration(seconds: float) -> str:
@@ -181,16 +283,31 @@ def format_duration(seconds: float) -> str:
         return f"{hours}h {minutes}m"
 
 
-def calculate_file_hash(file_path: Path) -> str:
-    """Calculate SHA256 hash of file for deduplication"""
+def calculate_file_hash(file_path: Path, manifest=None) -> str:
+    """Calculate SHA256 hash of file for deduplication
+    
+    With an IngestManifest, a file whose size and mtime are unchanged is
+    answered from the manifest without being opened.
+    """
     import hashlib
     
-    hash_sha256 = hashlib.sha256()
+    file_path = Path(file_path)
     try:
+        stat_result = file_path.stat()
+        if manifest is not None:
+            entry = manifest.lookup(file_path, stat_result)
+            if entry and entry['sha256']:
+                return entry['sha256']
+        
+        hash_sha256 = hashlib.sha256()
         with open(file_path, 'rb') as f:
-            for chunk in iter(lambda: f.read(4096), b""):
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
                 hash_sha256.update(chunk)
-        return hash_sha256.hexdigest()
+        digest = hash_sha256.hexdigest()
+        
+        if manifest is not None:
+            manifest.record(file_path, stat_result, sha256=digest)
+        return digest
     except Exception as e:
         logger.error(f"Failed to calculate hash for {file_path}: {e}")
         return ""
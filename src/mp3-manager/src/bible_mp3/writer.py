@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Resource writer - Buffers resource upserts and commits them in groups
+One multi-row INSERT ... RETURNING per batch, with per-row results for every caller
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Sequence, Tuple
+import psycopg2
+import psycopg2.extras
+from psycopg2.extras import execute_values
+import logging
+
+from .metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+RESOURCE_COLUMNS = ('id', 'type', 'title', 'url', 'local_path', 'provider', 'file_size', 'mime_type', 'meta')
+
+UPSERT_RESOURCES_SQL = f"""
+    INSERT INTO resources ({', '.join(RESOURCE_COLUMNS)}, created_at)
+    VALUES %s
+    ON CONFLICT (id) DO UPDATE SET
+        title = EXCLUDED.title,
+        url = EXCLUDED.url,
+        local_path = COALESCE(EXCLUDED.local_path, resources.local_path),
+        file_size = COALESCE(EXCLUDED.file_size, resources.file_size),
+        meta = EXCLUDED.meta
+    RETURNING id
+"""
+UPSERT_TEMPLATE = f"({', '.join(['%s'] * len(RESOURCE_COLUMNS))}, NOW())"
+
+
+def resource_row(resource_id: str,
+                 title: str,
+                 url: str,
+                 resource_type: str = 'audio',
+                 local_path: Optional[str] = None,
+                 provider: Optional[str] = None,
+                 file_size: Optional[int] = None,
+                 mime_type: Optional[str] = None,
+                 meta: Optional[Dict] = None) -> Tuple:
+    """Values for one resources row, in RESOURCE_COLUMNS order"""
+    return (resource_id, resource_type, title, url, local_path, provider, file_size, mime_type,
+            psycopg2.extras.Json(meta or {}))
+
+
+def upsert_resources(cursor, rows: Sequence[Tuple]) -> List[str]:
+    """Insert or update resource rows in one statement, returning the ids written
+
+    A later row with the same id replaces an earlier one, since one statement
+    cannot update the same row twice.
+    """
+    unique = list({row[0]: row for row in rows}.values())
+    if not unique:
+        return []
+    returned = execute_values(cursor, UPSERT_RESOURCES_SQL, unique, template=UPSERT_TEMPLATE,
+                              page_size=len(unique), fetch=True)
+    return [row['id'] if isinstance(row, dict) else row[0] for row in returned]
+
+
+class BatchedResourceWriter:
+    """Collects resource rows and writes them batch_size at a time, or after flush_ms
+
+    With flush_ms=None rows wait for a full batch or an explicit flush().
+
+    submit() returns a Future that resolves to the resource id once its batch
+    is committed, or raises that row's database error. If a batch fails, its
+    rows are retried one by one under savepoints so a single bad row only
+    fails itself.
+    """
+
+    def __init__(self, pool, batch_size: int = 100, flush_ms: Optional[float] = 200.0):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self.pool = pool
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000.0 if flush_ms is not None else None
+        self._pending: List[Tuple[Tuple, Future]] = []
+        self._oldest = 0.0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self.stats = {'rows': 0, 'batches': 0, 'failed_rows': 0, 'row_fallbacks': 0}
+
+    def submit(self, row: Tuple) -> Future:
+        """Queue a row built with resource_row"""
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Resource writer is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="resource-writer", daemon=True)
+                self._thread.start()
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append((row, future))
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+        return future
+
+    def write(self, row: Tuple) -> str:
+        """Write one row now, on the calling thread, and return its id"""
+        future = Future()
+        self._write_batch([(row, future)])
+        return future.result()
+
+    def flush(self):
+        """Write everything queued so far on the calling thread"""
+        with self._cond:
+            pending, self._pending = self._pending, []
+        for start in range(0, len(pending), self.batch_size):
+            self._write_batch(pending[start:start + self.batch_size])
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                # Wait for a full batch, but never hold a row longer than flush_interval
+                while len(self._pending) < self.batch_size and not self._closed:
+                    if self.flush_interval is None:
+                        self._cond.wait()
+                        continue
+                    remaining = self._oldest + self.flush_interval - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:self.batch_size]
+                del self._pending[:self.batch_size]
+                self._oldest = time.monotonic()
+            self._write_batch(batch)
+
+    def _write_batch(self, batch: List[Tuple[Tuple, Future]]):
+        if not batch:
+            return  # a flush() on another thread took the rows
+        rows = [row for row, _ in batch]
+        started = time.perf_counter()
+        try:
+            with self.pool.connection() as conn:
+                with conn.cursor() as cursor:
+                    errors = self._upsert(cursor, rows)
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Failed to write {len(rows)} resources: {e}")
+            METRICS.count('resource_errors', len(rows))
+            with self._cond:
+                self.stats['failed_rows'] += len(rows)
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        METRICS.observe('resource_upsert_seconds', time.perf_counter() - started)
+        METRICS.count('resource_rows', len(rows) - len(errors))
+        if errors:
+            METRICS.count('resource_errors', len(errors))
+        with self._cond:
+            self.stats['batches'] += 1
+            self.stats['rows'] += len(rows) - len(errors)
+            self.stats['failed_rows'] += len(errors)
+        for row, future in batch:
+            error = errors.get(row[0])
+            if error is None:
+                future.set_result(row[0])
+            else:
+                future.set_exception(error)
+
+    def _upsert(self, cursor, rows: List[Tuple]) -> Dict[str, Exception]:
+        """Upsert rows, falling back to one at a time; returns errors by resource id"""
+        cursor.execute("SAVEPOINT resource_batch")
+        try:
+            upsert_resources(cursor, rows)
+            cursor.execute("RELEASE SAVEPOINT resource_batch")
+            return {}
+        except psycopg2.DatabaseError as e:
+            if len(rows) == 1:
+                cursor.execute("ROLLBACK TO SAVEPOINT resource_batch")
+                return {rows[0][0]: e}
+            logger.warning(f"Batch of {len(rows)} resources failed ({e}), retrying row by row")
+            cursor.execute("ROLLBACK TO SAVEPOINT resource_batch")
+
+        with self._cond:
+            self.stats['row_fallbacks'] += 1
+        errors = {}
+        for row in rows:
+            cursor.execute("SAVEPOINT resource_row")
+            try:
+                upsert_resources(cursor, [row])
+                cursor.execute("RELEASE SAVEPOINT resource_row")
+            except psycopg2.DatabaseError as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT resource_row")
+                errors[row[0]] = e
+        return errors
+
+    def close(self):
+        """Write anything still queued and stop the background thread"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Transfer engine tests
+Multipart uploads against an in-memory stand-in for the S3 client
+"""
+
+import hashlib
+import os
+import sys
+import threading
+from pathlib import Path
+
+# Add the package to the path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from bible_mp3.transfer import MB, TransferEngine, TransferSettings
+
+
+class StubS3Client:
+    """Keeps uploaded objects in memory and answers like S3"""
+
+    def __init__(self, corrupt_part=None):
+        self.corrupt_part = corrupt_part
+        self.objects = {}
+        self.parts = {}
+        self.completed = []
+        self.aborted = []
+        self._lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = Body
+        return {'ETag': f'"{hashlib.md5(Body).hexdigest()}"'}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        return {'UploadId': f'upload-{Key}'}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        with self._lock:
+            self.parts[PartNumber] = Body
+        etag = hashlib.md5(Body if PartNumber != self.corrupt_part else b'corrupt').hexdigest()
+        return {'ETag': f'"{etag}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = MultipartUpload['Parts']
+        self.completed.append(parts)
+        numbers = [part['PartNumber'] for part in parts]
+        self.objects[Key] = b''.join(self.parts[number] for number in numbers)
+        digests = b''.join(hashlib.md5(self.parts[number]).digest() for number in numbers)
+        return {'ETag': f'"{hashlib.md5(digests).hexdigest()}-{len(numbers)}"'}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted.append(Key)
+
+    def head_object(self, Bucket, Key):
+        return {'ContentLength': len(self.objects[Key])}
+
+
+def upload(tmp_path, client, size, settings=None):
+    data = os.urandom(size)
+    file_path = tmp_path / 'sermon.mp3'
+    file_path.write_bytes(data)
+    engine = TransferEngine(client, 'bucket', settings or TransferSettings(part_size=5 * MB, part_concurrency=2))
+    try:
+        return data, engine.upload(file_path, 'audio/sermon.mp3')
+    finally:
+        engine.shutdown()
+
+
+def test_multipart_upload_completes_with_every_part(tmp_path):
+    client = StubS3Client()
+    data, result = upload(tmp_path, client, 12 * MB + 123)
+
+    assert result['success'], result['error']
+    assert client.aborted == []
+    assert [part['PartNumber'] for part in client.completed[0]] == [1, 2, 3]
+    assert client.objects['audio/sermon.mp3'] == data
+    assert result['etag'].endswith('-3')
+    assert result['sha256'] == hashlib.sha256(data).hexdigest()
+
+
+def test_multipart_upload_at_exactly_part_size(tmp_path):
+    client = StubS3Client()
+    data, result = upload(tmp_path, client, 5 * MB)
+
+    assert result['success'], result['error']
+    assert client.objects['audio/sermon.mp3'] == data
+
+
+def test_failed_part_aborts_the_upload(tmp_path):
+    client = StubS3Client(corrupt_part=2)
+    _, result = upload(tmp_path, client, 12 * MB)
+
+    assert not result['success']
+    assert 'Part 2' in result['error']
+    assert client.completed == []
+    assert client.aborted == ['audio/sermon.mp3']
+
+
+def test_small_file_is_a_single_put(tmp_path):
+    client = StubS3Client()
+    data, result = upload(tmp_path, client, 64 * 1024)
+
+    assert result['success'], result['error']
+    assert client.completed == []
+    assert client.objects['audio/sermon.mp3'] == data
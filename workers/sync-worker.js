@@ -81,9 +81,21 @@ async function fetchPostgresData(env) {
       WHERE type = 'audio'
       ORDER BY created_at DESC
     `,
+    // Span links (resource_span_link) are expanded back to per-verse rows for D1
     verse_resource_links: `
-      SELECT verse_id, resource_id, label, relevance
-      FROM verse_resource_link
+      SELECT DISTINCT ON (verse_id, resource_id) verse_id, resource_id, label, relevance
+      FROM (
+        SELECT verse_id, resource_id, label, relevance
+        FROM verse_resource_link
+        UNION ALL
+        SELECT v.id, s.resource_id, s.label, s.relevance
+        FROM resource_span_link s
+        JOIN books b ON b.book_order = s.start_ordinal / 1000000
+        JOIN verses v ON v.book_id = b.id
+        JOIN chapters c ON c.id = v.chapter_id
+        WHERE (b.book_order * 1000000 + c.chapter_number * 1000 + v.verse_number)
+              BETWEEN s.start_ordinal AND s.end_ordinal
+      ) links
     `,
     entities: `
       SELECT id, label, type, description, canonical_ref, meta